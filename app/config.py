@@ -1,3 +1,6 @@
+from typing import Optional
+
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -14,6 +17,169 @@ class Settings(BaseSettings):
     API_VERSION: str = "v1"
     CORS_ORIGINS: list = ["http://localhost:3000", "http://localhost:5173"]
     
+    # Result delivery (long-poll / SSE)
+    RESULT_WAIT_TIMEOUT_SECONDS: float = 25.0
+    RESULT_STREAM_MAX_SECONDS: float = 300.0
+    RESULT_STREAM_HEARTBEAT_SECONDS: float = 15.0
+    
+    # Idempotent intake submission
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_TTL_SECONDS: float = 86400.0
+    
+    # Admission control for Gemini-backed endpoints
+    ADMISSION_MAX_CONCURRENT_AI_CALLS: int = 8
+    ADMISSION_MAX_QUEUE: int = 64
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 10.0
+    RATE_LIMIT_DOCTOR_PER_MINUTE: float = 10.0
+    RATE_LIMIT_DOCTOR_BURST: int = 5
+    RATE_LIMIT_CLINIC_PER_MINUTE: float = 60.0
+    RATE_LIMIT_CLINIC_BURST: int = 20
+    DOCTOR_CLINICS: dict = {}  # doctor_id -> clinic_id
+    RATE_LIMIT_OVERRIDES: dict = {}  # "doctor:<id>" / "clinic:<id>" -> {"per_minute": .., "burst": ..}
+    
+    # Speculative AI pre-analysis: draft at intake, reused by /doctor/analyze (needs analysis_drafts)
+    AI_PREANALYSIS_ENABLED: bool = False
+    AI_PREANALYSIS_PER_MINUTE: float = 6.0  # Speculative Gemini calls, separate from tenant budgets
+    AI_PREANALYSIS_BURST: int = 3
+    AI_PREANALYSIS_RESERVED_SLOTS: int = 2  # Admission slots always left free for doctors' own calls
+    AI_PREANALYSIS_MAX_QUEUE: int = 1000  # Further intakes are not pre-analyzed
+    AI_PREANALYSIS_IDLE_POLL_SECONDS: float = 1.0  # How often a waiting draft rechecks for spare capacity
+    
+    # Data keys
+    KEY_EPOCH: int = 0  # Epoch new data keys are wrapped under
+    DATA_KEY_CACHE_SIZE: int = 1024
+    DATA_KEY_CACHE_TTL_SECONDS: float = 300.0
+    KEY_ROTATION_BATCH_SIZE: int = 500
+    KEY_ROTATION_CHECKPOINT_PATH: str = "data/key_rotation_checkpoint.json"
+    
+    # Worker pools (blocking DB calls, decrypt/validation)
+    DB_WORKER_THREADS: int = 16
+    CPU_WORKER_THREADS: int = 4
+    
+    # Cohort export
+    EXPORT_BATCH_SIZE: int = 1000
+    EXPORT_PSEUDONYM_KEY: Optional[str] = None  # Secret HMAC key (16+ chars) for subject_id; export is disabled without it
+    
+    # Population lab analytics snapshot
+    LAB_ANALYTICS_ENABLED: bool = False  # Decrypts every record at startup; enable in one process only
+    LAB_ANALYTICS_REFRESH_SECONDS: float = 300.0
+    LAB_ANALYTICS_MIN_REFRESH_GAP_SECONDS: float = 5.0
+    LAB_ANALYTICS_FULL_REBUILD_EVERY: int = 12
+    LAB_ANALYTICS_OVERLAP_SECONDS: float = 300.0  # Re-scan this far before the watermark for late commits
+    
+    # Blind index for searching encrypted records
+    BLIND_INDEX_KEY: str = Field(min_length=16)  # Secret HMAC key for search tokens; no default, or tokens can be brute-forced
+    BLIND_INDEX_TEXT_FIELDS: list = ["chief_complaint", "symptoms", "medical_history"]
+    BLIND_INDEX_SEARCH_LIMIT: int = 200
+    
+    # Compress-then-encrypt for stored payloads (opt-in; compressed rows are always readable)
+    COMPRESSION_ENABLED: bool = False
+    COMPRESSION_MIN_BYTES: int = 256  # Smaller payloads are stored uncompressed
+    COMPRESSION_LEVEL: int = 3
+    COMPRESSION_DICTIONARY_DIR: str = "data/zstd_dicts"
+    
+    # Write-behind batching of intake inserts (opt-in)
+    DB_WRITE_COALESCING_ENABLED: bool = False
+    DB_WRITE_COALESCE_WINDOW_MS: float = 5.0  # Flush this long after a batch's first row...
+    DB_WRITE_COALESCE_MAX_ROWS: int = 50  # ...or as soon as it has this many rows
+    
+    # PHI access audit log (hash-chained, flushed in the background)
+    AUDIT_ENABLED: bool = True
+    AUDIT_SINK: str = "file"  # "file" (segment files in AUDIT_DIR) or "db" (audit_log table)
+    AUDIT_DIR: str = "data/audit"
+    AUDIT_SEGMENT_MAX_BYTES: int = 64 * 1024 * 1024
+    AUDIT_FSYNC: bool = True
+    AUDIT_RING_CAPACITY: int = 10000
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL_SECONDS: float = 1.0
+    AUDIT_ON_FULL: str = "block"  # "block" (wait for the flusher) or "drop" (count and continue)
+    
+    # Conditional GET (ETag / If-None-Match) on record and result reads
+    ETAG_INDEX_TTL_SECONDS: float = 86400.0
+    PHI_CACHE_CONTROL: str = "private, no-cache"  # Browser may keep a copy but must revalidate; never shared caches
+    
+    # Tiered archival of completed consultations
+    ARCHIVE_ENABLED: bool = False  # Run the job in this process; enable in one process only, or use the script
+    ARCHIVE_AFTER_DAYS: float = 365.0  # Archive completed consultations older than this
+    ARCHIVE_STORE: str = "file"  # "file" (segments in ARCHIVE_DIR) or "db" (archive_segments/archive_blocks)
+    ARCHIVE_DIR: str = "data/archive"
+    ARCHIVE_BATCH_SIZE: int = 1000  # Consultations per segment
+    ARCHIVE_BLOCK_SIZE: int = 64  # Entries per compressed block (sparse index granularity)
+    ARCHIVE_COMPRESSION_LEVEL: int = 9
+    ARCHIVE_INTERVAL_SECONDS: float = 3600.0
+    ARCHIVE_INDEX_REFRESH_SECONDS: float = 60.0  # Reload segment footers on a miss at most this often
+    ARCHIVE_PURGE_GRACE_SECONDS: float = 600.0  # Keep hot rows this long after archiving; > the refresh interval
+    
+    # On-demand profiling (admin-only; see POST /ops/profiling)
+    OPS_ADMIN_TOKEN: str = ""  # X-Admin-Token for admin ops endpoints; empty disables them
+    PROFILING_ENABLED: bool = False  # Profile from startup in every worker, with the settings below
+    PROFILING_SAMPLE_RATE: float = 0.01
+    PROFILING_ROUTES: list = []  # Path substrings, e.g. ["/doctor/analyze"]; empty = every route
+    PROFILING_INTERVAL_MS: float = 5.0
+    PROFILING_MEMORY: bool = False  # tracemalloc allocation diffs per stage (adds noticeable overhead)
+    PROFILING_TRACEBACK_DEPTH: int = 25
+    PROFILING_MAX_PROFILES: int = 200  # Switch off after this many profiled requests
+    PROFILING_OUTPUT_DIR: str = "data/profiles"
+    
+    # Multi-process serving (python -m app.server)
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 0  # 0 = one worker per CPU core
+    WORKER_PROCESSES: int = 1  # Set by the launcher; per-process limits are divided by it
+    SHARED_CACHE_NAME: str = ""  # Set by the launcher; empty = in-process cache
+    SHARED_CACHE_SLOTS: int = 8192
+    SHARED_CACHE_SLOT_BYTES: int = 8192
+    SHARED_CACHE_RING_ENTRIES: int = 4096  # Cross-worker "result ready" messages kept for slow readers
+    DOCTOR_DIRECTORY_TTL_SECONDS: float = 600.0
+    RESULT_CACHE_TTL_SECONDS: float = 3600.0
+    SHARED_RESULT_POLL_SECONDS: float = 0.5  # How often each worker reads new "result ready" messages
+    
+    # Gemini circuit breaker and rule-based fallback
+    AI_CALL_TIMEOUT_SECONDS: float = 45.0
+    AI_FALLBACK_ON_ERROR: bool = False  # Opt-in: also serve the fallback when a single call fails, not only when open
+    AI_BREAKER_WINDOW_SIZE: int = 20
+    AI_BREAKER_MIN_CALLS: int = 5
+    AI_BREAKER_FAILURE_RATE: float = 0.5
+    AI_BREAKER_SLOW_CALL_SECONDS: float = 20.0
+    AI_BREAKER_SLOW_CALL_RATE: float = 0.5
+    AI_BREAKER_OPEN_SECONDS: float = 30.0
+    AI_BREAKER_HALF_OPEN_PROBES: int = 2
+    
+    # Gemini hedging and retries
+    AI_ATTEMPT_TIMEOUT_SECONDS: float = 20.0
+    AI_HEDGING_ENABLED: bool = True
+    AI_HEDGE_PERCENTILE: float = 95.0  # Hedge once an attempt is slower than this percentile
+    AI_HEDGE_MIN_DELAY_SECONDS: float = 2.0
+    AI_HEDGE_MAX_DELAY_SECONDS: float = 15.0  # Also used until enough samples exist
+    AI_HEDGE_MIN_SAMPLES: int = 20
+    AI_LATENCY_WINDOW_SIZE: int = 200
+    AI_MAX_RETRIES: int = 2
+    AI_RETRY_BACKOFF_BASE_SECONDS: float = 0.5
+    AI_RETRY_BACKOFF_MAX_SECONDS: float = 4.0
+    AI_RETRY_BUDGET_RATIO: float = 0.1  # Hedges + retries per request, long-run
+    AI_RETRY_BUDGET_MIN_PER_SECOND: float = 0.1
+    AI_RETRY_BUDGET_MAX_TOKENS: float = 10.0
+    
+    # Gemini structured output
+    AI_STRUCTURED_OUTPUT: bool = True  # response_schema + JSON MIME type; False = legacy prose prompt
+    AI_MAX_OUTPUT_TOKENS_MIN: int = 2048
+    AI_MAX_OUTPUT_TOKENS_MAX: int = 8192
+    AI_OUTPUT_TOKENS_PERCENTILE: float = 99.0  # Limit = this percentile of recent outputs x headroom
+    AI_OUTPUT_TOKENS_HEADROOM: float = 1.5
+    AI_OUTPUT_TOKENS_WINDOW_SIZE: int = 200
+    AI_OUTPUT_TOKENS_FLOOR_DECAY_RESPONSES: int = 50  # Untruncated responses before a raised limit falls back
+    
+    # Gemini backend: "gemini" (live API), "record" (live + save fixtures) or "replay" (offline)
+    AI_BACKEND: str = "gemini"
+    AI_FIXTURE_DIR: str = "fixtures/gemini"
+    AI_REPLAY_LATENCY_PROFILE: str = "typical"  # instant, fast, typical, slow, heavy_tail or recorded
+    AI_REPLAY_LATENCY_SCALE: float = 1.0  # Multiplies every replayed delay
+    AI_REPLAY_ERROR_RATE: float = 0.0
+    AI_REPLAY_ERROR_KIND: str = "unavailable"  # unavailable, deadline, internal or quota
+    AI_REPLAY_STRICT: bool = False  # Unrecorded prompt -> NotFound instead of a stand-in fixture
+    AI_REPLAY_MAX_CONCURRENCY: int = 0  # Simulated model capacity; 0 = unlimited
+    AI_REPLAY_SEED: Optional[int] = None
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -1,8 +1,19 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
-from app.routers import patient, doctor
+from app.routers import patient, doctor, ops, analytics
 from app.database import get_db
+from app.services.archival import archival_job
+from app.services.audit_log import audit_log
+from app.services.executor import shutdown_executors
+from app.services.lab_analytics import lab_analytics
+from app.services.preanalysis import preanalysis
+from app.services.profiler import ProfilingMiddleware, profiler
+from app.services.result_hub import result_hub
+from app.services.shared_cache import shared_cache
+from app.services.warmup import warm_up_worker
+from app.services.write_coalescer import write_coalescer
+import asyncio
 import logging
 
 # Configure logging
@@ -30,9 +41,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Selects requests for on-demand profiling; a pass-through while it is off
+app.add_middleware(ProfilingMiddleware)
+
 # Include routers
 app.include_router(patient.router, prefix=f"/api/{settings.API_VERSION}")
 app.include_router(doctor.router, prefix=f"/api/{settings.API_VERSION}")
+app.include_router(analytics.router, prefix=f"/api/{settings.API_VERSION}")
+app.include_router(ops.router, prefix=f"/api/{settings.API_VERSION}")
 
 
 @app.get("/")
@@ -90,15 +106,57 @@ async def startup_event():
         logger.info("✅ Database connection successful")
     except Exception as e:
         logger.error(f"❌ Database connection failed: {e}")
+    
+    await warm_up_worker()
+    
+    if shared_cache.shared:
+        app.state.shared_result_watch = asyncio.create_task(
+            result_hub.watch_shared(shared_cache, settings.SHARED_RESULT_POLL_SECONDS)
+        )
+    
+    if settings.LAB_ANALYTICS_ENABLED:
+        lab_analytics.start()
+    
+    if settings.AUDIT_ENABLED:
+        audit_log.start()
+    
+    if settings.ARCHIVE_ENABLED:
+        archival_job.start()
+    
+    if settings.AI_PREANALYSIS_ENABLED:
+        preanalysis.start()
+    
+    if settings.PROFILING_ENABLED:
+        profiler.enable(
+            settings.PROFILING_SAMPLE_RATE,
+            routes=settings.PROFILING_ROUTES,
+            interval_ms=settings.PROFILING_INTERVAL_MS,
+            memory=settings.PROFILING_MEMORY,
+            max_profiles=settings.PROFILING_MAX_PROFILES,
+        )
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Run on application shutdown"""
     logger.info("Shutting down Quantum Safe Patient Analytics API...")
+    await lab_analytics.stop()
+    await archival_job.stop()
+    await preanalysis.stop()
+    watch = getattr(app.state, "shared_result_watch", None)
+    if watch:
+        watch.cancel()
+    # Commit any coalesced inserts before the DB thread pool goes away
+    await write_coalescer.drain()
+    await audit_log.stop()
+    if profiler.enabled:
+        profiler.disable(wait=True)
+    shutdown_executors()
+    shared_cache.detach()
 
 
 if __name__ == "__main__":
+    # Single-process dev server; use `python -m app.server` for production
     import uvicorn
     uvicorn.run(
         "app.main:app",
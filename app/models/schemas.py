@@ -2,7 +2,7 @@
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from uuid import UUID
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 
 # ============================================================================
@@ -44,6 +44,58 @@ class LabResults(BaseModel):
     test_notes: Optional[str] = None
 
 
+class RawIntakeSubmission(BaseModel):
+    """
+    Raw (unencrypted) intake submission, fully typed.
+    List-like fields are normalised once here to List[str], so stored
+    payloads are canonical and never need re-normalising on read.
+    """
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+    
+    # Intake
+    age: int = Field(..., ge=0, le=130)
+    gender: str
+    chief_complaint: str
+    symptoms: str
+    symptom_duration: Optional[str] = None
+    duration: Optional[str] = None
+    medical_history: List[str] = []
+    current_medications: List[str] = []
+    allergies: List[str] = []
+    
+    # Labs
+    fasting_glucose: Optional[float] = Field(None, ge=0)
+    hba1c: Optional[float] = Field(None, ge=0, le=25)
+    blood_pressure_systolic: Optional[int] = Field(None, ge=0, le=350)
+    blood_pressure_diastolic: Optional[int] = Field(None, ge=0, le=250)
+    bmi: Optional[float] = Field(None, ge=0, le=150)
+    cholesterol_total: Optional[float] = Field(None, ge=0)
+    cholesterol_ldl: Optional[float] = Field(None, ge=0)
+    cholesterol_hdl: Optional[float] = Field(None, ge=0)
+    triglycerides: Optional[float] = Field(None, ge=0)
+    test_notes: Optional[str] = None
+    
+    @field_validator("medical_history", "current_medications", "allergies", mode="before")
+    @classmethod
+    def _split_list(cls, value):
+        """Accept a list or a comma-separated string (as the web form sends)"""
+        if value is None:
+            return []
+        if isinstance(value, str):
+            value = value.split(",")
+        return [str(item).strip() for item in value if str(item).strip()]
+    
+    def intake_payload(self) -> Dict[str, Any]:
+        """Canonical intake dict, as stored (encrypted)"""
+        payload = self.model_dump(include=set(PatientIntakeData.model_fields))
+        payload["symptom_duration"] = self.symptom_duration or self.duration
+        return payload
+    
+    def lab_payload(self) -> Dict[str, Any]:
+        """Canonical lab dict, as stored (encrypted)"""
+        return self.model_dump(include=set(LabResults.model_fields))
+
+
 class EncryptedPatientData(BaseModel):
     """Encrypted patient submission"""
     encrypted_intake: Any  # Allow any type
@@ -77,6 +129,29 @@ class AppointmentListItem(BaseModel):
     has_result: bool = False
 
 
+class TriageSummary(BaseModel):
+    """Decrypted at-a-glance view of one appointment for the dashboard list"""
+    age: int
+    gender: str
+    chief_complaint: str
+    symptom_duration: Optional[str] = None
+    lab_flags: List[str] = []  # Lab thresholds crossed (same rules as the fallback analyzer)
+
+
+class DashboardAppointment(AppointmentListItem):
+    """Dashboard row: appointment, result flag and triage summary"""
+    triage: Optional[TriageSummary] = None  # None if the record is missing or cannot be decrypted
+
+
+class DoctorDashboard(BaseModel):
+    """One page of the doctor dashboard"""
+    appointments: List[DashboardAppointment]
+    status_counts: Dict[str, int]
+    total: int
+    limit: int
+    offset: int
+
+
 class DecryptedPatientRecord(BaseModel):
     """Decrypted patient record for doctor view"""
     appointment_id: UUID
@@ -103,15 +178,31 @@ class DoctorAnalysisRequest(BaseModel):
 # AI Analysis Models
 # ============================================================================
 
+class DiseaseProbability(BaseModel):
+    """One condition the AI considers likely, with its supporting evidence"""
+    disease: str
+    probability: str = Field(..., description="low, moderate or high")
+    confidence: str = Field(..., description="Confidence as a percentage, e.g. 90%")
+    key_indicators: List[str] = []
+    explanation: str = Field("", description="1-2 sentences")
+
+
 class AIAnalysisResult(BaseModel):
     """AI analysis result structure"""
-    risk_score: float = Field(..., ge=0, le=10)
+    risk_score: float = Field(..., ge=0, le=10, description="Overall risk from 0 (none) to 10 (critical)")
     primary_concerns: List[str]
     differential_diagnoses: List[str]
     recommended_tests: List[str]
-    clinical_summary: str
+    clinical_summary: str = Field(..., description="2-3 sentence summary")
     treatment_recommendations: List[str]
     follow_up_timeline: str
+    overall_health_status: Optional[str] = Field(None, description="excellent, good, fair, concerning or critical")
+    disease_probabilities: List[DiseaseProbability] = []
+    lifestyle_recommendations: List[str] = []
+    urgent_actions_needed: List[str] = []
+    patient_friendly_summary: str = Field("", description="Plain-language explanation for the patient")
+    is_fallback: bool = False  # True when produced by the local rule-based analyzer
+    analysis_source: str = "gemini"
 
 
 # ============================================================================
@@ -137,3 +228,17 @@ class PatientResultResponse(BaseModel):
     doctor_name: Optional[str] = None
     doctor_notes: Optional[str] = None
     ai_analysis: Optional[Dict[str, Any]] = None
+
+
+# ============================================================================
+# Operations Models
+# ============================================================================
+
+class ProfilingRequest(BaseModel):
+    """Runtime profiling switch for POST /ops/profiling"""
+    sample_rate: float = Field(0.01, gt=0, le=1, description="Fraction of matching requests to profile")
+    routes: List[str] = Field([], description="Path substrings, e.g. /doctor/analyze; empty = every route")
+    interval_ms: float = Field(5.0, ge=1, le=1000, description="Stack sampling interval")
+    memory: bool = Field(False, description="Also record tracemalloc allocation diffs per stage")
+    max_profiles: int = Field(200, ge=1, description="Switch off after this many profiled requests")
+    duration_seconds: Optional[float] = Field(None, gt=0, description="Switch off after this long")
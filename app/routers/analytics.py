@@ -0,0 +1,117 @@
+"""Population analytics endpoints (aggregates only, no per-patient data)"""
+from datetime import datetime
+import logging
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app.routers.ops import require_admin
+from app.services.lab_analytics import lab_analytics
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+
+def _filters(
+    doctor_id: Optional[str],
+    clinic_id: Optional[str],
+    start: Optional[datetime],
+    end: Optional[datetime],
+) -> dict:
+    return {"doctor_id": doctor_id, "clinic_id": clinic_id, "start": start, "end": end}
+
+
+@router.get("/labs")
+async def get_lab_snapshot_info():
+    """Snapshot size, freshness and the fields/categories that can be queried"""
+    return lab_analytics.info()
+
+
+@router.post("/labs/refresh", dependencies=[Depends(require_admin)])
+async def refresh_lab_snapshot(full: bool = False):
+    """Refresh the snapshot now (incremental unless `full=true`); admin only"""
+    try:
+        return await lab_analytics.refresh(full=full)
+    except Exception as e:
+        logger.error(f"Error refreshing lab snapshot: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/labs/{field}/summary")
+async def get_lab_summary(
+    field: str,
+    percentiles: List[float] = Query([5, 25, 50, 75, 95]),
+    doctor_id: Optional[str] = None,
+    clinic_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """Count, mean, spread and percentiles of a lab field"""
+    try:
+        return lab_analytics.summary(field, percentiles, **_filters(doctor_id, clinic_id, start, end))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/labs/{field}/histogram")
+async def get_lab_histogram(
+    field: str,
+    bins: int = Query(20, ge=1, le=500),
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+    doctor_id: Optional[str] = None,
+    clinic_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """Distribution of a lab field (e.g. HbA1c) as a fixed-width histogram"""
+    value_range = None
+    if min_value is not None and max_value is not None:
+        value_range = (min_value, max_value)
+    try:
+        return lab_analytics.histogram(field, bins, value_range, **_filters(doctor_id, clinic_id, start, end))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/labs/{field}/timeseries")
+async def get_lab_timeseries(
+    field: str,
+    bucket: str = Query("month", pattern="^(day|week|month|year)$"),
+    doctor_id: Optional[str] = None,
+    clinic_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """Per-period count and mean of a lab field"""
+    try:
+        return lab_analytics.timeseries(field, bucket, **_filters(doctor_id, clinic_id, start, end))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/threshold")
+async def get_threshold_share(
+    category: Optional[str] = Query(None, description="Named category, e.g. stage2_hypertension"),
+    field: Optional[str] = None,
+    op: Optional[str] = Query(None, pattern="^(gt|gte|lt|lte|eq)$"),
+    value: Optional[float] = None,
+    doctor_id: Optional[str] = None,
+    clinic_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """
+    Count and share of patients meeting a clinical category or an
+    ad-hoc threshold such as `field=hba1c&op=gt&value=9`.
+    """
+    try:
+        return lab_analytics.threshold(
+            lab_field=field,
+            op=op,
+            value=value,
+            category=category,
+            **_filters(doctor_id, clinic_id, start, end),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,18 +1,43 @@
 """Doctor-facing API endpoints"""
 from datetime import datetime
+import asyncio
 import logging
+from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 
+from app.config import settings
 from app.models.schemas import (
     AppointmentListItem,
+    DashboardAppointment,
     DecryptedPatientRecord,
     DoctorAnalysisRequest,
+    DoctorDashboard,
+    TriageSummary,
+)
+from app.routers.ops import require_admin
+from app.services.audit_log import audit_log
+from app.services.blind_index import RangePredicate, blind_indexer, text_matches
+from app.services.cohort_export import (
+    count_archived_excluded,
+    require_pseudonym_key,
+    require_pyarrow,
+    resolve_fields,
+    stream_ndjson,
+    stream_parquet,
 )
 from app.services.crypto_mock import crypto_service
 from app.services.db_service import db_service
+from app.services.etags import cache_headers, version_index
 from app.services.ai_service import analyze_patient_data
+from app.services.executor import run_cpu_bound
+from app.services.fallback_analyzer import RULES, lab_findings
+from app.services.preanalysis import preanalysis
+from app.services.profiler import profiler
+from app.services.rate_limiter import RateLimitExceeded, admission_controller
+from app.services.records import decrypt_patient_data, decrypt_patient_models
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/doctor", tags=["Doctor"])
@@ -34,11 +59,91 @@ async def get_appointments(doctor_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _triage_summary(encrypted_record: dict) -> TriageSummary:
+    """Decrypt a record into the short summary shown on the dashboard"""
+    intake_model, lab_model = await decrypt_patient_models(encrypted_record)
+    return TriageSummary(
+        age=intake_model.age,
+        gender=intake_model.gender,
+        chief_complaint=intake_model.chief_complaint,
+        symptom_duration=intake_model.get_duration,
+        lab_flags=[RULES[category][1] for category in lab_findings(lab_model)],
+    )
+
+
+@router.get("/dashboard", response_model=DoctorDashboard)
+async def get_dashboard(
+    doctor_id: UUID,
+    limit: int = Query(25, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    status: Optional[str] = None,
+):
+    """
+    Everything the dashboard list needs in one round trip: a page of
+    appointments with result flags and decrypted triage summaries, plus
+    per-status counts. Replaces calling /record/{id} for every row.
+    """
+    try:
+        (rows, total), status_counts = await asyncio.gather(
+            db_service.list_doctor_dashboard_page(doctor_id, limit, offset, status),
+            db_service.count_doctor_appointments_by_status(doctor_id),
+        )
+        
+        # Decrypt every row's record concurrently on the CPU pool
+        triage = await asyncio.gather(
+            *(_triage_summary(row["encrypted_record"]) for row in rows if row["encrypted_record"]),
+            return_exceptions=True,
+        )
+        triage_by_id = dict(zip(
+            (row["appointment_id"] for row in rows if row["encrypted_record"]),
+            triage,
+        ))
+        
+        appointments = []
+        for row in rows:
+            summary = triage_by_id.get(row["appointment_id"])
+            if isinstance(summary, Exception):
+                logger.warning(f"Dashboard: could not decrypt appointment {row['appointment_id']}: {summary}")
+                summary = None
+            appointments.append(DashboardAppointment(
+                appointment_id=row["appointment_id"],
+                patient_id=row["patient_id"],
+                appointment_time=row["appointment_time"],
+                status=row["status"],
+                has_result=row["has_result"],
+                triage=summary,
+            ))
+        
+        await audit_log.record(
+            "doctor.dashboard.read",
+            [row["appointment_id"] for row in rows if row["encrypted_record"]],
+            actor=doctor_id,
+        )
+        logger.info(f"Dashboard for doctor {doctor_id}: {len(appointments)} of {total} appointments")
+        
+        return DoctorDashboard(
+            appointments=appointments,
+            status_counts=status_counts,
+            total=total,
+            limit=limit,
+            offset=offset,
+        )
+        
+    except Exception as e:
+        logger.error(f"Error loading dashboard: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/record/{appointment_id}")
-async def get_patient_record(appointment_id: str):
+async def get_patient_record(
+    appointment_id: str,
+    http_response: Response,
+    doctor_id: Optional[UUID] = None,
+    if_none_match: Optional[str] = Header(None),
+):
     """
     Get decrypted patient record for doctor to review.
-    Returns intake data and lab results in plaintext.
+    Returns intake data and lab results in plaintext (supports If-None-Match).
     """
     try:
         logger.info(f"Doctor requesting record for appointment {appointment_id}")
@@ -46,31 +151,27 @@ async def get_patient_record(appointment_id: str):
         # Convert to UUID
         apt_id = UUID(appointment_id)
         
-        # Get encrypted record
-        encrypted_record = await db_service.get_encrypted_record(apt_id)
-        
-        # Get appointment details
-        appointment = await db_service.get_appointment(apt_id)
-        
-        # Decrypt the outer layer
-        decrypted_outer = crypto_service.decrypt(
-            encrypted_record["encrypted_blob"],
-            encrypted_record["wrapped_key"]
-        )
+        # A current ETag is answered from the version index, without decrypting
+        not_modified = await version_index.check_record(apt_id, if_none_match)
+        if not_modified is not None:
+            await audit_log.record("doctor.record.read", [apt_id], actor=doctor_id, outcome="not_modified")
+            return not_modified
         
-        # Decrypt the inner layers
-        intake_data = crypto_service.decrypt(
-            decrypted_outer["encrypted_intake"],
-            encrypted_record["wrapped_key"]
+        # Fetch the record and appointment concurrently
+        encrypted_record, appointment = await asyncio.gather(
+            db_service.get_encrypted_record(apt_id),
+            db_service.get_appointment(apt_id),
         )
         
-        lab_results = crypto_service.decrypt(
-            decrypted_outer["encrypted_lab_results"],
-            encrypted_record["wrapped_key"]
-        )
+        intake_data, lab_results = await decrypt_patient_data(encrypted_record)
+        await audit_log.record("doctor.record.read", [apt_id], actor=doctor_id)
         
         logger.info("Successfully decrypted patient record")
         
+        http_response.headers.update(cache_headers(version_index.remember_record(
+            apt_id, encrypted_record["record_id"], appointment["status"]
+        )))
+        
         # Return decrypted data - let Pydantic handle conversion
         return {
             "appointment_id": str(apt_id),
@@ -102,34 +203,27 @@ async def analyze_and_approve(request: DoctorAnalysisRequest):
         # Get encrypted record
         encrypted_record = await db_service.get_encrypted_record(apt_id)
         
-        # Decrypt to get patient data
-        decrypted_outer = crypto_service.decrypt(
-            encrypted_record["encrypted_blob"],
-            encrypted_record["wrapped_key"]
-        )
-        
-        intake_data = crypto_service.decrypt(
-            decrypted_outer["encrypted_intake"],
-            encrypted_record["wrapped_key"]
-        )
-        
-        lab_results = crypto_service.decrypt(
-            decrypted_outer["encrypted_lab_results"],
-            encrypted_record["wrapped_key"]
-        )
-        
         # Run AI analysis if requested
         ai_analysis = None
         if request.request_ai_analysis:
-            logger.info("Running AI analysis...")
+            # A draft precomputed at intake time, if the record has not changed since
+            ai_analysis = await preanalysis.take(apt_id, encrypted_record)
+            if ai_analysis is not None:
+                await audit_log.record("doctor.analysis.run", [apt_id], actor=request.doctor_id, draft=True)
+                logger.info(f"Using precomputed AI analysis. Risk score: {ai_analysis.get('risk_score')}")
+        
+        if request.request_ai_analysis and ai_analysis is None:
+            # Only a live Gemini call spends the tenant's budget; shed before any decryption
+            admission_controller.check_rate(request.doctor_id)
             
-            from app.models.schemas import PatientIntakeData, LabResults
+            logger.info("Running AI analysis...")
             
-            # Convert to Pydantic models for AI
-            intake_model = PatientIntakeData(**intake_data)
-            lab_model = LabResults(**lab_results)
+            # Decrypt straight into Pydantic models for AI (off the event loop)
+            intake_model, lab_model = await decrypt_patient_models(encrypted_record)
+            await audit_log.record("doctor.analysis.run", [apt_id], actor=request.doctor_id)
             
-            ai_result = await analyze_patient_data(intake_model, lab_model)
+            async with admission_controller.slot():
+                ai_result = await analyze_patient_data(intake_model, lab_model)
             ai_analysis = ai_result.dict()
             
             logger.info(f"AI analysis complete. Risk score: {ai_analysis.get('risk_score')}")
@@ -143,7 +237,8 @@ async def analyze_and_approve(request: DoctorAnalysisRequest):
         }
         
         # Encrypt the result for patient
-        encrypted_result, wrapped_key = crypto_service.encrypt(result_data)
+        with profiler.stage("crypto"):
+            encrypted_result, wrapped_key = await run_cpu_bound(crypto_service.encrypt, result_data)
         
         # Store consultation result
         await db_service.store_consultation_result(
@@ -153,6 +248,11 @@ async def analyze_and_approve(request: DoctorAnalysisRequest):
             doctor_id=UUID(str(request.doctor_id))
         )
         
+        await preanalysis.discard(apt_id)
+        
+        await audit_log.record(
+            "doctor.result.approve", [apt_id], actor=request.doctor_id, ai_analysis=ai_analysis is not None
+        )
         logger.info(f"Consultation result stored for appointment {apt_id}")
         
         return {
@@ -161,8 +261,149 @@ async def analyze_and_approve(request: DoctorAnalysisRequest):
             "ai_analysis": ai_analysis  # Return to doctor for display
         }
         
+    except RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": e.retry_after_header},
+        )
     except Exception as e:
         logger.error(f"Error in analysis: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/export/cohort", dependencies=[Depends(require_admin)])
+async def export_cohort(
+    format: str = Query("ndjson", pattern="^(ndjson|parquet)$"),
+    fields: Optional[str] = Query(None, description="Comma-separated field names"),
+    doctor_id: Optional[UUID] = None,
+    after: Optional[str] = Query(None, description="Resume after this checkpoint cursor"),
+):
+    """
+    Stream a de-identified cohort extract as NDJSON or Parquet.
+    NDJSON emits a `{"_checkpoint": ...}` line after every page; pass the
+    last one back as `after` to resume an interrupted export.
+    Admin-only (X-Admin-Token), and disabled until EXPORT_PSEUDONYM_KEY is set.
+    """
+    try:
+        require_pseudonym_key()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    try:
+        selected = resolve_fields(fields.split(",") if fields else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    logger.info(f"Starting {format} cohort export with fields {selected}")
+    # De-identified, but still a bulk read of every matching record
+    await audit_log.record(
+        "doctor.cohort.export", format=format, fields=selected, doctor_filter=doctor_id, after=after
+    )
+    
+    # Archived consultations whose hot rows are purged are not in the export
+    archived_excluded = await count_archived_excluded(doctor_id)
+    headers = {"X-Archived-Records-Excluded": str(archived_excluded)}
+    
+    options = {"after": after, "doctor_id": doctor_id}
+    if format == "parquet":
+        try:
+            require_pyarrow()
+        except RuntimeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        return StreamingResponse(
+            stream_parquet(selected, archived_excluded=archived_excluded, **options),
+            media_type="application/vnd.apache.parquet",
+            headers={**headers, "Content-Disposition": 'attachment; filename="cohort.parquet"'},
+        )
+    
+    return StreamingResponse(
+        stream_ndjson(selected, **options),
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
+
+
+@router.get("/search")
+async def search_records(
+    text: Optional[str] = Query(None, description="Words/phrase to find, e.g. 'chest pain'"),
+    text_field: str = Query("any", description="Restrict text match to one indexed field"),
+    lab: List[str] = Query([], description="Lab range, e.g. 'hba1c>9' (repeatable)"),
+    doctor_id: Optional[UUID] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    """
+    Search encrypted records via the blind index.
+    Only index candidates are decrypted; each is re-checked exactly before
+    it is returned.
+    """
+    try:
+        predicates = [RangePredicate.parse(expression) for expression in lab]
+        required = blind_indexer.text_query_tokens(text, text_field) if text else []
+        any_of = [blind_indexer.range_query_tokens(predicate) for predicate in predicates]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not required and not any_of:
+        raise HTTPException(status_code=400, detail="Provide text and/or at least one lab range")
+    
+    try:
+        candidates, archived_excluded = await asyncio.gather(
+            db_service.search_encrypted_records(
+                required_tokens=required,
+                any_of_token_sets=any_of,
+                limit=settings.BLIND_INDEX_SEARCH_LIMIT,
+                doctor_id=doctor_id,
+            ),
+            # Archived consultations whose hot rows are purged cannot match
+            db_service.count_purged_archived_consultations(doctor_id),
+        )
+        
+        decrypted = await asyncio.gather(
+            *(decrypt_patient_data(record) for record in candidates),
+            return_exceptions=True,
+        )
+        
+        matches = []
+        for record, result in zip(candidates, decrypted):
+            if isinstance(result, Exception):
+                logger.warning(f"Skipping search candidate {record.get('record_id')}: {result}")
+                continue
+            intake_data, lab_results = result
+            if text and not text_matches(intake_data, text, text_field, blind_indexer.text_fields):
+                continue
+            if not all(predicate.matches(lab_results.get(predicate.field)) for predicate in predicates):
+                continue
+            
+            appointment = record.get("appointments") or {}
+            matches.append({
+                "appointment_id": record["appointment_id"],
+                "appointment_time": appointment.get("appointment_time"),
+                "status": appointment.get("status"),
+                "chief_complaint": intake_data.get("chief_complaint"),
+                "labs": {predicate.field: lab_results.get(predicate.field) for predicate in predicates},
+            })
+            if len(matches) >= limit:
+                break
+        
+        await audit_log.record(
+            "doctor.search",
+            [record["appointment_id"] for record in candidates],
+            actor=doctor_id,
+            matches=len(matches),
+        )
+        logger.info(f"Blind-index search: {len(candidates)} candidates, {len(matches)} matches")
+        
+        return {
+            "candidates": len(candidates),
+            "truncated": len(candidates) >= settings.BLIND_INDEX_SEARCH_LIMIT,
+            "archived_excluded": archived_excluded,
+            "matches": matches,
+        }
+        
+    except Exception as e:
+        logger.error(f"Error searching records: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
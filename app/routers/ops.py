@@ -0,0 +1,142 @@
+"""Operational endpoints for capacity planning and diagnostics"""
+import hmac
+import logging
+import os
+import re
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+
+from app.config import settings
+from app.models.schemas import ProfilingRequest
+from app.services.ai_service import gemini_breaker, gemini_output, gemini_requester
+from app.services.archival import archival_job
+from app.services.audit_log import audit_log
+from app.services.gemini_standin import gemini_standin
+from app.services.preanalysis import preanalysis
+from app.services.profiler import profiler
+from app.services.rate_limiter import admission_controller
+from app.services.shared_cache import shared_cache
+from app.services.write_coalescer import write_coalescer
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/ops", tags=["Operations"])
+
+PROFILE_FILE_PATTERN = re.compile(r"^[\w.-]+\.folded$")
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin-only endpoints need X-Admin-Token to match OPS_ADMIN_TOKEN"""
+    if not settings.OPS_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (OPS_ADMIN_TOKEN is not set)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.OPS_ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@router.get("/admission")
+async def get_admission_state(tenant_id: Optional[str] = None):
+    """
+    Live admission-control state: concurrency budget, queue depth and
+    token-bucket levels (optionally filtered to one doctor or clinic ID).
+    """
+    return admission_controller.snapshot(tenant_id)
+
+
+@router.get("/ai-circuit")
+async def get_ai_circuit_state():
+    """Gemini circuit breaker state, recent failure/slow-call rates and counters"""
+    return gemini_breaker.snapshot()
+
+
+@router.get("/ai-requests")
+async def get_ai_request_metrics():
+    """Gemini hedging/retry metrics: hedge rate and wins, retries, latency percentiles, budget"""
+    return gemini_requester.snapshot()
+
+
+@router.get("/ai-output")
+async def get_ai_output_metrics():
+    """Gemini output metrics: parse-failure and truncation rates, current max_output_tokens"""
+    return {"structured_output": settings.AI_STRUCTURED_OUTPUT, **gemini_output.snapshot()}
+
+
+@router.get("/ai-backend")
+async def get_ai_backend():
+    """Which Gemini backend is in use; in replay mode, the stand-in's profile and counters"""
+    if settings.AI_BACKEND != "replay":
+        return {"backend": settings.AI_BACKEND, "fixture_dir": settings.AI_FIXTURE_DIR}
+    return gemini_standin.snapshot()
+
+
+@router.get("/preanalysis")
+async def get_preanalysis_state():
+    """Speculative AI drafts: queue depth, budget, drafts stored and how many analyze calls they served"""
+    return preanalysis.snapshot()
+
+
+@router.get("/db-writes")
+async def get_db_write_metrics():
+    """Write coalescer metrics: batch sizes, flush latency percentiles, per-row retries"""
+    return {"enabled": settings.DB_WRITE_COALESCING_ENABLED, **write_coalescer.snapshot()}
+
+
+@router.get("/audit")
+async def get_audit_state():
+    """Audit log back-pressure: queue depth, high-water mark, blocked/dropped events, flush errors, chain head"""
+    return audit_log.snapshot()
+
+
+@router.get("/archive")
+async def get_archive_state():
+    """Cold archive: segments, entries, compressed size, lookups/hits and the last archival run"""
+    return {
+        "enabled": settings.ARCHIVE_ENABLED,
+        "last_run": archival_job.last_run,
+        **archival_job.archive.snapshot(),
+    }
+
+
+@router.get("/profiling", dependencies=[Depends(require_admin)])
+async def get_profiling_state():
+    """This worker's profiler settings and its most recent profiles (per-stage samples and bytes)"""
+    return profiler.snapshot()
+
+
+@router.post("/profiling", dependencies=[Depends(require_admin)])
+async def start_profiling(request: ProfilingRequest):
+    """
+    Profile a fraction of requests (optionally only matching routes) on the
+    worker that serves this call. Writes collapsed-stack files for flamegraphs.
+    """
+    profiler.enable(**request.model_dump())
+    return profiler.snapshot()
+
+
+@router.delete("/profiling", dependencies=[Depends(require_admin)])
+async def stop_profiling():
+    """Switch profiling off; profiles already started are still written"""
+    profiler.disable()
+    return profiler.snapshot()
+
+
+@router.get("/profiling/{name}", dependencies=[Depends(require_admin)])
+async def download_profile(name: str):
+    """Download one collapsed-stack file (feed it to flamegraph.pl, inferno or speedscope)"""
+    path = profiler.output_dir / name
+    if not PROFILE_FILE_PATTERN.match(name) or not path.is_file():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain")
+
+
+@router.get("/worker")
+async def get_worker_state():
+    """
+    Which worker process served this request, and its view of the shared
+    cache (hit/miss counters are per worker).
+    """
+    return {
+        "pid": os.getpid(),
+        "worker_processes": settings.WORKER_PROCESSES,
+        "shared_cache": shared_cache.info(),
+    }
@@ -1,97 +1,137 @@
 """Patient-facing API endpoints - ACCEPTS RAW OR ENCRYPTED DATA"""
 from datetime import datetime
+import asyncio
 import logging
+from typing import Optional
 from uuid import UUID
 import base64
 import json
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 
-from app.models.schemas import AppointmentResponse, PatientResultResponse
+from app.config import settings
+from app.models.schemas import AppointmentResponse, PatientResultResponse, RawIntakeSubmission
+from app.services.audit_log import audit_log
+from app.services.blind_index import blind_indexer
 from app.services.crypto_mock import crypto_service
 from app.services.db_service import db_service
+from app.services.etags import cache_headers, version_index
+from app.services.idempotency import IdempotencyConflict, idempotency_index
+from app.services.lab_analytics import lab_analytics
+from app.services.preanalysis import preanalysis
+from app.services.profiler import profiler
+from app.services.result_hub import result_hub
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/patient", tags=["Patient"])
 
 
+def _blind_tokens(intake_data, lab_data):
+    """Search tokens for an intake, or None if the plaintext is unusable"""
+    if not isinstance(intake_data, dict) or not isinstance(lab_data, dict):
+        return None
+    return blind_indexer.tokens_for_record(intake_data, lab_data)
+
+
+async def _process_intake(data: dict) -> AppointmentResponse:
+    """Encrypt (if needed) and store one intake submission"""
+    # Check if data is already encrypted (has encrypted_intake field)
+    if "encrypted_intake" in data:
+        logger.info("Data is encrypted, processing normally...")
+        encrypted_intake = data["encrypted_intake"]
+        encrypted_lab = data["encrypted_lab_results"]
+        wrapped_key = data["wrapped_key"]
+        doctor_id = UUID(data["doctor_id"])
+        appointment_time = datetime.fromisoformat(data["appointment_time"])
+        
+        # Search tokens need the plaintext once, at ingest
+        try:
+            intake_data = crypto_service.decrypt(encrypted_intake, wrapped_key)
+            lab_data = crypto_service.decrypt(encrypted_lab, wrapped_key)
+        except Exception as e:
+            logger.warning(f"Could not decrypt intake for blind indexing: {e}")
+            intake_data, lab_data = None, None
+    else:
+        logger.info("Data is RAW (not encrypted), encrypting now...")
+        
+        # Validate and normalise once; stored payloads are canonical
+        with profiler.stage("validation"):
+            submission = RawIntakeSubmission.model_validate(data)
+            intake_data = submission.intake_payload()
+            lab_data = submission.lab_payload()
+        
+        # Encrypt the data
+        with profiler.stage("crypto"):
+            encrypted_intake, key1 = crypto_service.encrypt(intake_data)
+            encrypted_lab, key2 = crypto_service.encrypt(lab_data)
+        wrapped_key = key1  # Use same key for simplicity
+        
+        # Default values
+        doctor_id = UUID("11111111-1111-1111-1111-111111111111")
+        appointment_time = datetime.now()
+    
+    # Create appointment
+    appointment_id = await db_service.create_appointment(
+        patient_id=None,
+        doctor_id=doctor_id,
+        appointment_time=appointment_time,
+    )
+    
+    # Store encrypted data
+    await db_service.store_encrypted_intake(
+        appointment_id=appointment_id,
+        encrypted_intake=encrypted_intake,
+        encrypted_lab_results=encrypted_lab,
+        wrapped_key=wrapped_key,
+        blind_tokens=_blind_tokens(intake_data, lab_data),
+    )
+    
+    logger.info(f"Successfully created appointment {appointment_id}")
+    
+    lab_analytics.notify_new_intake()
+    preanalysis.notify_record_stored(appointment_id)
+    
+    return AppointmentResponse(
+        appointment_id=appointment_id,
+        status="pending",
+        message="Your intake form has been submitted successfully",
+    )
+
+
 @router.post("/submit-intake", response_model=AppointmentResponse)
 async def submit_patient_intake(request: Request) -> AppointmentResponse:
     """
     Submit patient intake - accepts BOTH encrypted and raw data for demo.
+    
+    Send an `Idempotency-Key` header to make retries safe: a repeated key
+    returns the original response without creating another appointment.
     """
     try:
         # Get raw JSON from request
         data = await request.json()
         logger.info(f"Received patient data: {list(data.keys())}")
         
-        # Check if data is already encrypted (has encrypted_intake field)
-        if "encrypted_intake" in data:
-            logger.info("Data is encrypted, processing normally...")
-            encrypted_intake = data["encrypted_intake"]
-            encrypted_lab = data["encrypted_lab_results"]
-            wrapped_key = data["wrapped_key"]
-            doctor_id = UUID(data["doctor_id"])
-            appointment_time = datetime.fromisoformat(data["appointment_time"])
-        else:
-            logger.info("Data is RAW (not encrypted), encrypting now...")
-            
-            # Extract intake and lab data from raw JSON
-            intake_data = {
-                "age": data.get("age"),
-                "gender": data.get("gender"),
-                "chief_complaint": data.get("chief_complaint"),
-                "symptoms": data.get("symptoms"),
-                "symptom_duration": data.get("symptom_duration"),
-                "medical_history": data.get("medical_history"),
-                "current_medications": data.get("current_medications"),
-                "allergies": data.get("allergies"),
-            }
-            
-            lab_data = {
-                "fasting_glucose": data.get("fasting_glucose"),
-                "hba1c": data.get("hba1c"),
-                "blood_pressure_systolic": data.get("blood_pressure_systolic"),
-                "blood_pressure_diastolic": data.get("blood_pressure_diastolic"),
-                "bmi": data.get("bmi"),
-                "cholesterol_total": data.get("cholesterol_total"),
-                "cholesterol_ldl": data.get("cholesterol_ldl"),
-                "cholesterol_hdl": data.get("cholesterol_hdl"),
-                "triglycerides": data.get("triglycerides"),
-            }
-            
-            # Encrypt the data
-            encrypted_intake, key1 = crypto_service.encrypt(intake_data)
-            encrypted_lab, key2 = crypto_service.encrypt(lab_data)
-            wrapped_key = key1  # Use same key for simplicity
-            
-            # Default values
-            doctor_id = UUID("11111111-1111-1111-1111-111111111111")
-            appointment_time = datetime.now()
-        
-        # Create appointment
-        appointment_id = await db_service.create_appointment(
-            patient_id=None,
-            doctor_id=doctor_id,
-            appointment_time=appointment_time,
-        )
-        
-        # Store encrypted data
-        await db_service.store_encrypted_intake(
-            appointment_id=appointment_id,
-            encrypted_intake=encrypted_intake,
-            encrypted_lab_results=encrypted_lab,
-            wrapped_key=wrapped_key,
-        )
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if not idempotency_key:
+            return await _process_intake(data)
         
-        logger.info(f"Successfully created appointment {appointment_id}")
+        async def handler():
+            response = await _process_intake(data)
+            return response.model_dump(mode="json")
         
-        return AppointmentResponse(
-            appointment_id=appointment_id,
-            status="pending",
-            message="Your intake form has been submitted successfully",
+        response = await idempotency_index.run(
+            idempotency_key,
+            idempotency_index.fingerprint(await request.body()),
+            handler,
         )
+        return AppointmentResponse(**response)
         
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
     except Exception as e:
         logger.error(f"Error submitting intake: {e}")
         import traceback
@@ -99,12 +139,54 @@ async def submit_patient_intake(request: Request) -> AppointmentResponse:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _build_result_response(
+    appointment_id: UUID,
+    result: dict,
+) -> PatientResultResponse:
+    """Decrypt a stored consultation result into the patient-facing response"""
+    # Decrypt the result
+    decrypted_result = crypto_service.decrypt(
+        result["encrypted_result"],
+        result["wrapped_key"]
+    )
+    await audit_log.record("patient.result.read", [appointment_id])
+    
+    # Get doctor name
+    doctor_id = result.get("doctor_id") or decrypted_result.get("approved_by")
+    doctor_name = "Dr. Smith"
+    if doctor_id:
+        try:
+            doctor_name = await db_service.get_doctor_name(UUID(doctor_id))
+        except:
+            pass
+    
+    return PatientResultResponse(
+        appointment_id=appointment_id,
+        status="completed",
+        approved_by=UUID(doctor_id) if doctor_id else UUID("11111111-1111-1111-1111-111111111111"),
+        approved_at=datetime.fromisoformat(result.get("created_at", datetime.now().isoformat())),
+        doctor_name=doctor_name,
+        doctor_notes=decrypted_result.get("doctor_notes"),
+        ai_analysis=decrypted_result.get("ai_analysis"),
+    )
+
+
 @router.get("/result/{appointment_id}", response_model=PatientResultResponse)
-async def get_patient_result(appointment_id: UUID) -> PatientResultResponse:
-    """Get consultation results for a patient."""
+async def get_patient_result(
+    appointment_id: UUID,
+    http_response: Response,
+    if_none_match: Optional[str] = Header(None),
+) -> PatientResultResponse:
+    """Get consultation results for a patient (supports If-None-Match)."""
     try:
         logger.info(f"Patient requesting results for appointment {appointment_id}")
         
+        # Results never change, so a current ETag is answered without the blob
+        not_modified = await version_index.check_result(appointment_id, if_none_match)
+        if not_modified is not None:
+            await audit_log.record("patient.result.read", [appointment_id], outcome="not_modified")
+            return not_modified
+        
         result = await db_service.get_consultation_result(appointment_id)
         
         if not result:
@@ -114,35 +196,100 @@ async def get_patient_result(appointment_id: UUID) -> PatientResultResponse:
                 detail="Results not ready yet"
             )
         
-        # Decrypt the result
-        decrypted_result = crypto_service.decrypt(
-            result["encrypted_result"],
-            result["wrapped_key"]
+        response = await _build_result_response(appointment_id, result)
+        http_response.headers.update(
+            cache_headers(version_index.remember_result(appointment_id, result["result_id"]))
         )
         
-        # Get doctor name
-        doctor_id = result.get("doctor_id") or decrypted_result.get("approved_by")
-        doctor_name = "Dr. Smith"
-        if doctor_id:
-            try:
-                doctor_name = await db_service.get_doctor_name(UUID(doctor_id))
-            except:
-                pass
-        
         logger.info(f"Successfully retrieved results for appointment {appointment_id}")
         
-        return PatientResultResponse(
-            appointment_id=appointment_id,
-            status="completed",
-            approved_by=UUID(doctor_id) if doctor_id else UUID("11111111-1111-1111-1111-111111111111"),
-            approved_at=datetime.fromisoformat(result.get("created_at", datetime.now().isoformat())),
-            doctor_name=doctor_name,
-            doctor_notes=decrypted_result.get("doctor_notes"),
-            ai_analysis=decrypted_result.get("ai_analysis"),
-        )
+        return response
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error retrieving patient result: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/result/{appointment_id}/wait", response_model=PatientResultResponse)
+async def wait_for_patient_result(
+    appointment_id: UUID,
+    timeout: Optional[float] = Query(None, gt=0),
+) -> PatientResultResponse:
+    """
+    Long-poll for consultation results.
+    Returns as soon as the doctor approves, or 404 after `timeout` seconds.
+    """
+    timeout = min(timeout or settings.RESULT_WAIT_TIMEOUT_SECONDS, settings.RESULT_STREAM_MAX_SECONDS)
+    
+    # Subscribe before the DB check so a result stored in between is not missed
+    future = result_hub.subscribe(appointment_id)
+    try:
+        result = await db_service.get_consultation_result(appointment_id)
+        
+        if not result:
+            logger.info(f"Waiting up to {timeout}s for results of appointment {appointment_id}")
+            if await result_hub.wait(future, timeout):
+                result = await db_service.get_consultation_result(appointment_id)
+        
+        if not result:
+            raise HTTPException(
+                status_code=404,
+                detail="Results not ready yet"
+            )
+        
+        return await _build_result_response(appointment_id, result)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error waiting for patient result: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        result_hub.unsubscribe(appointment_id, future)
+
+
+@router.get("/result/{appointment_id}/events")
+async def stream_patient_result(appointment_id: UUID, request: Request):
+    """
+    Server-Sent Events stream for consultation results.
+    Emits a single `result` event when ready, `: keep-alive` comments in
+    between, and a `timeout` event if nothing arrives in time.
+    """
+    
+    async def event_stream():
+        future = result_hub.subscribe(appointment_id)
+        try:
+            result = await db_service.get_consultation_result(appointment_id)
+            
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + settings.RESULT_STREAM_MAX_SECONDS
+            while not result:
+                remaining = deadline - loop.time()
+                if remaining <= 0 or await request.is_disconnected():
+                    yield "event: timeout\ndata: {}\n\n"
+                    return
+                
+                heartbeat = min(settings.RESULT_STREAM_HEARTBEAT_SECONDS, remaining)
+                if await result_hub.wait(future, heartbeat):
+                    result = await db_service.get_consultation_result(appointment_id)
+                    if not result:
+                        future = result_hub.subscribe(appointment_id)
+                else:
+                    yield ": keep-alive\n\n"
+            
+            response = await _build_result_response(appointment_id, result)
+            yield f"event: result\ndata: {response.model_dump_json()}\n\n"
+            
+        except Exception as e:
+            logger.error(f"Error streaming patient result: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        finally:
+            result_hub.unsubscribe(appointment_id, future)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,60 @@
+"""
+Production launcher: several uvicorn worker processes behind one socket.
+
+    python -m app.server [--workers N] [--port 8000]
+
+The launcher creates the shared-memory cache segment before starting the
+workers and removes it on exit. Each worker attaches to it, warms up
+(app.services.warmup) and divides the per-process AI budgets by the worker
+count. Use `python -m app.main` for the single-process reloading dev server.
+"""
+import argparse
+import logging
+import os
+
+import uvicorn
+
+from app.config import settings
+from app.services.shared_cache import SharedCache
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_count() -> int:
+    return settings.SERVER_WORKERS or os.cpu_count() or 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with multiple worker processes")
+    parser.add_argument("--workers", type=int, default=default_worker_count())
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    segment_name = f"qspa-cache-{os.getpid()}"
+    segment = SharedCache.create_segment(
+        segment_name,
+        settings.SHARED_CACHE_SLOTS,
+        settings.SHARED_CACHE_SLOT_BYTES,
+        settings.SHARED_CACHE_RING_ENTRIES,
+    )
+    # Workers are spawned with this environment and read it through Settings
+    os.environ["SHARED_CACHE_NAME"] = segment_name
+    os.environ["WORKER_PROCESSES"] = str(args.workers)
+
+    logger.info(f"Starting {args.workers} workers on {args.host}:{args.port} (shared cache {segment_name})")
+    try:
+        uvicorn.run(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+        )
+    finally:
+        SharedCache.remove_segment(segment)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,127 @@
 """AI Service - Enhanced with Disease Probability Assessment"""
+import asyncio
+import json
 import logging
+from typing import Optional
+
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from google.generativeai import protos
+from pydantic import ValidationError
 from app.config import settings
 from app.models.schemas import PatientIntakeData, LabResults, AIAnalysisResult
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.fallback_analyzer import analyze_with_rules
+from app.services.gemini_standin import generative_model
+from app.services.hedging import HedgedRequester, LatencyTracker, RetryBudget
+from app.services.profiler import profiler
+from app.services.structured_output import OutputTracker, response_schema_for
 
 logger = logging.getLogger(__name__)
 
 # Configure Gemini
 genai.configure(api_key=settings.GEMINI_API_KEY)
 
+# Failures worth another attempt. Quota errors (429) are not retried:
+# retrying them only burns more quota.
+TRANSIENT_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+MAX_TOKENS = protos.Candidate.FinishReason.MAX_TOKENS
+
+# What Gemini must return in structured mode: the analysis minus our own bookkeeping fields
+ANALYSIS_SCHEMA = response_schema_for(AIAnalysisResult, exclude=("is_fallback", "analysis_source"))
+
+
+class AIServiceError(Exception):
+    """A Gemini attempt failed; `retryable` says whether trying again may help"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+gemini_breaker = CircuitBreaker(
+    name="gemini",
+    window_size=settings.AI_BREAKER_WINDOW_SIZE,
+    min_calls=settings.AI_BREAKER_MIN_CALLS,
+    failure_rate_threshold=settings.AI_BREAKER_FAILURE_RATE,
+    slow_call_seconds=settings.AI_BREAKER_SLOW_CALL_SECONDS,
+    slow_call_rate_threshold=settings.AI_BREAKER_SLOW_CALL_RATE,
+    open_seconds=settings.AI_BREAKER_OPEN_SECONDS,
+    half_open_probes=settings.AI_BREAKER_HALF_OPEN_PROBES,
+)
+
+gemini_requester = HedgedRequester(
+    name="gemini",
+    budget=RetryBudget(
+        ratio=settings.AI_RETRY_BUDGET_RATIO,
+        min_per_second=settings.AI_RETRY_BUDGET_MIN_PER_SECOND,
+        max_tokens=settings.AI_RETRY_BUDGET_MAX_TOKENS,
+    ),
+    latencies=LatencyTracker(window_size=settings.AI_LATENCY_WINDOW_SIZE),
+    hedging_enabled=settings.AI_HEDGING_ENABLED,
+    hedge_percentile=settings.AI_HEDGE_PERCENTILE,
+    hedge_min_delay=settings.AI_HEDGE_MIN_DELAY_SECONDS,
+    hedge_max_delay=settings.AI_HEDGE_MAX_DELAY_SECONDS,
+    hedge_min_samples=settings.AI_HEDGE_MIN_SAMPLES,
+    max_retries=settings.AI_MAX_RETRIES,
+    backoff_base=settings.AI_RETRY_BACKOFF_BASE_SECONDS,
+    backoff_max=settings.AI_RETRY_BACKOFF_MAX_SECONDS,
+)
+
+gemini_output = OutputTracker(
+    min_tokens=settings.AI_MAX_OUTPUT_TOKENS_MIN,
+    max_tokens=settings.AI_MAX_OUTPUT_TOKENS_MAX,
+    percentile=settings.AI_OUTPUT_TOKENS_PERCENTILE,
+    headroom=settings.AI_OUTPUT_TOKENS_HEADROOM,
+    window_size=settings.AI_OUTPUT_TOKENS_WINDOW_SIZE,
+    floor_decay_responses=settings.AI_OUTPUT_TOKENS_FLOOR_DECAY_RESPONSES,
+)
 
+
+def _is_retryable(error: Exception) -> bool:
+    return getattr(error, "retryable", False)
+
+
+@profiler.staged("ai")
 async def analyze_patient_data(
     intake_data: PatientIntakeData,
     lab_results: LabResults
 ) -> AIAnalysisResult:
     """
-    Analyze patient data using Google Gemini AI with enhanced disease probability assessment.
+    Analyze patient data with Gemini behind a circuit breaker.
     
-    Returns structured clinical analysis with risk assessment, disease probabilities, and recommendations.
+    Each call is hedged and retried by `gemini_requester`. While the circuit
+    is open the local rule-based analyzer answers instead; its result has
+    `is_fallback=True`. Other failures raise AIServiceError unless
+    AI_FALLBACK_ON_ERROR is set.
     """
     try:
-        logger.info("Starting AI analysis with Gemini")
-        
-        # Prepare simplified prompt for shorter response
-        prompt = f"""You are a medical AI assistant. Analyze this patient case and provide a concise assessment.
+        return await gemini_breaker.call(
+            lambda: gemini_requester.call(
+                lambda: _gemini_analysis(intake_data, lab_results),
+                is_retryable=_is_retryable,
+            ),
+            timeout=settings.AI_CALL_TIMEOUT_SECONDS,
+        )
+    except CircuitOpenError:
+        logger.warning("Gemini circuit is open; serving rule-based fallback analysis")
+    except Exception as e:
+        if not settings.AI_FALLBACK_ON_ERROR:
+            if isinstance(e, AIServiceError):
+                raise
+            raise AIServiceError(f"Failed to analyze patient data: {type(e).__name__} {e}") from e
+        logger.warning(f"Gemini analysis failed ({type(e).__name__}: {e}); serving rule-based fallback analysis")
+    
+    return analyze_with_rules(intake_data, lab_results)
 
-**PATIENT DATA:**
+
+def _patient_context(intake_data: PatientIntakeData, lab_results: LabResults) -> str:
+    return f"""**PATIENT DATA:**
 Age: {intake_data.age}, Gender: {intake_data.gender}
 Chief Complaint: {intake_data.chief_complaint}
 Symptoms: {intake_data.symptoms}
@@ -37,7 +133,119 @@ Allergies: {intake_data.allergies or "None"}
 **LAB RESULTS:**
 Glucose: {lab_results.fasting_glucose} mg/dL | HbA1c: {lab_results.hba1c}%
 BP: {lab_results.blood_pressure_systolic}/{lab_results.blood_pressure_diastolic} mmHg | BMI: {lab_results.bmi}
-Cholesterol: Total {lab_results.cholesterol_total}, LDL {lab_results.cholesterol_ldl}, HDL {lab_results.cholesterol_hdl} mg/dL
+Cholesterol: Total {lab_results.cholesterol_total}, LDL {lab_results.cholesterol_ldl}, HDL {lab_results.cholesterol_hdl} mg/dL"""
+
+
+def _output_tokens(response) -> Optional[int]:
+    # Everything generated, including any thinking tokens, which also count
+    # against max_output_tokens
+    usage = getattr(response, "usage_metadata", None)
+    if not usage or not usage.total_token_count:
+        return None
+    return usage.total_token_count - usage.prompt_token_count
+
+
+def _parse_structured(response_text: str) -> AIAnalysisResult:
+    try:
+        return AIAnalysisResult.model_validate_json(response_text)
+    except ValidationError as e:
+        gemini_output.parse_failed()
+        logger.error(f"AI response did not match the analysis schema: {e}")
+        logger.error(f"Response text (first 1000 chars): {response_text[:1000]}")
+        raise AIServiceError("AI returned invalid response format")
+
+
+def _parse_legacy(response_text: str) -> AIAnalysisResult:
+    response_text = response_text.strip()
+    
+    # Clean up response (remove markdown if present)
+    if response_text.startswith('```json'):
+        response_text = response_text.split('```json')[1]
+    if response_text.endswith('```'):
+        response_text = response_text.rsplit('```', 1)[0]
+    response_text = response_text.strip()
+    
+    try:
+        ai_result = json.loads(response_text)
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse AI response as JSON: {e}")
+        logger.error(f"Response text (first 1000 chars): {response_text[:1000]}")
+        
+        # Try to fix truncated JSON by adding closing braces
+        logger.info("Attempting to fix truncated JSON...")
+        try:
+            # Count opening and closing braces
+            open_braces = response_text.count('{')
+            close_braces = response_text.count('}')
+            open_brackets = response_text.count('[')
+            close_brackets = response_text.count(']')
+            
+            # Add missing closing characters
+            fixed_text = response_text
+            if open_brackets > close_brackets:
+                fixed_text += ']' * (open_brackets - close_brackets)
+            if open_braces > close_braces:
+                fixed_text += '}' * (open_braces - close_braces)
+            
+            ai_result = json.loads(fixed_text)
+            gemini_output.parse_failed(repaired=True)
+            logger.info("Successfully fixed and parsed truncated JSON")
+        except Exception as fix_error:
+            gemini_output.parse_failed()
+            logger.error(f"Failed to fix JSON: {fix_error}")
+            raise AIServiceError("AI returned invalid response format")
+    
+    # Create structured response (keep all fields from AI)
+    return AIAnalysisResult(
+        risk_score=float(ai_result.get('risk_score', 5.0)),
+        primary_concerns=ai_result.get('primary_concerns', []),
+        differential_diagnoses=ai_result.get('differential_diagnoses', []),
+        recommended_tests=ai_result.get('recommended_tests', []),
+        clinical_summary=ai_result.get('clinical_summary', ''),
+        treatment_recommendations=ai_result.get('treatment_recommendations', []),
+        follow_up_timeline=ai_result.get('follow_up_timeline', 'Follow up in 1-2 weeks'),
+        overall_health_status=ai_result.get('overall_health_status'),
+        disease_probabilities=ai_result.get('disease_probabilities', []),
+        lifestyle_recommendations=ai_result.get('lifestyle_recommendations', []),
+        urgent_actions_needed=ai_result.get('urgent_actions_needed', []),
+        patient_friendly_summary=ai_result.get('patient_friendly_summary', ''),
+    )
+
+
+@profiler.staged("ai")  # Hedged attempts run in their own tasks
+async def _gemini_analysis(
+    intake_data: PatientIntakeData,
+    lab_results: LabResults
+) -> AIAnalysisResult:
+    """
+    Analyze patient data using Google Gemini AI with enhanced disease probability assessment.
+    
+    With AI_STRUCTURED_OUTPUT the model is constrained to ANALYSIS_SCHEMA and
+    its JSON is validated straight into AIAnalysisResult; otherwise the
+    legacy prose prompt and lenient parser are used.
+    """
+    try:
+        logger.info("Starting AI analysis with Gemini")
+        structured = settings.AI_STRUCTURED_OUTPUT
+        max_output_tokens = gemini_output.token_limit()
+        
+        if structured:
+            prompt = f"""You are a medical AI assistant. Analyze this patient case and provide a concise assessment.
+
+{_patient_context(intake_data, lab_results)}
+
+List the most likely conditions in disease_probabilities. Keep explanations brief (1-2 sentences max)."""
+            generation_config = genai.GenerationConfig(
+                temperature=0.3,
+                max_output_tokens=max_output_tokens,
+                response_mime_type="application/json",
+                response_schema=ANALYSIS_SCHEMA,
+            )
+        else:
+            # Prepare simplified prompt for shorter response
+            prompt = f"""You are a medical AI assistant. Analyze this patient case and provide a concise assessment.
+
+{_patient_context(intake_data, lab_results)}
 
 **REQUIRED JSON OUTPUT (keep it concise):**
 {{
@@ -58,10 +266,14 @@ Cholesterol: Total {lab_results.cholesterol_total}, LDL {lab_results.cholesterol
 }}
 
 CRITICAL: Return ONLY valid JSON. Keep explanations brief (1-2 sentences max). NO markdown, NO extra text."""
+            generation_config = genai.GenerationConfig(
+                temperature=0.3,
+                max_output_tokens=max_output_tokens,
+            )
 
         # Call Gemini API with safety settings
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        logger.info("Calling Gemini API...")
+        model = generative_model('gemini-2.5-flash')
+        logger.info(f"Calling Gemini API (structured={structured}, max_output_tokens={max_output_tokens})...")
         
         # Configure safety settings to allow medical content
         safety_settings = [
@@ -83,86 +295,41 @@ CRITICAL: Return ONLY valid JSON. Keep explanations brief (1-2 sentences max). N
             }
         ]
         
-        response = model.generate_content(
+        response = await model.generate_content_async(
             prompt,
-            generation_config=genai.GenerationConfig(
-                temperature=0.3,
-                max_output_tokens=4096,  # Increased from 2048
-            ),
-            safety_settings=safety_settings
+            generation_config=generation_config,
+            safety_settings=safety_settings,
+            # Retries are ours (budgeted, see gemini_requester), not the SDK's
+            request_options={"timeout": settings.AI_ATTEMPT_TIMEOUT_SECONDS, "retry": None},
         )
         
         # Parse response
-        import json
+        truncated = bool(response.candidates) and response.candidates[0].finish_reason == MAX_TOKENS
+        gemini_output.observe(_output_tokens(response), truncated)
         
         # Check if response was blocked
         if not response.candidates or not response.candidates[0].content.parts:
+            if truncated:
+                raise AIServiceError(f"AI output truncated at {max_output_tokens} tokens")
             logger.error(f"Gemini blocked the response. Finish reason: {response.candidates[0].finish_reason if response.candidates else 'unknown'}")
             logger.error(f"Safety ratings: {response.candidates[0].safety_ratings if response.candidates else 'unknown'}")
-            raise Exception("AI response was blocked by safety filters. This is a medical analysis request and should be allowed.")
-        
-        response_text = response.text.strip()
+            raise AIServiceError(
+                "AI response was blocked by safety filters. This is a medical analysis request and should be allowed.",
+                retryable=False,
+            )
         
-        # Clean up response (remove markdown if present)
-        if response_text.startswith('```json'):
-            response_text = response_text.split('```json')[1]
-        if response_text.endswith('```'):
-            response_text = response_text.rsplit('```', 1)[0]
-        response_text = response_text.strip()
+        if structured:
+            if truncated:
+                # Cut-off JSON is not worth repairing; the retry gets a larger limit
+                raise AIServiceError(f"AI output truncated at {max_output_tokens} tokens")
+            result = _parse_structured(response.text)
+        else:
+            result = _parse_legacy(response.text)
         
-        try:
-            ai_result = json.loads(response_text)
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse AI response as JSON: {e}")
-            logger.error(f"Response text (first 1000 chars): {response_text[:1000]}")
-            
-            # Try to fix truncated JSON by adding closing braces
-            logger.info("Attempting to fix truncated JSON...")
-            try:
-                # Count opening and closing braces
-                open_braces = response_text.count('{')
-                close_braces = response_text.count('}')
-                open_brackets = response_text.count('[')
-                close_brackets = response_text.count(']')
-                
-                # Add missing closing characters
-                fixed_text = response_text
-                if open_brackets > close_brackets:
-                    fixed_text += ']' * (open_brackets - close_brackets)
-                if open_braces > close_braces:
-                    fixed_text += '}' * (open_braces - close_braces)
-                
-                ai_result = json.loads(fixed_text)
-                logger.info("Successfully fixed and parsed truncated JSON")
-            except Exception as fix_error:
-                logger.error(f"Failed to fix JSON: {fix_error}")
-                raise Exception("AI returned invalid response format")
-        
-        logger.info(f"AI analysis complete. Risk score: {ai_result.get('risk_score', 'N/A')}")
-        
-        # Create structured response (keep all fields from AI)
-        return AIAnalysisResult(
-            risk_score=float(ai_result.get('risk_score', 5.0)),
-            primary_concerns=ai_result.get('primary_concerns', []),
-            differential_diagnoses=ai_result.get('differential_diagnoses', []),
-            recommended_tests=ai_result.get('recommended_tests', []),
-            clinical_summary=ai_result.get('clinical_summary', ''),
-            treatment_recommendations=ai_result.get('treatment_recommendations', []),
-            follow_up_timeline=ai_result.get('follow_up_timeline', 'Follow up in 1-2 weeks'),
-            # Add extra fields as dict for frontend to use
-            **{
-                'overall_health_status': ai_result.get('overall_health_status'),
-                'disease_probabilities': ai_result.get('disease_probabilities', []),
-                'lifestyle_recommendations': ai_result.get('lifestyle_recommendations', []),
-                'urgent_actions_needed': ai_result.get('urgent_actions_needed', []),
-                'patient_friendly_summary': ai_result.get('patient_friendly_summary', '')
-            }
-        )
+        logger.info(f"AI analysis complete. Risk score: {result.risk_score}")
+        return result
         
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse AI response as JSON: {e}")
-        logger.error(f"Response text: {response_text}")
-        raise Exception("AI returned invalid response format")
     except Exception as e:
         logger.error(f"AI analysis failed: {e}")
-        raise Exception(f"Failed to analyze patient data: {str(e)}")
+        retryable = e.retryable if isinstance(e, AIServiceError) else isinstance(e, TRANSIENT_ERRORS)
+        raise AIServiceError(f"Failed to analyze patient data: {str(e)}", retryable=retryable) from e
@@ -0,0 +1,134 @@
+"""
+Archival job: moves completed consultations to the cold archive.
+
+Each run has two phases:
+1. archive: completed appointments older than ARCHIVE_AFTER_DAYS that are
+   not archived yet are written to a new segment, one batch per segment,
+   and then marked `archived_at`
+2. purge: hot rows of appointments archived more than
+   ARCHIVE_PURGE_GRACE_SECONDS ago are deleted (results, then records)
+
+Reads fall back to the archive whenever the hot row is missing, and the
+grace period outlasts the readers' index refresh interval, so every
+consultation stays readable throughout. Rows are only deleted once they
+are in a durable segment; a crash before `archived_at` is set just means the
+batch is archived again (the newer copy wins).
+
+Appointment rows stay in the hot table (they are small and every list pages
+over them); `archived_at` stands in for the result flag. Archived rows keep
+their wrapped keys, so key epochs must stay available while segments
+reference them. Once purged they drop out of search, export and analytics
+rebuilds, which scan the hot tables only; each of those reports how many
+consultations it missed as `archived_excluded`
+(`db_service.count_purged_archived_consultations`).
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.services.archive import ConsultationArchive, consultation_archive
+from app.services.db_service import _embedded_one, db_service
+
+logger = logging.getLogger(__name__)
+
+
+class ArchivalJob:
+    """Archives old consultations in batches, then purges their hot rows"""
+
+    def __init__(
+        self,
+        archive: ConsultationArchive,
+        after_days: float,
+        batch_size: int,
+        purge_grace_seconds: float,
+    ):
+        self.archive = archive
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.purge_grace_seconds = purge_grace_seconds
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    @staticmethod
+    def _entry(row: Dict[str, Any], archived_at: str) -> Dict[str, Any]:
+        return {
+            "appointment_id": str(row["appointment_id"]),
+            "archived_at": archived_at,
+            "encrypted_record": _embedded_one(row.get("encrypted_records")),
+            "consultation_result": _embedded_one(row.get("consultation_results")),
+        }
+
+    async def archive_batch(self) -> int:
+        """Archive one batch into a new segment; returns how many consultations moved"""
+        cutoff = (datetime.now() - timedelta(days=self.after_days)).isoformat()
+        rows = await db_service.list_archivable_consultations(cutoff, self.batch_size)
+        if not rows:
+            return 0
+
+        archived_at = datetime.now().isoformat()
+        entries = [self._entry(row, archived_at) for row in rows]
+        footer = await self.archive.write(entries)
+        await db_service.mark_appointments_archived([entry["appointment_id"] for entry in entries], archived_at)
+        logger.info(f"Archived {len(entries)} consultation(s) into {footer['segment_id']}")
+        return len(entries)
+
+    async def purge_batch(self) -> int:
+        """Delete hot rows whose archive copy is past the grace period"""
+        archived_before = (datetime.now() - timedelta(seconds=self.purge_grace_seconds)).isoformat()
+        appointment_ids: List[str] = await db_service.list_purgeable_appointment_ids(
+            archived_before, self.batch_size
+        )
+        if appointment_ids:
+            await db_service.delete_hot_consultation_rows(appointment_ids)
+            logger.info(f"Purged hot rows of {len(appointment_ids)} archived consultation(s)")
+        return len(appointment_ids)
+
+    async def run(self) -> Dict[str, Any]:
+        """Archive and purge until both phases run dry"""
+        started = datetime.now()
+        totals = {"archived": 0, "purged": 0}
+        while True:
+            moved = await self.archive_batch()
+            totals["archived"] += moved
+            if moved < self.batch_size:
+                break
+        while True:
+            purged = await self.purge_batch()
+            totals["purged"] += purged
+            if purged < self.batch_size:
+                break
+        self.last_run = {**totals, "started_at": started.isoformat(),
+                         "seconds": round((datetime.now() - started).total_seconds(), 3)}
+        return self.last_run
+
+    async def _run_loop(self):
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                logger.error(f"Archival run failed: {e}")
+            await asyncio.sleep(settings.ARCHIVE_INTERVAL_SECONDS)
+
+    def start(self):
+        """Start periodic archival runs"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+archival_job = ArchivalJob(
+    archive=consultation_archive,
+    after_days=settings.ARCHIVE_AFTER_DAYS,
+    batch_size=settings.ARCHIVE_BATCH_SIZE,
+    purge_grace_seconds=settings.ARCHIVE_PURGE_GRACE_SECONDS,
+)
@@ -0,0 +1,330 @@
+"""
+Cold archive of completed consultations.
+
+The archival job (app.services.archival) moves old consultations out of
+`encrypted_records` and `consultation_results` into immutable segments.
+An entry is the consultation's rows exactly as stored (still ciphertext;
+nothing is decrypted):
+
+    {"appointment_id", "archived_at", "encrypted_record": {...}, "consultation_result": {...}}
+
+A segment holds one archival batch sorted by appointment_id, cut into
+blocks of ARCHIVE_BLOCK_SIZE entries that are compressed one by one (zstd
+when installed). The footer is a sparse index: the first appointment_id of
+each block, plus a Bloom filter of every ID in the segment. IDs are random
+UUIDs, so every segment's ID range covers nearly everything; the filter is
+what lets a lookup skip segments. A lookup reads and decompresses at most
+one block per candidate segment.
+
+Stores:
+- "file": one `archive-*.seg` file per segment in ARCHIVE_DIR (blocks, then
+  the footer), written to a temp file, fsynced and renamed into place
+- "db": `archive_segments` (footers) and `archive_blocks` (one row per block)
+
+Footers are loaded on first use and reloaded on a miss at most every
+ARCHIVE_INDEX_REFRESH_SECONDS; that is how segments written by another
+process become visible. If a consultation was archived twice, the newest
+segment wins.
+"""
+import asyncio
+import base64
+import bisect
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.database import get_db
+from app.services.executor import run_blocking_io
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "archive-"
+SEGMENT_SUFFIX = ".seg"
+FOOTER_MAGIC = b"QSA1"
+FOOTER_TRAILER = struct.Struct(">Q4s")  # footer length, magic
+BLOOM_BITS_PER_ENTRY = 10
+BLOOM_HASHES = 7
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys (~1% false positives at 10 bits/key)"""
+
+    def __init__(self, bits: int, hashes: int = BLOOM_HASHES, data: Optional[bytes] = None):
+        self.bits = max(8, bits)
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((self.bits + 7) // 8)
+
+    @staticmethod
+    def key_hashes(key: str) -> Tuple[int, int]:
+        """Hash a key once; every filter derives its bit positions from this pair"""
+        return struct.unpack_from(">QQ", hashlib.sha256(key.encode("utf-8")).digest())
+
+    def _positions(self, hashes: Tuple[int, int]):
+        h1, h2 = hashes
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self._positions(self.key_hashes(key)):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def might_contain(self, hashes: Tuple[int, int]) -> bool:
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(hashes))
+
+
+def build_segment(
+    entries: List[Dict[str, Any]],
+    block_size: int,
+    level: int,
+) -> Tuple[Dict[str, Any], List[bytes]]:
+    """Sort entries by appointment_id and encode them as (footer, compressed blocks)"""
+    entries = sorted(entries, key=lambda entry: entry["appointment_id"])
+    codec = "zstd" if zstandard is not None else "none"
+    compressor = zstandard.ZstdCompressor(level=level) if zstandard is not None else None
+    bloom = BloomFilter(len(entries) * BLOOM_BITS_PER_ENTRY)
+
+    blocks, index = [], []
+    for start in range(0, len(entries), block_size):
+        chunk = entries[start:start + block_size]
+        raw = "".join(json.dumps(entry, default=str) + "\n" for entry in chunk).encode("utf-8")
+        blocks.append(compressor.compress(raw) if compressor else raw)
+        index.append(chunk[0]["appointment_id"])
+        for entry in chunk:
+            bloom.add(entry["appointment_id"])
+
+    footer = {
+        "segment_id": f"{SEGMENT_PREFIX}{datetime.now():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}",
+        "created_at": datetime.now().isoformat(),
+        "entries": len(entries),
+        "codec": codec,
+        "first_ids": index,
+        "bloom": base64.b64encode(bytes(bloom.data)).decode("ascii"),
+        "bloom_bits": bloom.bits,
+        "bloom_hashes": bloom.hashes,
+        "compressed_bytes": sum(len(block) for block in blocks),
+    }
+    return footer, blocks
+
+
+class Segment:
+    """A loaded segment footer: sparse block index plus Bloom filter"""
+
+    def __init__(self, footer: Dict[str, Any]):
+        self.footer = footer
+        self.segment_id = footer["segment_id"]
+        self.first_ids: List[str] = footer["first_ids"]
+        self.bloom = BloomFilter(footer["bloom_bits"], footer["bloom_hashes"], base64.b64decode(footer["bloom"]))
+
+    def block_for(self, appointment_id: str, hashes: Tuple[int, int]) -> Optional[int]:
+        """Index of the only block that can hold the ID, or None"""
+        if not self.bloom.might_contain(hashes):
+            return None
+        block_no = bisect.bisect_right(self.first_ids, appointment_id) - 1
+        return block_no if block_no >= 0 else None
+
+    def decode(self, block: bytes) -> List[Dict[str, Any]]:
+        if self.footer["codec"] == "zstd":
+            if zstandard is None:
+                raise RuntimeError("Reading archive segments requires the 'zstandard' package")
+            block = zstandard.ZstdDecompressor().decompress(block)
+        return [json.loads(line) for line in block.decode("utf-8").splitlines()]
+
+
+class FileArchiveStore:
+    """Segments as self-describing files (blocks, footer, trailer)"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def _path(self, segment_id: str) -> Path:
+        return self.directory / f"{segment_id}{SEGMENT_SUFFIX}"
+
+    def load_footers(self, known: set) -> List[Dict[str, Any]]:
+        if not self.directory.exists():
+            return []
+        footers = []
+        for path in sorted(self.directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}")):
+            if path.stem in known:
+                continue
+            with open(path, "rb") as segment:
+                segment.seek(-FOOTER_TRAILER.size, os.SEEK_END)
+                length, magic = FOOTER_TRAILER.unpack(segment.read(FOOTER_TRAILER.size))
+                if magic != FOOTER_MAGIC:
+                    logger.error(f"Skipping archive segment {path.name}: bad trailer")
+                    continue
+                segment.seek(-(FOOTER_TRAILER.size + length), os.SEEK_END)
+                footers.append(json.loads(segment.read(length)))
+        return footers
+
+    def write_segment(self, footer: Dict[str, Any], blocks: List[bytes]) -> Dict[str, Any]:
+        offsets, position = [], 0
+        for block in blocks:
+            offsets.append([position, len(block)])
+            position += len(block)
+        footer = {**footer, "offsets": offsets}
+        encoded = json.dumps(footer).encode("utf-8")
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(footer["segment_id"])
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as segment:
+            for block in blocks:
+                segment.write(block)
+            segment.write(encoded)
+            segment.write(FOOTER_TRAILER.pack(len(encoded), FOOTER_MAGIC))
+            segment.flush()
+            os.fsync(segment.fileno())
+        tmp_path.replace(path)
+        return footer
+
+    def read_block(self, footer: Dict[str, Any], block_no: int) -> bytes:
+        offset, length = footer["offsets"][block_no]
+        with open(self._path(footer["segment_id"]), "rb") as segment:
+            segment.seek(offset)
+            return segment.read(length)
+
+
+class DatabaseArchiveStore:
+    """Segments in the cold archive_segments / archive_blocks tables"""
+
+    def load_footers(self, known: set) -> List[Dict[str, Any]]:
+        result = get_db().table("archive_segments").select("segment_id, footer").order("segment_id").execute()
+        return [row["footer"] for row in result.data if row["segment_id"] not in known]
+
+    def write_segment(self, footer: Dict[str, Any], blocks: List[bytes]) -> Dict[str, Any]:
+        db = get_db()
+        db.table("archive_blocks").insert([
+            {
+                "segment_id": footer["segment_id"],
+                "block_no": block_no,
+                "data": base64.b64encode(block).decode("ascii"),
+            }
+            for block_no, block in enumerate(blocks)
+        ]).execute()
+        # The footer row is the commit point; blocks without one are never read
+        db.table("archive_segments").insert({
+            "segment_id": footer["segment_id"],
+            "created_at": footer["created_at"],
+            "entries": footer["entries"],
+            "footer": footer,
+        }).execute()
+        return footer
+
+    def read_block(self, footer: Dict[str, Any], block_no: int) -> bytes:
+        result = get_db().table("archive_blocks")\
+            .select("data")\
+            .eq("segment_id", footer["segment_id"])\
+            .eq("block_no", block_no)\
+            .execute()
+        if not result.data:
+            raise LookupError(f"Archive block {footer['segment_id']}/{block_no} is missing")
+        return base64.b64decode(result.data[0]["data"])
+
+
+class ConsultationArchive:
+    """Lookup of archived consultations by appointment_id, plus segment writes"""
+
+    def __init__(self, store, block_size: int, compression_level: int, refresh_seconds: float):
+        self.store = store
+        self.block_size = block_size
+        self.compression_level = compression_level
+        self.refresh_seconds = refresh_seconds
+        self._segments: List[Segment] = []  # Oldest first
+        self._loaded_at: Optional[float] = None
+        self._refresh_lock = asyncio.Lock()
+        self.metrics = {
+            "lookups": 0, "hits": 0, "blocks_read": 0, "bloom_false_positives": 0,
+            "refreshes": 0, "segments_written": 0,
+        }
+
+    async def refresh(self):
+        """Load footers of segments this process has not seen yet"""
+        async with self._refresh_lock:
+            known = {segment.segment_id for segment in self._segments}
+            footers = await run_blocking_io(self.store.load_footers, known)
+            segments = self._segments + [Segment(footer) for footer in footers]
+            self._segments = sorted(segments, key=lambda segment: segment.segment_id)
+            self._loaded_at = time.monotonic()
+            self.metrics["refreshes"] += 1
+
+    async def _lookup(self, appointment_id: str) -> Optional[Dict[str, Any]]:
+        hashes = BloomFilter.key_hashes(appointment_id)
+        for segment in reversed(self._segments):
+            block_no = segment.block_for(appointment_id, hashes)
+            if block_no is None:
+                continue
+            block = await run_blocking_io(self.store.read_block, segment.footer, block_no)
+            self.metrics["blocks_read"] += 1
+            for entry in segment.decode(block):
+                if entry["appointment_id"] == appointment_id:
+                    return entry
+            self.metrics["bloom_false_positives"] += 1
+        return None
+
+    async def get(self, appointment_id) -> Optional[Dict[str, Any]]:
+        """The archived entry for an appointment, or None"""
+        key = str(appointment_id)
+        self.metrics["lookups"] += 1
+        if self._loaded_at is None:
+            await self.refresh()
+        entry = await self._lookup(key)
+        if entry is None and time.monotonic() - self._loaded_at >= self.refresh_seconds:
+            await self.refresh()
+            entry = await self._lookup(key)
+        if entry is not None:
+            self.metrics["hits"] += 1
+        return entry
+
+    async def get_encrypted_record(self, appointment_id) -> Optional[Dict[str, Any]]:
+        entry = await self.get(appointment_id)
+        return entry.get("encrypted_record") if entry else None
+
+    async def get_consultation_result(self, appointment_id) -> Optional[Dict[str, Any]]:
+        entry = await self.get(appointment_id)
+        return entry.get("consultation_result") if entry else None
+
+    async def write(self, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Write entries as one new segment (durable on return)"""
+        footer, blocks = build_segment(entries, self.block_size, self.compression_level)
+        footer = await run_blocking_io(self.store.write_segment, footer, blocks)
+        self._segments.append(Segment(footer))
+        self.metrics["segments_written"] += 1
+        return footer
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "store": type(self.store).__name__,
+            "segments": len(self._segments),
+            "entries": sum(segment.footer["entries"] for segment in self._segments),
+            "compressed_bytes": sum(segment.footer["compressed_bytes"] for segment in self._segments),
+            "index_age_seconds": (
+                round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None
+            ),
+            **self.metrics,
+        }
+
+
+def _build_store():
+    if settings.ARCHIVE_STORE == "db":
+        return DatabaseArchiveStore()
+    return FileArchiveStore(settings.ARCHIVE_DIR)
+
+
+consultation_archive = ConsultationArchive(
+    store=_build_store(),
+    block_size=settings.ARCHIVE_BLOCK_SIZE,
+    compression_level=settings.ARCHIVE_COMPRESSION_LEVEL,
+    refresh_seconds=settings.ARCHIVE_INDEX_REFRESH_SECONDS,
+)
@@ -0,0 +1,312 @@
+"""
+Append-only, hash-chained audit log of PHI access.
+
+`audit_log.record(...)` is called on every read or analysis that decrypts
+patient data. It only writes into an in-memory ring, with no I/O on the
+request path. The ring has a single producer and a single consumer, both on
+the event loop, so it needs no locks; flushes are serialised so a batch is
+never written twice.
+
+A background flusher drains the ring in batches to the sink:
+- "file": JSON lines appended to segment files in AUDIT_DIR, fsynced per batch
+- "db": bulk insert into the `audit_log` table
+
+At flush time every event gets a sequence number, the previous record's
+hash, and its own `hash` (sha256 of its canonical JSON, prev_hash included).
+Each worker process writes its own chain (`chain_id`), so editing, reordering or removing a
+record breaks the chain. `verify_chain` and `scripts/verify_audit_log.py`
+check this. A batch that fails to write stays in the ring and is retried; the
+chain only advances once a batch is stored.
+
+Back-pressure: when the ring is full, `record()` waits for the flusher
+(AUDIT_ON_FULL="block") or drops the event (AUDIT_ON_FULL="drop"). Both
+cases are counted in the metrics.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.config import settings
+from app.database import get_db
+from app.services.executor import run_blocking_io
+
+logger = logging.getLogger(__name__)
+
+GENESIS_HASH = "0" * 64
+SEGMENT_PREFIX = "audit-"
+SEGMENT_SUFFIX = ".jsonl"
+HASHED_FIELDS = ("chain_id", "seq", "ts", "action", "actor", "resource_ids", "outcome", "detail", "prev_hash")
+
+
+def _canonical(record: Dict[str, Any]) -> bytes:
+    return json.dumps(
+        {field: record.get(field) for field in HASHED_FIELDS},
+        sort_keys=True, separators=(",", ":"), default=str,
+    ).encode("utf-8")
+
+
+def chain_hash(record: Dict[str, Any]) -> str:
+    """Hash of a record; covers prev_hash, so each record seals its predecessor"""
+    return hashlib.sha256(_canonical(record)).hexdigest()
+
+
+def verify_chain(records: Iterable[Dict[str, Any]]) -> List[str]:
+    """
+    Problems found in one chain's records (sorted by seq); empty if intact.
+    Catches edits, reordering, gaps and removed records. A truncated tail
+    is only caught by comparing the last hash with a copy kept elsewhere.
+    """
+    problems = []
+    expected_prev, expected_seq = GENESIS_HASH, 0
+    for record in records:
+        seq = record.get("seq")
+        if seq != expected_seq:
+            problems.append(f"seq {seq}: expected seq {expected_seq} (missing or reordered records)")
+        if record.get("prev_hash") != expected_prev:
+            problems.append(f"seq {seq}: prev_hash does not match the previous record")
+        if chain_hash(record) != record.get("hash"):
+            problems.append(f"seq {seq}: hash mismatch (record modified)")
+        expected_prev = record.get("hash")
+        expected_seq = (seq if isinstance(seq, int) else expected_seq) + 1
+    return problems
+
+
+class AuditRing:
+    """Fixed-size single-producer/single-consumer ring of pending events"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._slots: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self._head = 0  # Next slot to write (total events ever pushed)
+        self._tail = 0  # Next slot to read (total events ever flushed)
+
+    def __len__(self) -> int:
+        return self._head - self._tail
+
+    def push(self, event: Dict[str, Any]) -> bool:
+        if self._head - self._tail >= self.capacity:
+            return False
+        self._slots[self._head % self.capacity] = event
+        self._head += 1
+        return True
+
+    def peek(self, limit: int) -> List[Dict[str, Any]]:
+        count = min(limit, self._head - self._tail)
+        return [self._slots[(self._tail + i) % self.capacity] for i in range(count)]
+
+    def release(self, count: int):
+        for i in range(count):
+            self._slots[(self._tail + i) % self.capacity] = None
+        self._tail += count
+
+
+class FileSink:
+    """Appends records as JSON lines to size-rotated segment files"""
+
+    def __init__(self, directory: str, chain_id: str, segment_max_bytes: int, fsync: bool):
+        self.directory = Path(directory)
+        self.chain_id = chain_id
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self._segment = 0
+
+    def _path(self) -> Path:
+        return self.directory / f"{SEGMENT_PREFIX}{self.chain_id}-{self._segment:06d}{SEGMENT_SUFFIX}"
+
+    def write(self, records: List[Dict[str, Any]]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path()
+        if path.exists() and path.stat().st_size >= self.segment_max_bytes:
+            self._segment += 1
+            path = self._path()
+        data = "".join(json.dumps(record, default=str) + "\n" for record in records)
+        with open(path, "a", encoding="utf-8") as segment:
+            segment.write(data)
+            segment.flush()
+            if self.fsync:
+                os.fsync(segment.fileno())
+
+
+class DatabaseSink:
+    """Bulk-inserts records into the audit_log table"""
+
+    def write(self, records: List[Dict[str, Any]]):
+        get_db().table("audit_log").insert(records).execute()
+
+
+class AuditLog:
+    """Ring-buffered, asynchronously flushed, hash-chained audit trail"""
+
+    def __init__(
+        self,
+        sink,
+        chain_id: str,
+        capacity: int,
+        batch_size: int,
+        flush_interval: float,
+        on_full: str,
+    ):
+        self.sink = sink
+        self.chain_id = chain_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_full = on_full
+        self._ring = AuditRing(capacity)
+        self._seq = 0
+        self._prev_hash = GENESIS_HASH
+        self._wake: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+        self.metrics = {
+            "recorded": 0, "flushed": 0, "batches": 0, "flush_errors": 0,
+            "dropped": 0, "blocked": 0, "blocked_seconds": 0.0, "high_water": 0,
+        }
+
+    def _events(self):
+        # Created lazily so they bind to the running loop
+        if self._wake is None:
+            self._wake, self._space = asyncio.Event(), asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+        return self._wake, self._space
+
+    async def record(
+        self,
+        action: str,
+        resource_ids: Iterable[Any] = (),
+        actor: Optional[Any] = None,
+        outcome: str = "success",
+        **detail: Any,
+    ):
+        """Queue one access event (no I/O unless the ring is full)"""
+        if not settings.AUDIT_ENABLED:
+            return
+        event = {
+            "ts": time.time(),
+            "action": action,
+            "actor": str(actor) if actor is not None else None,
+            "resource_ids": [str(resource_id) for resource_id in resource_ids],
+            "outcome": outcome,
+            "detail": detail or None,
+        }
+        wake, space = self._events()
+        while not self._ring.push(event):
+            if self.on_full == "drop" or self._task is None:
+                self.metrics["dropped"] += 1
+                logger.error(f"Audit ring full; dropped {action} event")
+                return
+            self.metrics["blocked"] += 1
+            started = time.monotonic()
+            space.clear()
+            wake.set()
+            await space.wait()
+            self.metrics["blocked_seconds"] += time.monotonic() - started
+
+        self.metrics["recorded"] += 1
+        self.metrics["high_water"] = max(self.metrics["high_water"], len(self._ring))
+        if len(self._ring) >= self.batch_size:
+            wake.set()
+
+    def _seal(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        records, prev_hash = [], self._prev_hash
+        for offset, event in enumerate(events):
+            record = {"chain_id": self.chain_id, "seq": self._seq + offset, **event, "prev_hash": prev_hash}
+            record["hash"] = prev_hash = chain_hash(record)
+            records.append(record)
+        return records
+
+    async def flush(self) -> int:
+        """Write every queued event; returns how many were stored"""
+        self._events()
+        async with self._flush_lock:
+            return await self._flush_locked()
+
+    async def _flush_locked(self) -> int:
+        stored = 0
+        while len(self._ring):
+            events = self._ring.peek(self.batch_size)
+            records = self._seal(events)
+            try:
+                await run_blocking_io(self.sink.write, records)
+            except Exception as e:
+                self.metrics["flush_errors"] += 1
+                logger.error(f"Audit flush of {len(records)} record(s) failed, will retry: {e}")
+                break
+            self._seq += len(records)
+            self._prev_hash = records[-1]["hash"]
+            self._ring.release(len(records))
+            self.metrics["flushed"] += len(records)
+            self.metrics["batches"] += 1
+            stored += len(records)
+            self._events()[1].set()
+        return stored
+
+    async def _flush_loop(self):
+        wake, _ = self._events()
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._flush_loop())
+            logger.info(f"Audit log started (chain {self.chain_id}, sink {type(self.sink).__name__})")
+
+    async def stop(self):
+        """Stop the flusher and write out whatever is still queued"""
+        if self._task is not None:
+            # Not cancelled: a cancelled in-flight write would be written again
+            self._stopping = True
+            self._events()[0].set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if len(self._ring):
+            logger.error(f"Audit log stopped with {len(self._ring)} unflushed event(s)")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "chain_id": self.chain_id,
+            "sink": type(self.sink).__name__,
+            "queued": len(self._ring),
+            "capacity": self._ring.capacity,
+            "utilisation": len(self._ring) / self._ring.capacity,
+            "last_seq": self._seq - 1,
+            "last_hash": self._prev_hash,
+            **self.metrics,
+        }
+
+
+def _new_chain_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def _build_sink(chain_id: str):
+    if settings.AUDIT_SINK == "db":
+        return DatabaseSink()
+    return FileSink(settings.AUDIT_DIR, chain_id, settings.AUDIT_SEGMENT_MAX_BYTES, settings.AUDIT_FSYNC)
+
+
+_chain_id = _new_chain_id()
+
+audit_log = AuditLog(
+    sink=_build_sink(_chain_id),
+    chain_id=_chain_id,
+    capacity=settings.AUDIT_RING_CAPACITY,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+    on_full=settings.AUDIT_ON_FULL,
+)
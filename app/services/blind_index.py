@@ -0,0 +1,168 @@
+"""
+Blind index tokens for searching encrypted records.
+
+At intake time we derive keyed-HMAC tokens from selected plaintext fields
+and store them in the GIN-indexed `encrypted_records.blind_tokens` array:
+- text fields: one token per normalised word and per adjacent word pair,
+  namespaced by field and also under `any`
+- lab values: one token per fixed-width bucket (e.g. HbA1c in 0.5% steps)
+
+A search converts its predicates into the same tokens, lets Postgres find
+candidate rows by array containment/overlap, and only those candidates are
+decrypted and checked exactly. Without the key the tokens reveal nothing
+beyond equality of (field, word) or (field, bucket).
+"""
+import hashlib
+import hmac
+import math
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Set
+
+from app.config import settings
+
+# Lab field -> (bucket width, upper bound for open-ended range queries)
+RANGE_BUCKETS = {
+    "fasting_glucose": (10.0, 600.0),
+    "hba1c": (0.5, 20.0),
+    "blood_pressure_systolic": (10.0, 300.0),
+    "blood_pressure_diastolic": (10.0, 200.0),
+    "bmi": (2.0, 80.0),
+    "cholesterol_total": (20.0, 600.0),
+    "cholesterol_ldl": (20.0, 400.0),
+    "cholesterol_hdl": (10.0, 200.0),
+    "triglycerides": (25.0, 2000.0),
+}
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "for", "from", "has", "have", "in",
+    "is", "of", "on", "or", "the", "to", "with", "was", "since", "my", "i",
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+RANGE_OPERATORS = {
+    ">": lambda v, x: v > x,
+    ">=": lambda v, x: v >= x,
+    "<": lambda v, x: v < x,
+    "<=": lambda v, x: v <= x,
+}
+_RANGE_EXPR = re.compile(r"^\s*([a-z0-9_]+)\s*(>=|<=|>|<)\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+@dataclass
+class RangePredicate:
+    """`<lab field> <op> <value>`, e.g. hba1c > 9"""
+    field: str
+    op: str
+    value: float
+
+    @classmethod
+    def parse(cls, expression: str) -> "RangePredicate":
+        match = _RANGE_EXPR.match(expression.lower())
+        if not match:
+            raise ValueError(f"Invalid range expression: {expression!r} (expected e.g. 'hba1c>9')")
+        field, op, value = match.groups()
+        if field not in RANGE_BUCKETS:
+            raise ValueError(f"Field {field!r} has no range index")
+        return cls(field=field, op=op, value=float(value))
+
+    def matches(self, value: Any) -> bool:
+        if value is None:
+            return False
+        try:
+            return RANGE_OPERATORS[self.op](float(value), self.value)
+        except (TypeError, ValueError):
+            return False
+
+
+def normalize_words(text: Any) -> List[str]:
+    """Lower-cased words without stopwords, in order"""
+    if text is None:
+        return []
+    if isinstance(text, list):
+        text = " ".join(str(item) for item in text)
+    return [word for word in _WORD.findall(str(text).lower()) if word not in STOPWORDS]
+
+
+class BlindIndexer:
+    """Derives blind-index tokens from plaintext and from search predicates"""
+
+    def __init__(self, key: str, text_fields: Iterable[str]):
+        self._key = key.encode("utf-8")
+        self.text_fields = list(text_fields)
+
+    def _token(self, label: str) -> str:
+        return hmac.new(self._key, label.encode("utf-8"), hashlib.sha256).hexdigest()[:24]
+
+    # ------------------------------------------------------------------
+    # Indexing
+    # ------------------------------------------------------------------
+
+    def _text_labels(self, field: str, text: Any) -> Set[str]:
+        words = normalize_words(text)
+        terms = set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+        return {f"{scope}:t:{term}" for term in terms for scope in (field, "any")}
+
+    @staticmethod
+    def _bucket(field: str, value: float) -> int:
+        # Out-of-range values share the edge buckets so open-ended queries find them
+        width, upper = RANGE_BUCKETS[field]
+        return math.floor(min(max(value, 0.0), upper) / width)
+
+    def tokens_for_record(self, intake: Dict[str, Any], labs: Dict[str, Any]) -> List[str]:
+        """All blind tokens for one intake + lab result pair"""
+        labels = set()
+        for field in self.text_fields:
+            labels |= self._text_labels(field, intake.get(field))
+
+        for field in RANGE_BUCKETS:
+            value = labs.get(field)
+            try:
+                value = float(value) if value is not None else None
+            except (TypeError, ValueError):
+                value = None
+            if value is not None:
+                labels.add(f"{field}:r:{self._bucket(field, value)}")
+
+        return sorted(self._token(label) for label in labels)
+
+    # ------------------------------------------------------------------
+    # Querying
+    # ------------------------------------------------------------------
+
+    def text_query_tokens(self, text: str, field: str = "any") -> List[str]:
+        """
+        Tokens that must all be present for `text` to match. Adjacent word
+        pairs are included so "chest pain" does not match "pain in chest".
+        """
+        if field != "any" and field not in self.text_fields:
+            raise ValueError(f"Field {field!r} has no text index")
+        words = normalize_words(text)
+        terms = set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+        return sorted(self._token(f"{field}:t:{term}") for term in terms)
+
+    def range_query_tokens(self, predicate: RangePredicate) -> List[str]:
+        """Tokens for every bucket that may contain a matching value"""
+        width, upper = RANGE_BUCKETS[predicate.field]
+        if predicate.op in (">", ">="):
+            low, high = predicate.value, upper
+        else:
+            low, high = 0.0, predicate.value
+        first = self._bucket(predicate.field, low)
+        last = self._bucket(predicate.field, high)
+        return [self._token(f"{predicate.field}:r:{n}") for n in range(first, last + 1)]
+
+
+def text_matches(intake: Dict[str, Any], text: str, field: str, text_fields: List[str]) -> bool:
+    """Exact re-check of a text predicate on decrypted data"""
+    wanted = " ".join(normalize_words(text))
+    fields = text_fields if field == "any" else [field]
+    return any(wanted in " ".join(normalize_words(intake.get(name))) for name in fields)
+
+
+# Global instance
+blind_indexer = BlindIndexer(
+    key=settings.BLIND_INDEX_KEY,
+    text_fields=settings.BLIND_INDEX_TEXT_FIELDS,
+)
@@ -0,0 +1,160 @@
+"""
+Circuit breaker for the Gemini call.
+
+Tracks the outcome and latency of the last `window_size` calls. Once at
+least `min_calls` have been seen and either the failure rate or the
+slow-call rate crosses its threshold, the breaker opens and callers are
+rejected immediately (the AI service then serves the rule-based fallback).
+After `open_seconds` it goes half-open and lets up to `half_open_probes`
+real calls through: if they all succeed it closes, any failure re-opens it.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the dependency while the breaker is open"""
+
+
+class CircuitBreaker:
+    """Error-rate and latency based breaker around one async dependency"""
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int,
+        min_calls: int,
+        failure_rate_threshold: float,
+        slow_call_seconds: float,
+        slow_call_rate_threshold: float,
+        open_seconds: float,
+        half_open_probes: int,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        # (succeeded, duration) per call, most recent last
+        self._window: deque = deque(maxlen=window_size)
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._counters = {"calls": 0, "failures": 0, "slow": 0, "rejected": 0, "opened": 0}
+
+    # ------------------------------------------------------------------
+    # State machine
+    # ------------------------------------------------------------------
+
+    def _rates(self) -> Dict[str, float]:
+        calls = len(self._window)
+        if not calls:
+            return {"failure_rate": 0.0, "slow_call_rate": 0.0}
+        failures = sum(1 for ok, _ in self._window if not ok)
+        slow = sum(1 for _, duration in self._window if duration >= self.slow_call_seconds)
+        return {"failure_rate": failures / calls, "slow_call_rate": slow / calls}
+
+    def _open(self, reason: str):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._counters["opened"] += 1
+        logger.warning(f"Circuit '{self.name}' opened: {reason}")
+
+    def _close(self):
+        self.state = CLOSED
+        self._window.clear()
+        logger.info(f"Circuit '{self.name}' closed after {self._probe_successes} successful probe(s)")
+
+    def allow(self) -> bool:
+        """Whether a call may go through now (reserves a probe when half-open)"""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self.state = HALF_OPEN
+            logger.info(f"Circuit '{self.name}' half-open, probing")
+
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                return False
+            self._probes_in_flight += 1
+        return True
+
+    def record(self, succeeded: bool, duration: float):
+        slow = duration >= self.slow_call_seconds
+        self._counters["calls"] += 1
+        self._counters["failures"] += 0 if succeeded else 1
+        self._counters["slow"] += 1 if slow else 0
+
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+            if not succeeded or slow:
+                self._open("half-open probe failed" if not succeeded else f"half-open probe took {duration:.1f}s")
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self._close()
+            return
+
+        if self.state == OPEN:
+            # A call admitted before the breaker opened finished late
+            return
+
+        self._window.append((succeeded, duration))
+        if len(self._window) < self.min_calls:
+            return
+        rates = self._rates()
+        if rates["failure_rate"] >= self.failure_rate_threshold:
+            self._open(f"failure rate {rates['failure_rate']:.0%} over last {len(self._window)} calls")
+        elif rates["slow_call_rate"] >= self.slow_call_rate_threshold:
+            self._open(f"slow-call rate {rates['slow_call_rate']:.0%} (>= {self.slow_call_seconds}s)")
+
+    async def call(self, func: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """
+        Run `func()` through the breaker. Raises CircuitOpenError without
+        calling it while open; a timeout counts as a failure.
+        """
+        if not self.allow():
+            self._counters["rejected"] += 1
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(func(), timeout=timeout)
+        except asyncio.CancelledError:
+            # The caller went away; say nothing about the dependency's health
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+            raise
+        except Exception:
+            self.record(False, time.monotonic() - started)
+            raise
+        self.record(True, time.monotonic() - started)
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        retry_in = None
+        if self.state == OPEN:
+            retry_in = max(self.open_seconds - (time.monotonic() - self._opened_at), 0.0)
+        return {
+            "name": self.name,
+            "state": self.state,
+            "window_calls": len(self._window),
+            **self._rates(),
+            "probe_in_seconds": retry_in,
+            **self._counters,
+        }
@@ -0,0 +1,361 @@
+"""
+Streaming, de-identified cohort export.
+
+Pages through `encrypted_records` joined with `appointments` using keyset
+pagination, decrypts each page on the CPU pool and emits rows as NDJSON or
+Parquet. Only one page is held in memory at a time, and the `record_id`
+cursor after every page is a resumable checkpoint.
+
+Rows never carry appointment or patient IDs: each row gets a stable
+`subject_id` pseudonym (keyed HMAC of the appointment ID) instead, ages
+are banded unless `age` is requested explicitly, and free-text fields are
+only exported when asked for by name.
+
+Consultations whose hot rows were purged after archival are not exported.
+Their number is reported with every export as `archived_excluded` (a
+response header, Parquet file metadata, and the job checkpoint).
+"""
+import asyncio
+import hashlib
+import hmac
+import io
+import json
+import logging
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.models.schemas import LabResults
+from app.services.db_service import db_service
+from app.services.records import decrypt_patient_data
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_LAB_FIELDS = [
+    name for name in LabResults.model_fields if name != "test_notes"
+]
+FREE_TEXT_FIELDS = [
+    "chief_complaint",
+    "symptoms",
+    "symptom_duration",
+    "medical_history",
+    "current_medications",
+    "allergies",
+    "test_notes",
+]
+DEFAULT_FIELDS = ["age_band", "gender", *NUMERIC_LAB_FIELDS, "appointment_month", "status"]
+EXPORT_FIELDS = ["subject_id", "age", *DEFAULT_FIELDS, *FREE_TEXT_FIELDS]
+
+INTEGER_FIELDS = {"age", "blood_pressure_systolic", "blood_pressure_diastolic"}
+MIN_PSEUDONYM_KEY_LENGTH = 16
+
+
+def resolve_fields(fields: Optional[List[str]]) -> List[str]:
+    """Validate a field selection; `subject_id` is always included first"""
+    selected = fields or DEFAULT_FIELDS
+    unknown = [name for name in selected if name not in EXPORT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown export fields: {', '.join(unknown)}")
+    return ["subject_id"] + [name for name in dict.fromkeys(selected) if name != "subject_id"]
+
+
+def require_pseudonym_key():
+    """Pseudonyms are only safe with a secret key; refuse to export without one"""
+    key = settings.EXPORT_PSEUDONYM_KEY
+    if not key or len(key) < MIN_PSEUDONYM_KEY_LENGTH:
+        raise RuntimeError(
+            f"Cohort export requires EXPORT_PSEUDONYM_KEY (a secret of at least {MIN_PSEUDONYM_KEY_LENGTH} characters)"
+        )
+
+
+def pseudonymize(appointment_id: str) -> str:
+    """Stable, non-reversible subject identifier for an appointment"""
+    digest = hmac.new(
+        settings.EXPORT_PSEUDONYM_KEY.encode("utf-8"),
+        str(appointment_id).encode("utf-8"),
+        hashlib.sha256,
+    )
+    return digest.hexdigest()[:20]
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _age_band(age: Any) -> Optional[str]:
+    age = _as_int(age)
+    if age is None:
+        return None
+    if age >= 90:
+        return "90+"
+    low = age // 10 * 10
+    return f"{low}-{low + 9}"
+
+
+def _as_text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return "; ".join(str(item) for item in value)
+    return str(value)
+
+
+def build_export_row(
+    record: Dict[str, Any],
+    intake: Dict[str, Any],
+    labs: Dict[str, Any],
+    fields: List[str],
+) -> Dict[str, Any]:
+    """Project one decrypted record onto the selected, de-identified fields"""
+    appointment = record.get("appointments") or {}
+    appointment_time = str(appointment.get("appointment_time") or record.get("created_at") or "")
+
+    row = {}
+    for name in fields:
+        if name == "subject_id":
+            value = pseudonymize(record["appointment_id"])
+        elif name == "age":
+            # Ages over 89 are aggregated per Safe Harbor
+            age = _as_int(intake.get("age"))
+            value = min(age, 90) if age is not None else None
+        elif name == "age_band":
+            value = _age_band(intake.get("age"))
+        elif name == "appointment_month":
+            value = appointment_time[:7] or None
+        elif name == "status":
+            value = appointment.get("status")
+        elif name in NUMERIC_LAB_FIELDS:
+            # Client-encrypted submissions are not validated; drop what is not a number
+            value = _as_int(labs.get(name)) if name in INTEGER_FIELDS else _as_float(labs.get(name))
+        elif name == "test_notes":
+            value = _as_text(labs.get(name))
+        else:
+            value = _as_text(intake.get(name))
+        row[name] = value
+    return row
+
+
+async def iter_cohort_batches(
+    fields: List[str],
+    after: Optional[str] = None,
+    doctor_id: Optional[str] = None,
+    batch_size: Optional[int] = None,
+) -> AsyncIterator[Tuple[str, List[Dict[str, Any]]]]:
+    """Yield (cursor, rows) one page at a time"""
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    cursor = after
+
+    while True:
+        page = await db_service.list_encrypted_records_page(cursor, batch_size, doctor_id)
+        if not page:
+            return
+
+        decrypted = await asyncio.gather(
+            *(decrypt_patient_data(record) for record in page),
+            return_exceptions=True,
+        )
+
+        rows = []
+        for record, result in zip(page, decrypted):
+            if isinstance(result, Exception):
+                logger.warning(f"Skipping record {record.get('record_id')} in export: {result}")
+                continue
+            intake, labs = result
+            rows.append(build_export_row(record, intake, labs, fields))
+
+        cursor = page[-1]["record_id"]
+        yield cursor, rows
+
+        if len(page) < batch_size:
+            return
+
+
+# ============================================================================
+# Writers
+# ============================================================================
+
+async def count_archived_excluded(doctor_id: Optional[str] = None) -> int:
+    """Archived consultations (hot rows purged) that an export cannot include"""
+    return await db_service.count_purged_archived_consultations(doctor_id)
+
+
+def _parquet_schema(fields: List[str], archived_excluded: Optional[int] = None):
+    import pyarrow as pa
+
+    def field_type(name):
+        if name in INTEGER_FIELDS:
+            return pa.int64()
+        if name in NUMERIC_LAB_FIELDS:
+            return pa.float64()
+        return pa.string()
+
+    schema = pa.schema([(name, field_type(name)) for name in fields])
+    if archived_excluded is not None:
+        schema = schema.with_metadata({"archived_excluded": str(archived_excluded)})
+    return schema
+
+
+def require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package")
+
+
+async def stream_ndjson(fields: List[str], **kwargs) -> AsyncIterator[bytes]:
+    """
+    NDJSON rows, followed after each page by a `{"_checkpoint": cursor}`
+    line. Pass the last checkpoint back as `after` to resume.
+    """
+    async for cursor, rows in iter_cohort_batches(fields, **kwargs):
+        chunk = "".join(json.dumps(row) + "\n" for row in rows)
+        chunk += json.dumps({"_checkpoint": cursor}) + "\n"
+        yield chunk.encode("utf-8")
+
+
+async def stream_parquet(
+    fields: List[str],
+    archived_excluded: Optional[int] = None,
+    **kwargs,
+) -> AsyncIterator[bytes]:
+    """A single Parquet file, one row group per page, flushed as it is written"""
+    require_pyarrow()
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(fields, archived_excluded)
+    sink = io.BytesIO()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    try:
+        async for _, rows in iter_cohort_batches(fields, **kwargs):
+            if rows:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            data = drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield drain()
+
+
+# ============================================================================
+# Resumable file export
+# ============================================================================
+
+class CohortExportJob:
+    """
+    Export to a directory with a checkpoint after every page.
+
+    NDJSON is appended to `cohort.ndjson`; the checkpoint records the byte
+    offset, so a crash mid-page is truncated away on resume. Parquet is
+    written as one `part-NNNNN.parquet` file per page, closed before the
+    checkpoint is saved.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        fmt: str = "ndjson",
+        fields: Optional[List[str]] = None,
+        doctor_id: Optional[str] = None,
+        batch_size: Optional[int] = None,
+    ):
+        if fmt not in ("ndjson", "parquet"):
+            raise ValueError(f"Unsupported export format: {fmt}")
+        require_pseudonym_key()
+        if fmt == "parquet":
+            require_pyarrow()
+        self.output_dir = Path(output_dir)
+        self.fmt = fmt
+        self.fields = resolve_fields(fields)
+        self.doctor_id = doctor_id
+        self.batch_size = batch_size
+        self.checkpoint_path = self.output_dir / "checkpoint.json"
+
+    def load_checkpoint(self) -> Dict[str, Any]:
+        if not self.checkpoint_path.exists():
+            return {"after": None, "rows": 0, "parts": 0, "bytes": 0}
+        checkpoint = json.loads(self.checkpoint_path.read_text())
+        if checkpoint.get("fields") != self.fields or checkpoint.get("format") != self.fmt:
+            raise ValueError("Existing checkpoint was written with different fields or format")
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint: Dict[str, Any]):
+        checkpoint.update(fields=self.fields, format=self.fmt, doctor_id=self.doctor_id)
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(checkpoint, indent=2))
+        tmp_path.replace(self.checkpoint_path)
+
+    async def run(self) -> Dict[str, Any]:
+        """Run (or resume) the export and return the final checkpoint"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        checkpoint = self.load_checkpoint()
+        if checkpoint.get("done"):
+            logger.info(f"Cohort export in {self.output_dir} already complete")
+            return checkpoint
+
+        checkpoint["archived_excluded"] = await count_archived_excluded(self.doctor_id)
+
+        if self.fmt == "ndjson":
+            await self._run_ndjson(checkpoint)
+        else:
+            await self._run_parquet(checkpoint)
+
+        checkpoint["done"] = True
+        self.save_checkpoint(checkpoint)
+        logger.info(
+            f"Cohort export complete: {checkpoint['rows']} rows in {self.output_dir} "
+            f"({checkpoint['archived_excluded']} archived consultations excluded)"
+        )
+        return checkpoint
+
+    def _batches(self, checkpoint):
+        return iter_cohort_batches(
+            self.fields,
+            after=checkpoint["after"],
+            doctor_id=self.doctor_id,
+            batch_size=self.batch_size,
+        )
+
+    async def _run_ndjson(self, checkpoint: Dict[str, Any]):
+        path = self.output_dir / "cohort.ndjson"
+        with open(path, "ab") as out:
+            # Drop anything written after the last checkpoint
+            out.truncate(checkpoint["bytes"])
+            out.seek(checkpoint["bytes"])
+            async for cursor, rows in self._batches(checkpoint):
+                out.write("".join(json.dumps(row) + "\n" for row in rows).encode("utf-8"))
+                out.flush()
+                checkpoint.update(after=cursor, rows=checkpoint["rows"] + len(rows), bytes=out.tell())
+                self.save_checkpoint(checkpoint)
+
+    async def _run_parquet(self, checkpoint: Dict[str, Any]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = _parquet_schema(self.fields, checkpoint["archived_excluded"])
+        async for cursor, rows in self._batches(checkpoint):
+            if rows:
+                part = self.output_dir / f"part-{checkpoint['parts']:05d}.parquet"
+                pq.write_table(pa.Table.from_pylist(rows, schema=schema), part, compression="zstd")
+                checkpoint["parts"] += 1
+            checkpoint.update(after=cursor, rows=checkpoint["rows"] + len(rows))
+            self.save_checkpoint(checkpoint)
@@ -0,0 +1,160 @@
+"""
+Compress-then-encrypt for stored payloads.
+
+Plaintext JSON above `COMPRESSION_MIN_BYTES` is zstd-compressed (with the
+trained clinical-JSON dictionary when one is available) before it is
+encrypted. The codec is recorded in the ciphertext header:
+
+    zstd:<dict_id>:<base64 ciphertext>     (dict_id 0 = no dictionary)
+
+Ciphertexts without a header are the original uncompressed format and are
+read exactly as before. Dictionaries live in `COMPRESSION_DICTIONARY_DIR`;
+the newest file is used for writing and every file is loaded for reading,
+so a retired dictionary must be kept for as long as rows reference it.
+"""
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.config import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_ZSTD = "zstd"
+DICTIONARY_SUFFIX = ".zdict"
+
+
+def split_header(ciphertext: str) -> Tuple[Optional[str], int, str]:
+    """Split a ciphertext into (codec, dict_id, body); codec is None for legacy data"""
+    # ':' never occurs in base64, so a header is unambiguous
+    if not isinstance(ciphertext, str) or not ciphertext.startswith(CODEC_ZSTD + ":"):
+        return None, 0, ciphertext
+    codec, dict_id, body = ciphertext.split(":", 2)
+    return codec, int(dict_id), body
+
+
+def join_header(codec: str, dict_id: int, body: str) -> str:
+    return f"{codec}:{dict_id}:{body}"
+
+
+def train_dictionary(samples: Iterable[bytes], size: int) -> bytes:
+    """Train a zstd dictionary from representative plaintext payloads"""
+    if zstandard is None:
+        raise RuntimeError("Training a compression dictionary requires the 'zstandard' package")
+    return zstandard.train_dictionary(size, list(samples)).as_bytes()
+
+
+class PayloadCodec:
+    """Compresses plaintext before encryption and reverses it on read"""
+
+    def __init__(
+        self,
+        enabled: bool,
+        min_bytes: int,
+        level: int,
+        dictionary_dir: Optional[str] = None,
+    ):
+        self.enabled = enabled and zstandard is not None
+        self.min_bytes = min_bytes
+        self.level = level
+        self.dictionary_dir = Path(dictionary_dir) if dictionary_dir else None
+        self._dictionaries: Dict[int, "zstandard.ZstdCompressionDict"] = {}
+        self._write_dict_id = 0
+        # Compressor/decompressor objects are not safe for concurrent use
+        self._local = threading.local()
+        self.stats = {"compressed": 0, "skipped": 0, "bytes_in": 0, "bytes_out": 0}
+
+        if enabled and zstandard is None:
+            logger.warning("COMPRESSION_ENABLED is set but 'zstandard' is not installed; storing uncompressed")
+        if zstandard is not None:
+            self.load_dictionaries()
+
+    def load_dictionaries(self):
+        """(Re)load every dictionary on disk; the newest one is used for writes"""
+        self._dictionaries = {}
+        self._write_dict_id = 0
+        self._local = threading.local()
+        if not self.dictionary_dir or not self.dictionary_dir.is_dir():
+            return
+
+        for path in sorted(self.dictionary_dir.glob(f"*{DICTIONARY_SUFFIX}")):
+            dictionary = zstandard.ZstdCompressionDict(path.read_bytes())
+            dict_id = dictionary.dict_id()
+            if dict_id == 0:
+                logger.warning(f"Ignoring {path}: not a trained zstd dictionary")
+                continue
+            self._dictionaries[dict_id] = dictionary
+            self._write_dict_id = dict_id
+
+        if self._dictionaries:
+            self._dictionaries[self._write_dict_id].precompute_compress(level=self.level)
+            logger.info(f"Loaded {len(self._dictionaries)} compression dictionaries (writing with {self._write_dict_id})")
+
+    # ------------------------------------------------------------------
+    # Per-thread zstd contexts
+    # ------------------------------------------------------------------
+
+    def _compressor(self):
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            dictionary = self._dictionaries.get(self._write_dict_id)
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary, write_content_size=True)
+            self._local.compressor = compressor
+        return compressor
+
+    def _decompressor(self, dict_id: int):
+        decompressors = getattr(self._local, "decompressors", None)
+        if decompressors is None:
+            decompressors = self._local.decompressors = {}
+        decompressor = decompressors.get(dict_id)
+        if decompressor is None:
+            if dict_id and dict_id not in self._dictionaries:
+                raise ValueError(f"Compression dictionary {dict_id} is not available")
+            decompressor = zstandard.ZstdDecompressor(dict_data=self._dictionaries.get(dict_id))
+            decompressors[dict_id] = decompressor
+        return decompressor
+
+    # ------------------------------------------------------------------
+    # Encode / decode
+    # ------------------------------------------------------------------
+
+    def compress(self, plaintext: bytes) -> Tuple[Optional[str], int, bytes]:
+        """
+        Returns (codec, dict_id, payload). Small payloads, and payloads that
+        do not shrink, are returned unchanged with codec None.
+        """
+        if not self.enabled or len(plaintext) < self.min_bytes:
+            self.stats["skipped"] += 1
+            return None, 0, plaintext
+
+        compressed = self._compressor().compress(plaintext)
+        if len(compressed) >= len(plaintext):
+            self.stats["skipped"] += 1
+            return None, 0, plaintext
+
+        self.stats["compressed"] += 1
+        self.stats["bytes_in"] += len(plaintext)
+        self.stats["bytes_out"] += len(compressed)
+        return CODEC_ZSTD, self._write_dict_id, compressed
+
+    def decompress(self, codec: str, dict_id: int, payload: bytes) -> bytes:
+        if codec != CODEC_ZSTD:
+            raise ValueError(f"Unknown payload codec: {codec}")
+        if zstandard is None:
+            raise RuntimeError("Reading compressed payloads requires the 'zstandard' package")
+        return self._decompressor(dict_id).decompress(payload)
+
+
+# Global instance
+payload_codec = PayloadCodec(
+    enabled=settings.COMPRESSION_ENABLED,
+    min_bytes=settings.COMPRESSION_MIN_BYTES,
+    level=settings.COMPRESSION_LEVEL,
+    dictionary_dir=settings.COMPRESSION_DICTIONARY_DIR,
+)
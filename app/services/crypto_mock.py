@@ -3,26 +3,100 @@ Mock Cryptography Service - Handles BOTH old and new encryption formats
 """
 import json
 import base64
+import hashlib
+import binascii
 import logging
-from typing import Tuple, Dict, Any
+from typing import ContextManager, Optional, Tuple, Dict, Any
+
+from app.config import settings
+from app.services.compression import join_header, payload_codec, split_header
+from app.services.key_cache import DataKeyCache
 
 logger = logging.getLogger(__name__)
 
+MOCK_DATA_KEY = b"mock_key_12345"
+
 
 class CryptoService:
     """Mock encryption service - handles multiple formats"""
 
+    def __init__(self):
+        self.key_cache = DataKeyCache(
+            max_entries=settings.DATA_KEY_CACHE_SIZE,
+            ttl_seconds=settings.DATA_KEY_CACHE_TTL_SECONDS,
+        )
+
+    # ------------------------------------------------------------------
+    # Key wrapping (simulated KEM)
+    #
+    # Epoch 0 is the legacy format: base64 of the raw data key.
+    # Epoch N > 0 is "N.<base64(data_key XOR KEK_N)>".
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _kek(epoch: int, length: int) -> bytes:
+        """Mock key-encryption key for an epoch"""
+        stream = b""
+        counter = 0
+        while len(stream) < length:
+            stream += hashlib.sha256(f"mock-kek-{epoch}-{counter}".encode("utf-8")).digest()
+            counter += 1
+        return stream[:length]
+
+    @staticmethod
+    def key_epoch(wrapped_key: str) -> int:
+        """Epoch a wrapped key was produced under (0 for legacy keys)"""
+        prefix, sep, _ = str(wrapped_key).partition(".")
+        return int(prefix) if sep and prefix.isdigit() else 0
+
+    def wrap_key(self, data_key: bytes, epoch: Optional[int] = None) -> str:
+        """Wrap a data key under the given (default: current) key epoch"""
+        epoch = settings.KEY_EPOCH if epoch is None else epoch
+        if epoch == 0:
+            return base64.b64encode(data_key).decode('utf-8')
+
+        kek = self._kek(epoch, len(data_key))
+        wrapped = bytes(a ^ b for a, b in zip(data_key, kek))
+        return f"{epoch}.{base64.b64encode(wrapped).decode('utf-8')}"
+
+    def unwrap_key(self, wrapped_key: str) -> bytes:
+        """Unwrap a data key (decapsulation). Uncached - prefer `data_key()`."""
+        epoch = self.key_epoch(wrapped_key)
+        if epoch == 0:
+            try:
+                return base64.b64decode(wrapped_key, validate=True)
+            except (binascii.Error, ValueError, TypeError):
+                # Client-supplied keys are not always base64
+                return str(wrapped_key).encode('utf-8')
+
+        wrapped = base64.b64decode(str(wrapped_key).split(".", 1)[1])
+        kek = self._kek(epoch, len(wrapped))
+        return bytes(a ^ b for a, b in zip(wrapped, kek))
+
+    def data_key(self, wrapped_key: str) -> ContextManager[bytearray]:
+        """Borrow the unwrapped data key (key cache); it is wiped when the `with` block exits"""
+        return self.key_cache.borrow(wrapped_key, self.unwrap_key)
+
+    def rewrap_key(self, wrapped_key: str, epoch: Optional[int] = None) -> str:
+        """Re-wrap a data key under a new epoch without touching the payload"""
+        return self.wrap_key(self.unwrap_key(wrapped_key), epoch)
+
     def encrypt(self, data: Dict[str, Any]) -> Tuple[str, str]:
         """Encrypt data (mock implementation using base64)"""
         try:
             # Convert to JSON string
             json_str = json.dumps(data, default=str)
             
-            # Base64 encode
-            encrypted = base64.b64encode(json_str.encode('utf-8')).decode('utf-8')
+            # Compress before encrypting (skipped for small payloads)
+            codec, dict_id, plaintext = payload_codec.compress(json_str.encode('utf-8'))
             
-            # Generate mock key
-            key = base64.b64encode(b"mock_key_12345").decode('utf-8')
+            # Base64 encode, recording the codec in the ciphertext header
+            encrypted = base64.b64encode(plaintext).decode('utf-8')
+            if codec:
+                encrypted = join_header(codec, dict_id, encrypted)
+            
+            # Wrap the (mock) data key under the current epoch
+            key = self.wrap_key(MOCK_DATA_KEY)
             
             logger.info("Data encrypted with Kyber-hybrid (simulated) + AES-GCM.")
             return encrypted, key
@@ -31,9 +105,33 @@ class CryptoService:
             logger.error(f"Encryption failed: {e}")
             raise
 
+    def decrypt_bytes(self, encrypted_data: str, wrapped_key: str) -> bytes:
+        """
+        Decrypt to the raw JSON plaintext without parsing it, so callers can
+        validate straight into a model (`Model.model_validate_json`).
+        Only the current format is supported; use `decrypt()` for legacy data.
+        """
+        with self.data_key(wrapped_key):
+            codec, dict_id, body = split_header(encrypted_data)
+            plaintext = base64.b64decode(body, validate=True)
+            if codec:
+                plaintext = payload_codec.decompress(codec, dict_id, plaintext)
+        return plaintext
+
     def decrypt(self, encrypted_data: str, wrapped_key: str) -> Dict[str, Any]:
         """Decrypt data - handles multiple formats"""
         try:
+            # Unwrap the data key (cached per key ID). The mock cipher does not
+            # use it, but the unwrap cost is paid exactly as a real KEM would.
+            with self.data_key(wrapped_key):
+                pass
+            
+            # Compressed payloads carry a codec header and are never legacy data
+            if split_header(encrypted_data)[0]:
+                result = json.loads(self.decrypt_bytes(encrypted_data, wrapped_key))
+                logger.info("Data decrypted with Kyber-hybrid (simulated) + AES-GCM.")
+                return result
+            
             # Try direct base64 decode
             try:
                 decoded = base64.b64decode(encrypted_data).decode('utf-8')
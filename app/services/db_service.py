@@ -1,17 +1,42 @@
 """Database service for Supabase operations"""
+from collections import Counter
 from datetime import datetime
 from uuid import UUID, uuid4
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 import logging
 
+from app.config import settings
 from app.database import get_db
+from app.services.archive import consultation_archive
+from app.services.executor import run_blocking_io
+from app.services.result_hub import result_hub
+from app.services.shared_cache import shared_cache
+from app.services.write_coalescer import write_coalescer
 
 logger = logging.getLogger(__name__)
 
 
+def _embedded_one(value):
+    # PostgREST embeds a one-to-one relation as an object or a 0/1-item list
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _has_result(apt: Dict[str, Any]) -> bool:
+    # Archived appointments keep their result in the archive, not the hot table
+    return _embedded_one(apt.get("consultation_results")) is not None or apt.get("archived_at") is not None
+
+
 class DatabaseService:
     """Service for all database operations"""
     
+    async def _insert(self, table: str, row: Dict[str, Any]):
+        """Insert one row, via the write coalescer when enabled"""
+        if settings.DB_WRITE_COALESCING_ENABLED:
+            return await write_coalescer.insert(table, row)
+        return await run_blocking_io(get_db().table(table).insert(row).execute)
+    
     async def create_appointment(
         self,
         patient_id: Optional[UUID],
@@ -20,7 +45,6 @@ class DatabaseService:
     ) -> UUID:
         """Create a new appointment"""
         try:
-            db = get_db()
             appointment_id = uuid4()
             
             appointment_data = {
@@ -35,7 +59,7 @@ class DatabaseService:
             if patient_id:
                 appointment_data["patient_id"] = str(patient_id)
             
-            result = db.table("appointments").insert(appointment_data).execute()
+            await self._insert("appointments", appointment_data)
             
             logger.info(f"Created appointment {appointment_id}")
             return appointment_id
@@ -50,11 +74,10 @@ class DatabaseService:
         encrypted_intake: str,
         encrypted_lab_results: str,
         wrapped_key: str,
+        blind_tokens: Optional[List[str]] = None,
     ):
-        """Store encrypted patient intake data"""
+        """Store encrypted patient intake data (plus blind-index search tokens)"""
         try:
-            db = get_db()
-            
             # Create encrypted package
             encrypted_data = {
                 "encrypted_intake": encrypted_intake,
@@ -73,7 +96,10 @@ class DatabaseService:
                 "created_at": datetime.now().isoformat()
             }
             
-            result = db.table("encrypted_records").insert(record_data).execute()
+            if blind_tokens is not None:
+                record_data["blind_tokens"] = blind_tokens
+            
+            await self._insert("encrypted_records", record_data)
             
             logger.info(f"Stored encrypted record for appointment {appointment_id}")
             
@@ -86,15 +112,20 @@ class DatabaseService:
         try:
             db = get_db()
             
-            result = db.table("encrypted_records")\
+            result = await run_blocking_io(db.table("encrypted_records")\
                 .select("*")\
                 .eq("appointment_id", str(appointment_id))\
-                .execute()
+                .execute)
             
-            if not result.data:
+            if result.data:
+                return result.data[0]
+            
+            # Old consultations live in the cold archive
+            archived = await consultation_archive.get_encrypted_record(appointment_id)
+            if archived is None:
                 raise Exception(f"No encrypted record found for appointment {appointment_id}")
             
-            return result.data[0]
+            return archived
             
         except Exception as e:
             logger.error(f"Failed to get encrypted record: {e}")
@@ -105,10 +136,10 @@ class DatabaseService:
         try:
             db = get_db()
             
-            result = db.table("appointments")\
+            result = await run_blocking_io(db.table("appointments")\
                 .select("*")\
                 .eq("appointment_id", str(appointment_id))\
-                .execute()
+                .execute)
             
             if not result.data:
                 raise Exception(f"No appointment found with ID {appointment_id}")
@@ -124,36 +155,88 @@ class DatabaseService:
         try:
             db = get_db()
             
-            # Get appointments
-            appointments = db.table("appointments")\
-                .select("*")\
+            # Get appointments, with their result (if any) embedded in the same query
+            appointments = await run_blocking_io(db.table("appointments")\
+                .select("*, consultation_results(result_id)")\
                 .eq("doctor_id", str(doctor_id))\
                 .order("appointment_time", desc=True)\
-                .execute()
+                .execute)
             
-            # Check which have results
-            result_list = []
-            for apt in appointments.data:
-                apt_id = apt["appointment_id"]
-                
-                # Check if has consultation result
-                has_result = db.table("consultation_results")\
-                    .select("result_id")\
-                    .eq("appointment_id", apt_id)\
-                    .execute()
-                
-                result_list.append({
-                    "appointment_id": apt_id,
+            return [
+                {
+                    "appointment_id": apt["appointment_id"],
+                    "patient_id": apt.get("patient_id"),
+                    "appointment_time": apt["appointment_time"],
+                    "status": apt["status"],
+                    "has_result": _has_result(apt)
+                }
+                for apt in appointments.data
+            ]
+            
+        except Exception as e:
+            logger.error(f"Failed to list appointments: {e}")
+            raise
+    
+    async def list_doctor_dashboard_page(
+        self,
+        doctor_id: UUID,
+        limit: int,
+        offset: int,
+        status: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        One page of a doctor's appointments (newest first) with the
+        encrypted record and result flag embedded, plus the total count,
+        in a single query.
+        """
+        try:
+            db = get_db()
+            
+            query = db.table("appointments")\
+                .select("appointment_id, patient_id, appointment_time, status, archived_at, "
+                        "encrypted_records(encrypted_blob, wrapped_key), consultation_results(result_id)",
+                        count="exact")\
+                .eq("doctor_id", str(doctor_id))\
+                .order("appointment_time", desc=True)\
+                .range(offset, offset + limit - 1)
+            
+            if status:
+                query = query.eq("status", status)
+            
+            result = await run_blocking_io(query.execute)
+            
+            rows = []
+            for apt in result.data:
+                rows.append({
+                    "appointment_id": apt["appointment_id"],
                     "patient_id": apt.get("patient_id"),
                     "appointment_time": apt["appointment_time"],
                     "status": apt["status"],
-                    "has_result": len(has_result.data) > 0
+                    "has_result": _has_result(apt),
+                    "encrypted_record": _embedded_one(apt.get("encrypted_records")),
                 })
             
-            return result_list
+            total = result.count if result.count is not None else offset + len(rows)
+            return rows, total
             
         except Exception as e:
-            logger.error(f"Failed to list appointments: {e}")
+            logger.error(f"Failed to load dashboard page: {e}")
+            raise
+    
+    async def count_doctor_appointments_by_status(self, doctor_id: UUID) -> Dict[str, int]:
+        """Appointment counts per status for a doctor (status column only)"""
+        try:
+            db = get_db()
+            
+            result = await run_blocking_io(db.table("appointments")\
+                .select("status")\
+                .eq("doctor_id", str(doctor_id))\
+                .execute)
+            
+            return dict(Counter(row["status"] for row in result.data))
+            
+        except Exception as e:
+            logger.error(f"Failed to count appointments: {e}")
             raise
     
     async def store_consultation_result(
@@ -175,51 +258,123 @@ class DatabaseService:
                 "created_at": datetime.now().isoformat()
             }
             
-            db.table("consultation_results").insert(result_data).execute()
+            await run_blocking_io(db.table("consultation_results").insert(result_data).execute)
             
             # Update appointment status
-            db.table("appointments")\
+            await run_blocking_io(db.table("appointments")\
                 .update({"status": "completed"})\
                 .eq("appointment_id", str(appointment_id))\
-                .execute()
+                .execute)
             
             logger.info(f"Stored consultation result for appointment {appointment_id}")
             
+            # Wake patients long-polling / streaming for this result, here
+            # and (via the shared cache) in the other workers
+            result_hub.notify(appointment_id)
+            shared_cache.set("result_ready", appointment_id, True, ttl=settings.RESULT_STREAM_MAX_SECONDS)
+            shared_cache.publish(appointment_id)
+            
         except Exception as e:
             logger.error(f"Failed to store consultation result: {e}")
             raise
     
     async def get_consultation_result(self, appointment_id: UUID) -> Optional[Dict[str, Any]]:
-        """Get consultation result for an appointment"""
+        """Get consultation result for an appointment (cached once it exists)"""
         try:
+            cached = shared_cache.get("result", appointment_id)
+            if cached is not None:
+                return cached
+            
             db = get_db()
             
-            result = db.table("consultation_results")\
+            result = await run_blocking_io(db.table("consultation_results")\
                 .select("*, doctors(name)")\
                 .eq("appointment_id", str(appointment_id))\
-                .execute()
+                .execute)
             
-            if not result.data:
+            row = result.data[0] if result.data else None
+            if row is None:
+                # Old consultations live in the cold archive
+                row = await consultation_archive.get_consultation_result(appointment_id)
+            if row is None:
                 return None
             
-            return result.data[0]
+            # Results are write-once, and the cached row is still ciphertext
+            shared_cache.set("result", appointment_id, row, ttl=settings.RESULT_CACHE_TTL_SECONDS)
+            return row
             
         except Exception as e:
             logger.error(f"Failed to get consultation result: {e}")
             raise
     
+    async def get_consultation_result_version(self, appointment_id: UUID) -> Optional[str]:
+        """result_id of an appointment's result, without fetching the ciphertext"""
+        try:
+            cached = shared_cache.get("result", appointment_id)
+            if cached is not None:
+                return cached["result_id"]
+            
+            db = get_db()
+            
+            result = await run_blocking_io(db.table("consultation_results")\
+                .select("result_id")\
+                .eq("appointment_id", str(appointment_id))\
+                .execute)
+            
+            if result.data:
+                return result.data[0]["result_id"]
+            
+            archived = await consultation_archive.get_consultation_result(appointment_id)
+            return archived["result_id"] if archived else None
+            
+        except Exception as e:
+            logger.error(f"Failed to get consultation result version: {e}")
+            raise
+    
+    async def get_record_version(self, appointment_id: UUID) -> Optional[Dict[str, Any]]:
+        """record_id and appointment status, without fetching the ciphertext"""
+        try:
+            db = get_db()
+            
+            result = await run_blocking_io(db.table("appointments")\
+                .select("status, archived_at, encrypted_records(record_id)")\
+                .eq("appointment_id", str(appointment_id))\
+                .execute)
+            
+            if not result.data:
+                return None
+            
+            appointment = result.data[0]
+            record = _embedded_one(appointment.get("encrypted_records"))
+            if record is None and appointment.get("archived_at"):
+                record = await consultation_archive.get_encrypted_record(appointment_id)
+            if record is None:
+                return None
+            
+            return {"record_id": record["record_id"], "status": appointment["status"]}
+            
+        except Exception as e:
+            logger.error(f"Failed to get record version: {e}")
+            raise
+    
     async def get_doctor_name(self, doctor_id: UUID) -> str:
         """Get doctor's name"""
         try:
+            cached = shared_cache.get("doctor", doctor_id)
+            if cached is not None:
+                return cached
+            
             db = get_db()
             
-            result = db.table("doctors")\
+            result = await run_blocking_io(db.table("doctors")\
                 .select("name")\
                 .eq("doctor_id", str(doctor_id))\
-                .execute()
+                .execute)
             
             if result.data:
-                return result.data[0]["name"]
+                name = result.data[0]["name"]
+                shared_cache.set("doctor", doctor_id, name, ttl=settings.DOCTOR_DIRECTORY_TTL_SECONDS)
+                return name
             else:
                 return "Dr. Smith"  # Fallback
                 
@@ -227,6 +382,435 @@ class DatabaseService:
             logger.warning(f"Failed to get doctor name: {e}")
             return "Dr. Smith"
 
+    
+    async def list_doctors(self) -> List[Dict[str, Any]]:
+        """The doctor directory (ID and name)"""
+        try:
+            db = get_db()
+            
+            result = await run_blocking_io(db.table("doctors")\
+                .select("doctor_id, name")\
+                .execute)
+            
+            return result.data
+            
+        except Exception as e:
+            logger.error(f"Failed to list doctors: {e}")
+            raise
+    
+    async def get_idempotency_record(self, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        """Get the stored response for an Idempotency-Key"""
+        try:
+            db = get_db()
+            
+            result = await run_blocking_io(db.table("idempotency_keys")\
+                .select("request_hash, response")\
+                .eq("idempotency_key", idempotency_key)\
+                .execute)
+            
+            if not result.data:
+                return None
+            
+            return result.data[0]
+            
+        except Exception as e:
+            logger.warning(f"Failed to get idempotency record: {e}")
+            return None
+    
+    async def store_idempotency_record(
+        self,
+        idempotency_key: str,
+        request_hash: str,
+        response: Dict[str, Any],
+    ):
+        """Store the response for an Idempotency-Key"""
+        try:
+            db = get_db()
+            
+            record_data = {
+                "idempotency_key": idempotency_key,
+                "request_hash": request_hash,
+                "response": response,
+                "created_at": datetime.now().isoformat()
+            }
+            
+            await run_blocking_io(db.table("idempotency_keys").upsert(record_data).execute)
+            
+            logger.info(f"Stored idempotency record {idempotency_key}")
+            
+        except Exception as e:
+            logger.error(f"Failed to store idempotency record: {e}")
+            raise
+
+    
+    async def list_wrapped_keys(
+        self,
+        table: str,
+        id_column: str,
+        after_id: Optional[str],
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        """Page through (id, wrapped_key) pairs in primary-key order"""
+        try:
+            db = get_db()
+            
+            query = db.table(table)\
+                .select(f"{id_column}, wrapped_key")\
+                .order(id_column)\
+                .limit(limit)
+            
+            if after_id:
+                query = query.gt(id_column, after_id)
+            
+            return (await run_blocking_io(query.execute)).data
+            
+        except Exception as e:
+            logger.error(f"Failed to list wrapped keys from {table}: {e}")
+            raise
+    
+    async def update_wrapped_key(
+        self,
+        table: str,
+        id_column: str,
+        row_id: str,
+        old_wrapped_key: str,
+        new_wrapped_key: str,
+    ) -> bool:
+        """
+        Replace a row's wrapped_key, only if it still holds `old_wrapped_key`.
+        Returns False if the row changed underneath us.
+        """
+        try:
+            db = get_db()
+            
+            result = await run_blocking_io(db.table(table)\
+                .update({"wrapped_key": new_wrapped_key})\
+                .eq(id_column, row_id)\
+                .eq("wrapped_key", old_wrapped_key)\
+                .execute)
+            
+            return len(result.data) > 0
+            
+        except Exception as e:
+            logger.error(f"Failed to update wrapped key in {table}: {e}")
+            raise
+
+    
+    async def list_encrypted_records_page(
+        self,
+        after_record_id: Optional[str],
+        limit: int,
+        doctor_id: Optional[UUID] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Page through encrypted_records joined with their appointment,
+        in record_id order (keyset pagination, no OFFSET scans).
+        """
+        try:
+            db = get_db()
+            
+            query = db.table("encrypted_records")\
+                .select("record_id, appointment_id, encrypted_blob, wrapped_key, created_at, "
+                        "appointments!inner(doctor_id, appointment_time, status)")\
+                .order("record_id")\
+                .limit(limit)
+            
+            if after_record_id:
+                query = query.gt("record_id", after_record_id)
+            if doctor_id:
+                query = query.eq("appointments.doctor_id", str(doctor_id))
+            
+            return (await run_blocking_io(query.execute)).data
+            
+        except Exception as e:
+            logger.error(f"Failed to page encrypted records: {e}")
+            raise
+
+    async def list_consultation_results_page(
+        self,
+        after_result_id: Optional[str],
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        """Page through consultation_results in result_id order"""
+        try:
+            db = get_db()
+            
+            query = db.table("consultation_results")\
+                .select("result_id, encrypted_result, wrapped_key")\
+                .order("result_id")\
+                .limit(limit)
+            
+            if after_result_id:
+                query = query.gt("result_id", after_result_id)
+            
+            return (await run_blocking_io(query.execute)).data
+            
+        except Exception as e:
+            logger.error(f"Failed to page consultation results: {e}")
+            raise
+
+    
+    async def list_encrypted_records_since(
+        self,
+        created_from: Optional[str],
+        after: Optional[Tuple[str, str]],
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        Page through encrypted_records (joined with their appointment) in
+        (created_at, record_id) order, for incremental consumers that keep a
+        watermark. The first page starts at `created_from` (inclusive); later
+        pages pass the last row's (created_at, record_id) as `after`, so rows
+        sharing a timestamp are never split across a page boundary.
+        """
+        try:
+            db = get_db()
+            
+            query = db.table("encrypted_records")\
+                .select("record_id, appointment_id, encrypted_blob, wrapped_key, created_at, "
+                        "appointments!inner(doctor_id, appointment_time, status)")\
+                .order("created_at")\
+                .order("record_id")\
+                .limit(limit)
+            
+            if after:
+                created_at, record_id = after
+                query = query.or_(
+                    f'created_at.gt."{created_at}",'
+                    f'and(created_at.eq."{created_at}",record_id.gt.{record_id})'
+                )
+            elif created_from:
+                query = query.gte("created_at", created_from)
+            
+            return (await run_blocking_io(query.execute)).data
+            
+        except Exception as e:
+            logger.error(f"Failed to list encrypted records since {created_from}: {e}")
+            raise
+
+    
+    async def search_encrypted_records(
+        self,
+        required_tokens: List[str],
+        any_of_token_sets: List[List[str]],
+        limit: int,
+        doctor_id: Optional[UUID] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Candidate records by blind index: `blind_tokens` must contain every
+        required token and overlap each of the any-of sets.
+        """
+        try:
+            db = get_db()
+            
+            query = db.table("encrypted_records")\
+                .select("record_id, appointment_id, encrypted_blob, wrapped_key, created_at, "
+                        "appointments!inner(doctor_id, appointment_time, status)")\
+                .limit(limit)
+            
+            if required_tokens:
+                query = query.contains("blind_tokens", required_tokens)
+            for tokens in any_of_token_sets:
+                query = query.overlaps("blind_tokens", tokens)
+            if doctor_id:
+                query = query.eq("appointments.doctor_id", str(doctor_id))
+            
+            return (await run_blocking_io(query.execute)).data
+            
+        except Exception as e:
+            logger.error(f"Failed to search encrypted records: {e}")
+            raise
+    
+    async def list_audit_records_page(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """Page through audit_log in (chain_id, seq) order, for verification"""
+        try:
+            db = get_db()
+            
+            result = await run_blocking_io(db.table("audit_log")\
+                .select("*")\
+                .order("chain_id")\
+                .order("seq")\
+                .range(offset, offset + limit - 1)\
+                .execute)
+            
+            return result.data
+            
+        except Exception as e:
+            logger.error(f"Failed to page audit records: {e}")
+            raise
+    
+    async def list_archivable_consultations(self, completed_before: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Completed, not yet archived appointments older than `completed_before`,
+        with their encrypted record and result rows embedded
+        """
+        try:
+            db = get_db()
+            
+            result = await run_blocking_io(db.table("appointments")\
+                .select("appointment_id, appointment_time, encrypted_records(*), consultation_results(*)")\
+                .eq("status", "completed")\
+                .lt("appointment_time", completed_before)\
+                .is_("archived_at", "null")\
+                .order("appointment_time")\
+                .limit(limit)\
+                .execute)
+            
+            return result.data
+            
+        except Exception as e:
+            logger.error(f"Failed to list archivable consultations: {e}")
+            raise
+    
+    async def mark_appointments_archived(self, appointment_ids: List[str], archived_at: str):
+        """Record that these appointments' rows are in a durable archive segment"""
+        try:
+            db = get_db()
+            
+            await run_blocking_io(db.table("appointments")\
+                .update({"archived_at": archived_at})\
+                .in_("appointment_id", appointment_ids)\
+                .execute)
+            
+        except Exception as e:
+            logger.error(f"Failed to mark appointments archived: {e}")
+            raise
+    
+    async def list_purgeable_appointment_ids(self, archived_before: str, limit: int) -> List[str]:
+        """Appointments archived before `archived_before` that still have a hot encrypted record"""
+        try:
+            db = get_db()
+            
+            result = await run_blocking_io(db.table("appointments")\
+                .select("appointment_id, encrypted_records!inner(record_id)")\
+                .lt("archived_at", archived_before)\
+                .limit(limit)\
+                .execute)
+            
+            return [row["appointment_id"] for row in result.data]
+            
+        except Exception as e:
+            logger.error(f"Failed to list purgeable appointments: {e}")
+            raise
+    
+    async def delete_hot_consultation_rows(self, appointment_ids: List[str]):
+        """Delete archived rows from the hot tables (results first, so records mark unfinished work)"""
+        try:
+            db = get_db()
+            
+            await run_blocking_io(db.table("consultation_results")\
+                .delete()\
+                .in_("appointment_id", appointment_ids)\
+                .execute)
+            await run_blocking_io(db.table("encrypted_records")\
+                .delete()\
+                .in_("appointment_id", appointment_ids)\
+                .execute)
+            
+        except Exception as e:
+            logger.error(f"Failed to delete archived rows: {e}")
+            raise
+    
+    async def count_purged_archived_consultations(self, doctor_id: Optional[UUID] = None) -> int:
+        """
+        Archived appointments whose hot encrypted record is already purged,
+        i.e. consultations that scans of encrypted_records no longer see
+        """
+        try:
+            db = get_db()
+            
+            archived = db.table("appointments")\
+                .select("appointment_id", count="exact")\
+                .not_.is_("archived_at", "null")\
+                .limit(1)
+            still_hot = db.table("appointments")\
+                .select("appointment_id, encrypted_records!inner(record_id)", count="exact")\
+                .not_.is_("archived_at", "null")\
+                .limit(1)
+            
+            if doctor_id:
+                archived = archived.eq("doctor_id", str(doctor_id))
+                still_hot = still_hot.eq("doctor_id", str(doctor_id))
+            
+            archived_count = (await run_blocking_io(archived.execute)).count or 0
+            still_hot_count = (await run_blocking_io(still_hot.execute)).count or 0
+            return max(archived_count - still_hot_count, 0)
+            
+        except Exception as e:
+            logger.error(f"Failed to count purged archived consultations: {e}")
+            raise
+    
+    async def get_analysis_draft(self, appointment_id: UUID) -> Optional[Dict[str, Any]]:
+        """Speculative AI analysis draft for an appointment, if any"""
+        try:
+            db = get_db()
+            
+            result = await run_blocking_io(db.table("analysis_drafts")\
+                .select("*")\
+                .eq("appointment_id", str(appointment_id))\
+                .order("created_at", desc=True)\
+                .limit(1)\
+                .execute)
+            
+            return result.data[0] if result.data else None
+            
+        except Exception as e:
+            logger.error(f"Failed to get analysis draft: {e}")
+            raise
+    
+    async def store_analysis_draft(
+        self,
+        appointment_id: UUID,
+        record_version: str,
+        encrypted_draft: str,
+        wrapped_key: str,
+    ):
+        """Store (or replace) the draft computed from one version of a record"""
+        try:
+            db = get_db()
+            
+            draft_data = {
+                "appointment_id": str(appointment_id),
+                "record_version": record_version,
+                "encrypted_draft": encrypted_draft,
+                "wrapped_key": wrapped_key,
+                "created_at": datetime.now().isoformat()
+            }
+            
+            await run_blocking_io(db.table("analysis_drafts").upsert(draft_data).execute)
+            
+        except Exception as e:
+            logger.error(f"Failed to store analysis draft: {e}")
+            raise
+    
+    async def delete_analysis_draft(self, appointment_id: UUID):
+        """Drop an appointment's draft (stale, or no longer needed)"""
+        try:
+            db = get_db()
+            
+            await run_blocking_io(db.table("analysis_drafts")\
+                .delete()\
+                .eq("appointment_id", str(appointment_id))\
+                .execute)
+            
+        except Exception as e:
+            logger.error(f"Failed to delete analysis draft: {e}")
+            raise
+    
+    async def update_blind_tokens(self, record_id: str, blind_tokens: List[str]):
+        """Replace the blind-index tokens of one record (backfill/reindex)"""
+        try:
+            db = get_db()
+            
+            await run_blocking_io(db.table("encrypted_records")\
+                .update({"blind_tokens": blind_tokens})\
+                .eq("record_id", record_id)\
+                .execute)
+            
+        except Exception as e:
+            logger.error(f"Failed to update blind tokens: {e}")
+            raise
+
 
 # Global instance
 db_service = DatabaseService()
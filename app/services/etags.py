@@ -0,0 +1,117 @@
+"""
+Strong ETags and conditional GET for record and result reads.
+
+The payloads behind `GET /patient/result/{id}` and `GET /doctor/record/{id}`
+never change once written, so a response is identified by the rows it was
+built from:
+- result: the consultation_results row (`result_id`)
+- record: the encrypted_records row (`record_id`) plus the appointment
+  status, the only mutable field in the response
+
+The version index maps an appointment to its current ETag in the shared
+cache. It is filled whenever a full response is built, and only for
+versions that cannot change: results, and records of completed
+appointments. An `If-None-Match` request is checked against the index
+first; on a miss only the version columns are fetched (no blob, no
+decryption). A match is answered with 304 and no body.
+"""
+import hashlib
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from fastapi import Response
+
+from app.config import settings
+from app.services.db_service import db_service
+from app.services.shared_cache import shared_cache
+
+FINAL_STATUSES = ("completed",)
+
+
+def make_etag(kind: str, appointment_id: Any, *version: Any) -> str:
+    """Strong ETag for one version of a response"""
+    material = ":".join(str(part) for part in (kind, appointment_id, *version))
+    return f'"{kind}-{hashlib.sha256(material.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (weak, per RFC 9110: W/ prefixes are ignored)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return etag in (candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates)
+
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": settings.PHI_CACHE_CONTROL}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
+
+
+class VersionIndex:
+    """appointment -> current ETag, without touching the encrypted payload"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.metrics = {"index_hits": 0, "version_lookups": 0, "not_modified": 0}
+
+    def remember_result(self, appointment_id: UUID, result_id: Any) -> str:
+        etag = make_etag("result", appointment_id, result_id)
+        shared_cache.set("etag", f"result:{appointment_id}", etag, ttl=self.ttl)
+        return etag
+
+    def remember_record(self, appointment_id: UUID, record_id: Any, status: str) -> str:
+        etag = make_etag("record", appointment_id, record_id, status)
+        if status in FINAL_STATUSES:
+            shared_cache.set("etag", f"record:{appointment_id}", etag, ttl=self.ttl)
+        return etag
+
+    async def result_etag(self, appointment_id: UUID) -> Optional[str]:
+        """Current ETag of a result, or None if there is no result yet"""
+        etag = shared_cache.get("etag", f"result:{appointment_id}")
+        if etag is not None:
+            self.metrics["index_hits"] += 1
+            return etag
+        self.metrics["version_lookups"] += 1
+        result_id = await db_service.get_consultation_result_version(appointment_id)
+        return self.remember_result(appointment_id, result_id) if result_id else None
+
+    async def record_etag(self, appointment_id: UUID) -> Optional[str]:
+        """Current ETag of a record, or None if it does not exist"""
+        etag = shared_cache.get("etag", f"record:{appointment_id}")
+        if etag is not None:
+            self.metrics["index_hits"] += 1
+            return etag
+        self.metrics["version_lookups"] += 1
+        version = await db_service.get_record_version(appointment_id)
+        if version is None:
+            return None
+        return self.remember_record(appointment_id, version["record_id"], version["status"])
+
+    async def check_result(self, appointment_id: UUID, if_none_match: Optional[str]) -> Optional[Response]:
+        """304 response if the client's copy of the result is current, else None"""
+        if not if_none_match:
+            return None
+        etag = await self.result_etag(appointment_id)
+        return self._not_modified(etag) if etag and etag_matches(if_none_match, etag) else None
+
+    async def check_record(self, appointment_id: UUID, if_none_match: Optional[str]) -> Optional[Response]:
+        """304 response if the client's copy of the record is current, else None"""
+        if not if_none_match:
+            return None
+        etag = await self.record_etag(appointment_id)
+        return self._not_modified(etag) if etag and etag_matches(if_none_match, etag) else None
+
+    def _not_modified(self, etag: str) -> Response:
+        self.metrics["not_modified"] += 1
+        return not_modified(etag)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"ttl_seconds": self.ttl, **self.metrics}
+
+
+version_index = VersionIndex(ttl=settings.ETAG_INDEX_TTL_SECONDS)
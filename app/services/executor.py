@@ -0,0 +1,53 @@
+"""
+Bounded worker pools for work that must not run on the event loop.
+
+- `run_blocking_io`: synchronous Supabase calls, so independent queries
+  can be awaited concurrently instead of serialising the loop
+- `run_cpu_bound`: decryption and model validation
+
+Jobs submitted by a request being profiled are sampled on the pool thread
+too, under the caller's stage ("db" / "cpu" when it has none).
+
+Both pools are bounded so a burst queues work instead of spawning threads
+without limit.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from app.config import settings
+from app.services.profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+io_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_WORKER_THREADS,
+    thread_name_prefix="db-io",
+)
+cpu_executor = ThreadPoolExecutor(
+    max_workers=settings.CPU_WORKER_THREADS,
+    thread_name_prefix="cpu",
+)
+
+
+async def run_blocking_io(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking I/O call on the bounded DB pool"""
+    loop = asyncio.get_running_loop()
+    job = profiler.bind(functools.partial(func, *args, **kwargs), "db")
+    return await loop.run_in_executor(io_executor, job)
+
+
+async def run_cpu_bound(func: Callable, *args, **kwargs) -> Any:
+    """Run decrypt/validation work on the bounded CPU pool"""
+    loop = asyncio.get_running_loop()
+    job = profiler.bind(functools.partial(func, *args, **kwargs), "cpu")
+    return await loop.run_in_executor(cpu_executor, job)
+
+
+def shutdown_executors():
+    """Stop accepting work and wait for in-flight jobs"""
+    io_executor.shutdown(wait=True)
+    cpu_executor.shutdown(wait=True)
+    logger.info("Worker pools shut down")
@@ -0,0 +1,137 @@
+"""
+Deterministic, rule-based stand-in for the Gemini analysis.
+
+Used while the Gemini circuit is open (or a call fails), so a doctor's
+approval still completes with a useful, conservative assessment. Findings
+come from the same clinical thresholds as the population analytics
+(`CLINICAL_CATEGORIES`); the result is always marked `is_fallback=True`.
+"""
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.models.schemas import AIAnalysisResult, LabResults, PatientIntakeData
+from app.services.lab_analytics import CLINICAL_CATEGORIES, LAB_FIELDS
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_SOURCE = "rule_based_fallback"
+
+# category -> (risk points, concern, differential, tests, treatment)
+RULES: Dict[str, Tuple[float, str, str, List[str], List[str]]] = {
+    "uncontrolled_diabetes_hba1c": (
+        2.0, "HbA1c above 9% (poor glycaemic control)", "Uncontrolled diabetes mellitus",
+        ["Repeat HbA1c in 3 months", "Urine albumin-to-creatinine ratio"],
+        ["Review and intensify glucose-lowering therapy"],
+    ),
+    "diabetes_hba1c": (
+        2.5, "HbA1c in the diabetic range (>= 6.5%)", "Type 2 diabetes mellitus",
+        ["Repeat HbA1c or fasting glucose to confirm", "Lipid panel", "Kidney function (eGFR)"],
+        ["Consider metformin if not contraindicated", "Diabetes self-management education"],
+    ),
+    "diabetes_fasting_glucose": (
+        1.5, "Fasting glucose in the diabetic range (>= 126 mg/dL)", "Type 2 diabetes mellitus",
+        ["Confirm with HbA1c"],
+        [],
+    ),
+    "prediabetes_hba1c": (
+        1.0, "HbA1c in the prediabetic range (5.7-6.4%)", "Prediabetes",
+        ["Repeat HbA1c in 12 months"],
+        ["Structured lifestyle intervention for diabetes prevention"],
+    ),
+    "stage2_hypertension": (
+        2.0, "Blood pressure in the stage 2 hypertension range (>= 140/90)", "Stage 2 hypertension",
+        ["Home or ambulatory blood pressure monitoring", "Basic metabolic panel"],
+        ["Start or adjust antihypertensive therapy"],
+    ),
+    "stage1_hypertension": (
+        1.0, "Blood pressure in the stage 1 hypertension range (130-139/80-89)", "Stage 1 hypertension",
+        ["Home blood pressure monitoring"],
+        ["Reduce sodium intake and reassess blood pressure"],
+    ),
+    "high_ldl": (
+        1.0, "LDL cholesterol >= 160 mg/dL", "Hyperlipidaemia",
+        ["10-year ASCVD risk estimate"],
+        ["Consider statin therapy based on cardiovascular risk"],
+    ),
+    "high_triglycerides": (
+        0.5, "Triglycerides >= 200 mg/dL", "Hypertriglyceridaemia",
+        ["Repeat fasting lipid panel"],
+        [],
+    ),
+    "obesity": (
+        1.0, "BMI >= 30", "Obesity",
+        [],
+        ["Weight management programme"],
+    ),
+}
+
+FOLLOW_UP_BY_RISK = [
+    (7.0, "Follow up within 1 week"),
+    (4.0, "Follow up within 2-4 weeks"),
+    (0.0, "Routine follow-up in 3-6 months"),
+]
+
+
+def _lab_columns(lab_results: LabResults) -> Dict[str, np.float64]:
+    # 0-d NumPy values so the shared vectorised predicates work unchanged
+    values = lab_results.model_dump()
+    return {
+        name: np.float64(values[name] if values.get(name) is not None else np.nan)
+        for name in LAB_FIELDS
+    }
+
+
+def lab_findings(lab_results: LabResults) -> List[str]:
+    """RULES categories whose clinical threshold the labs cross, in RULES order"""
+    columns = _lab_columns(lab_results)
+    with np.errstate(invalid="ignore"):
+        return [
+            category for category in RULES
+            if bool(CLINICAL_CATEGORIES[category][0](columns))
+        ]
+
+
+def analyze_with_rules(
+    intake_data: PatientIntakeData,
+    lab_results: LabResults,
+) -> AIAnalysisResult:
+    """Threshold-based assessment filling the same result shape as Gemini"""
+    findings = [RULES[category] for category in lab_findings(lab_results)]
+
+    risk = sum(points for points, *_ in findings)
+    if intake_data.age >= 65:
+        risk += 1.0
+    risk_score = round(min(risk, 10.0), 1)
+
+    def unique(items):
+        return list(dict.fromkeys(items))
+
+    concerns = unique(concern for _, concern, _, _, _ in findings)
+    differentials = unique(diagnosis for _, _, diagnosis, _, _ in findings)
+    tests = unique(test for *_, rule_tests, _ in findings for test in rule_tests)
+    treatments = unique(item for *_, rule_treatments in findings for item in rule_treatments)
+    follow_up = next(text for threshold, text in FOLLOW_UP_BY_RISK if risk_score >= threshold)
+
+    if concerns:
+        summary = f"{len(concerns)} lab finding(s) outside reference thresholds: " + "; ".join(concerns) + "."
+    else:
+        summary = "No lab values outside the reference thresholds checked."
+
+    logger.info(f"Rule-based fallback analysis: risk {risk_score}, {len(findings)} finding(s)")
+
+    return AIAnalysisResult(
+        risk_score=risk_score,
+        primary_concerns=concerns or ["No threshold-based concerns identified"],
+        differential_diagnoses=differentials,
+        recommended_tests=tests,
+        clinical_summary=(
+            "Automated rule-based assessment (AI analysis unavailable); "
+            "review clinically before relying on it. " + summary
+        ),
+        treatment_recommendations=treatments,
+        follow_up_timeline=follow_up,
+        is_fallback=True,
+        analysis_source=FALLBACK_SOURCE,
+    )
@@ -0,0 +1,361 @@
+"""
+Local record/replay stand-in for the Gemini model API.
+
+Selected with AI_BACKEND:
+- "gemini": the real API (default)
+- "record": the real API, and every response is saved as a fixture in
+  AI_FIXTURE_DIR. Prompts contain patient data, so record against synthetic
+  patients only. The fixture stores a hash of the prompt, not the prompt.
+- "replay": no network. Fixtures are served with a sampled latency
+  (AI_REPLAY_LATENCY_PROFILE), injected errors (AI_REPLAY_ERROR_RATE), the
+  per-attempt timeout honoured as DeadlineExceeded, an optional capacity limit
+  (AI_REPLAY_MAX_CONCURRENCY), and token-by-token output for `stream=True`
+
+Both modes return real SDK response objects, so ai_service runs unchanged.
+With an AI_REPLAY_SEED, replays are reproducible.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from google.generativeai import protos
+from google.generativeai.types import generation_types
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("gemini", "record", "replay")
+FIXTURE_SUFFIX = ".json"
+
+
+@dataclass(frozen=True)
+class LatencyProfile:
+    """Time to first token (log-normal) plus generation at a fixed token rate"""
+    first_token_median: float
+    first_token_sigma: float
+    tokens_per_second: float
+    tail_probability: float = 0.0  # Chance a call is a straggler...
+    tail_multiplier: float = 1.0  # ...this many times slower
+
+
+LATENCY_PROFILES: Dict[str, LatencyProfile] = {
+    "instant": LatencyProfile(0.0, 0.0, math.inf),
+    "fast": LatencyProfile(0.3, 0.3, 400.0),
+    "typical": LatencyProfile(1.0, 0.5, 150.0),
+    "slow": LatencyProfile(4.0, 0.5, 60.0),
+    "heavy_tail": LatencyProfile(1.0, 0.5, 150.0, tail_probability=0.05, tail_multiplier=10.0),
+}
+RECORDED_PROFILE = "recorded"  # Replay each fixture's own recorded latency
+
+INJECTED_ERRORS = {
+    "unavailable": google_exceptions.ServiceUnavailable,
+    "deadline": google_exceptions.DeadlineExceeded,
+    "internal": google_exceptions.InternalServerError,
+    "quota": google_exceptions.ResourceExhausted,
+}
+
+# Served when no fixture has been recorded yet, so replay works out of the box
+DEFAULT_ANALYSIS = {
+    "risk_score": 6.0,
+    "primary_concerns": ["Elevated HbA1c", "Elevated blood pressure"],
+    "differential_diagnoses": ["Type 2 diabetes mellitus", "Stage 1 hypertension"],
+    "recommended_tests": ["Repeat HbA1c", "Lipid panel", "Kidney function (eGFR)"],
+    "clinical_summary": "Lab values suggest impaired glucose control with elevated blood pressure. Confirmatory testing is advised.",
+    "treatment_recommendations": ["Discuss glucose-lowering therapy", "Home blood pressure monitoring"],
+    "follow_up_timeline": "Follow up within 2-4 weeks",
+    "overall_health_status": "concerning",
+    "disease_probabilities": [
+        {
+            "disease": "Type 2 Diabetes",
+            "probability": "high",
+            "confidence": "85%",
+            "key_indicators": ["HbA1c above 6.5%", "Elevated fasting glucose"],
+            "explanation": "Both glycaemic markers are in the diabetic range.",
+        }
+    ],
+    "lifestyle_recommendations": ["Regular physical activity", "Reduce refined carbohydrates"],
+    "urgent_actions_needed": [],
+    "patient_friendly_summary": "Your blood sugar and blood pressure are higher than they should be. Your doctor will discuss next steps.",
+}
+
+_TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+def fixture_key(model_name: str, prompt: Any, generation_config: Any) -> str:
+    """Fixtures match on model, prompt and response format, not on token limits"""
+    mime_type = getattr(generation_config, "response_mime_type", None) or ""
+    material = json.dumps([model_name, mime_type, str(prompt)])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _response_proto(text: str, finish_reason: str = "STOP", prompt_tokens: int = 0) -> protos.GenerateContentResponse:
+    output_tokens = max(len(text) // 4, 1)
+    return protos.GenerateContentResponse(
+        candidates=[{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finish_reason": finish_reason,
+            "index": 0,
+        }],
+        usage_metadata={
+            "prompt_token_count": prompt_tokens,
+            "candidates_token_count": output_tokens,
+            "total_token_count": prompt_tokens + output_tokens,
+        },
+    )
+
+
+class FixtureStore:
+    """Recorded responses, one JSON file per fixture key"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self._fixtures: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._fixtures is None:
+            self._fixtures = {}
+            if self.directory.is_dir():
+                for path in sorted(self.directory.glob(f"*{FIXTURE_SUFFIX}")):
+                    fixture = json.loads(path.read_text())
+                    self._fixtures[fixture["key"]] = fixture
+            logger.info(f"Loaded {len(self._fixtures)} Gemini fixture(s) from {self.directory}")
+        return self._fixtures
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._load().get(key)
+
+    def nearest(self, key: str) -> Optional[Dict[str, Any]]:
+        """A stable stand-in for an unrecorded prompt: same key, same fixture"""
+        fixtures = self._load()
+        if not fixtures:
+            return None
+        ordered = sorted(fixtures)
+        return fixtures[ordered[int(key, 16) % len(ordered)]]
+
+    def save(self, key: str, model_name: str, response, latency_seconds: float):
+        fixture = {
+            "key": key,
+            "model": model_name,
+            "recorded_at": time.time(),
+            "latency_seconds": round(latency_seconds, 4),
+            "response": response.to_dict(),
+        }
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{key}{FIXTURE_SUFFIX}").write_text(json.dumps(fixture, indent=2))
+        self._load()[key] = fixture
+        logger.info(f"Recorded Gemini fixture {key[:12]} ({latency_seconds:.2f}s)")
+
+
+class RecordingModel:
+    """A real GenerativeModel whose (non-streamed) responses are saved as fixtures"""
+
+    def __init__(self, model_name: str, store: FixtureStore):
+        self.model_name = model_name
+        self._model = genai.GenerativeModel(model_name)
+        self._store = store
+
+    async def generate_content_async(self, contents, *, generation_config=None, stream: bool = False, **kwargs):
+        started = time.monotonic()
+        response = await self._model.generate_content_async(
+            contents, generation_config=generation_config, stream=stream, **kwargs
+        )
+        if stream:
+            logger.warning("Streamed Gemini responses are not recorded")
+            return response
+        key = fixture_key(self.model_name, contents, generation_config)
+        self._store.save(key, self.model_name, response, time.monotonic() - started)
+        return response
+
+
+class GeminiStandIn:
+    """Replay state shared by every ReplayModel: fixtures, RNG, capacity, counters"""
+
+    def __init__(
+        self,
+        store: FixtureStore,
+        latency_profile: str,
+        latency_scale: float,
+        error_rate: float,
+        error_kind: str,
+        strict: bool,
+        max_concurrency: int,
+        seed: Optional[int],
+    ):
+        if latency_profile != RECORDED_PROFILE and latency_profile not in LATENCY_PROFILES:
+            raise ValueError(f"Unknown latency profile '{latency_profile}'")
+        if error_kind not in INJECTED_ERRORS:
+            raise ValueError(f"Unknown injected error '{error_kind}'")
+        self.store = store
+        self.latency_profile = latency_profile
+        self.latency_scale = latency_scale
+        self.error_rate = error_rate
+        self.error_kind = error_kind
+        self.strict = strict
+        self.max_concurrency = max_concurrency
+        self._rng = random.Random(seed)
+        self._capacity: Optional[asyncio.Semaphore] = None
+        self.metrics = {"calls": 0, "served": 0, "errors_injected": 0, "timeouts": 0, "unmatched": 0}
+
+    def _fixture(self, key: str) -> Dict[str, Any]:
+        fixture = self.store.get(key)
+        if fixture is not None:
+            return fixture
+        self.metrics["unmatched"] += 1
+        if self.strict:
+            raise google_exceptions.NotFound(f"No Gemini fixture recorded for prompt {key[:12]}")
+        fixture = self.store.nearest(key)
+        if fixture is None:
+            default = _response_proto(json.dumps(DEFAULT_ANALYSIS))
+            return {"latency_seconds": None, "response": protos.GenerateContentResponse.to_dict(default)}
+        return fixture
+
+    def _profile(self) -> LatencyProfile:
+        # "recorded" generates at the typical token rate
+        return LATENCY_PROFILES.get(self.latency_profile, LATENCY_PROFILES["typical"])
+
+    def _first_token_delay(self, fixture: Dict[str, Any], output_tokens: int) -> float:
+        profile = self._profile()
+        if self.latency_profile == RECORDED_PROFILE and fixture.get("latency_seconds") is not None:
+            delay = max(fixture["latency_seconds"] - output_tokens / profile.tokens_per_second, 0.0)
+        else:
+            delay = profile.first_token_median * math.exp(self._rng.gauss(0.0, profile.first_token_sigma))
+            if profile.tail_probability and self._rng.random() < profile.tail_probability:
+                delay *= profile.tail_multiplier
+        return delay * self.latency_scale
+
+    def _token_interval(self) -> float:
+        return self.latency_scale / self._profile().tokens_per_second
+
+    async def generate(self, model_name: str, contents, generation_config, stream: bool, request_options):
+        self.metrics["calls"] += 1
+        timeout = (request_options or {}).get("timeout")
+        deadline = time.monotonic() + timeout if timeout else None
+        fixture = self._fixture(fixture_key(model_name, contents, generation_config))
+        response = protos.GenerateContentResponse(fixture["response"])
+        text = "".join(
+            part.text for candidate in response.candidates[:1] for part in candidate.content.parts
+        )
+        tokens = _TOKEN_PATTERN.findall(text)
+
+        async def wait(seconds: float):
+            # Honour the caller's per-attempt timeout as the real client does
+            if deadline is not None and time.monotonic() + seconds > deadline:
+                await asyncio.sleep(max(deadline - time.monotonic(), 0.0))
+                self.metrics["timeouts"] += 1
+                raise google_exceptions.DeadlineExceeded("Deadline exceeded (replay)")
+            await asyncio.sleep(seconds)
+
+        if self.max_concurrency and self._capacity is None:
+            self._capacity = asyncio.Semaphore(self.max_concurrency)
+
+        async def first_token():
+            await wait(self._first_token_delay(fixture, len(tokens)))
+            if self._rng.random() < self.error_rate:
+                self.metrics["errors_injected"] += 1
+                raise INJECTED_ERRORS[self.error_kind](f"Injected {self.error_kind} error (replay)")
+
+        if not stream:
+            if self._capacity:
+                async with self._capacity:
+                    await first_token()
+                    await wait(len(tokens) * self._token_interval())
+            else:
+                await first_token()
+                await wait(len(tokens) * self._token_interval())
+            self.metrics["served"] += 1
+            return generation_types.AsyncGenerateContentResponse.from_response(response)
+
+        async def chunks():
+            # One chunk per token; the last carries finish_reason and usage
+            if self._capacity:
+                await self._capacity.acquire()
+            try:
+                await first_token()
+                candidate = response.candidates[0]
+                for index, token in enumerate(tokens):
+                    last = index == len(tokens) - 1
+                    chunk = {"content": {"role": "model", "parts": [{"text": token}]}, "index": 0}
+                    if last:
+                        chunk["finish_reason"] = candidate.finish_reason
+                    yield protos.GenerateContentResponse(
+                        candidates=[chunk],
+                        usage_metadata=response.usage_metadata if last else None,
+                    )
+                    if not last:
+                        await wait(self._token_interval())
+                self.metrics["served"] += 1
+            finally:
+                if self._capacity:
+                    self._capacity.release()
+
+        return await generation_types.AsyncGenerateContentResponse.from_aiterator(chunks())
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "backend": "replay",
+            "fixtures": len(self.store),
+            "latency_profile": self.latency_profile,
+            "latency_scale": self.latency_scale,
+            "error_rate": self.error_rate,
+            "error_kind": self.error_kind,
+            **self.metrics,
+        }
+
+
+class ReplayModel:
+    """GenerativeModel look-alike served from fixtures by a GeminiStandIn"""
+
+    def __init__(self, model_name: str, standin: GeminiStandIn):
+        self.model_name = model_name
+        self._standin = standin
+
+    async def generate_content_async(
+        self,
+        contents,
+        *,
+        generation_config=None,
+        safety_settings=None,
+        stream: bool = False,
+        request_options: Optional[Dict[str, Any]] = None,
+        **kwargs,
+    ):
+        return await self._standin.generate(self.model_name, contents, generation_config, stream, request_options)
+
+
+fixture_store = FixtureStore(settings.AI_FIXTURE_DIR)
+
+gemini_standin = GeminiStandIn(
+    store=fixture_store,
+    latency_profile=settings.AI_REPLAY_LATENCY_PROFILE,
+    latency_scale=settings.AI_REPLAY_LATENCY_SCALE,
+    error_rate=settings.AI_REPLAY_ERROR_RATE,
+    error_kind=settings.AI_REPLAY_ERROR_KIND,
+    strict=settings.AI_REPLAY_STRICT,
+    max_concurrency=settings.AI_REPLAY_MAX_CONCURRENCY,
+    seed=settings.AI_REPLAY_SEED,
+)
+
+
+def generative_model(model_name: str):
+    """The model client for AI_BACKEND"""
+    if settings.AI_BACKEND not in BACKENDS:
+        raise ValueError(f"Unknown AI_BACKEND '{settings.AI_BACKEND}' (expected one of {', '.join(BACKENDS)})")
+    if settings.AI_BACKEND == "replay":
+        return ReplayModel(model_name, gemini_standin)
+    if settings.AI_BACKEND == "record":
+        return RecordingModel(model_name, fixture_store)
+    return genai.GenerativeModel(model_name)
@@ -0,0 +1,210 @@
+"""
+Hedged, budgeted retries for a slow remote dependency (Gemini).
+
+For each logical request:
+- the first attempt is sent; if it has not answered after the hedge delay
+  (an adaptive percentile of recent successful latencies) a second,
+  identical attempt is sent and whichever answers first with a valid
+  result wins, the other is cancelled
+- a retryable failure is retried after a full-jitter exponential backoff
+
+Hedges and retries both draw from one RetryBudget, which only grows as
+real requests arrive, so extra load stays a bounded fraction of traffic
+(plus a small per-second floor) even during an outage.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Rolling window of successful-call latencies"""
+
+    def __init__(self, window_size: int):
+        self._samples: deque = deque(maxlen=window_size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(int(round(percentile / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+
+class RetryBudget:
+    """
+    Every request deposits `ratio` tokens and every hedge/retry spends one,
+    so extra attempts are capped at ~ratio x request rate. `min_per_second`
+    keeps a trickle available at low traffic.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        self._refill()
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        self._refill()
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class HedgedRequester:
+    """Runs one logical request as hedged, jitter-retried attempts"""
+
+    def __init__(
+        self,
+        name: str,
+        budget: RetryBudget,
+        latencies: LatencyTracker,
+        hedging_enabled: bool,
+        hedge_percentile: float,
+        hedge_min_delay: float,
+        hedge_max_delay: float,
+        hedge_min_samples: int,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+    ):
+        self.name = name
+        self.budget = budget
+        self.latencies = latencies
+        self.hedging_enabled = hedging_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = {
+            "requests": 0,
+            "attempts": 0,
+            "hedges_sent": 0,
+            "hedge_wins": 0,
+            "hedges_denied": 0,
+            "retries": 0,
+            "retries_denied": 0,
+            "failures": 0,
+        }
+
+    def hedge_delay(self) -> float:
+        """Current hedge trigger: the target percentile, clamped"""
+        if len(self.latencies) < self.hedge_min_samples:
+            return self.hedge_max_delay
+        observed = self.latencies.percentile(self.hedge_percentile)
+        return min(max(observed, self.hedge_min_delay), self.hedge_max_delay)
+
+    def _backoff(self, retry: int) -> float:
+        # Full jitter: uniform in [0, min(cap, base * 2^retry)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** retry)))
+
+    async def _timed(self, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        self.metrics["attempts"] += 1
+        started = time.monotonic()
+        result = await attempt()
+        self.latencies.observe(time.monotonic() - started)
+        return result
+
+    async def _hedged_attempt(self, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        """One attempt, plus a hedge if it is slower than the hedge delay"""
+        primary = asyncio.ensure_future(self._timed(attempt))
+        tasks = {primary}
+        try:
+            if self.hedging_enabled:
+                done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+                if not done:
+                    if self.budget.try_spend():
+                        self.metrics["hedges_sent"] += 1
+                        tasks.add(asyncio.ensure_future(self._timed(attempt)))
+                    else:
+                        self.metrics["hedges_denied"] += 1
+
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.metrics["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(
+        self,
+        attempt: Callable[[], Awaitable[Any]],
+        is_retryable: Callable[[Exception], bool] = lambda e: True,
+    ) -> Any:
+        """Run `attempt()` with hedging and budgeted retries"""
+        self.metrics["requests"] += 1
+        self.budget.deposit()
+
+        retry = 0
+        while True:
+            try:
+                return await self._hedged_attempt(attempt)
+            except Exception as e:
+                if retry >= self.max_retries or not is_retryable(e):
+                    self.metrics["failures"] += 1
+                    raise
+                if not self.budget.try_spend():
+                    self.metrics["retries_denied"] += 1
+                    self.metrics["failures"] += 1
+                    raise
+                delay = self._backoff(retry)
+                retry += 1
+                self.metrics["retries"] += 1
+                logger.warning(f"{self.name} attempt failed ({type(e).__name__}: {e}); retry {retry} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def snapshot(self) -> Dict[str, Any]:
+        requests = self.metrics["requests"] or 1
+        hedges = self.metrics["hedges_sent"] or 1
+        return {
+            "name": self.name,
+            **self.metrics,
+            "hedge_rate": self.metrics["hedges_sent"] / requests,
+            "hedge_win_rate": self.metrics["hedge_wins"] / hedges,
+            "retry_rate": self.metrics["retries"] / requests,
+            "hedge_delay_seconds": self.hedge_delay(),
+            "latency_samples": len(self.latencies),
+            "latency_p50_seconds": self.latencies.percentile(50),
+            "latency_p95_seconds": self.latencies.percentile(95),
+            "latency_p99_seconds": self.latencies.percentile(99),
+            "budget_tokens": round(self.budget.tokens, 2),
+        }
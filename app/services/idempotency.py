@@ -0,0 +1,127 @@
+"""
+Idempotency index for retried submissions.
+
+A bounded, TTL-limited in-memory map from `Idempotency-Key` to the
+original response, backed by the `idempotency_keys` table so retries that
+land on another worker (or after a restart) still dedupe.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.config import settings
+from app.services.db_service import db_service
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyConflict(Exception):
+    """Same Idempotency-Key reused with a different request body"""
+
+
+class IdempotencyIndex:
+    """LRU + TTL index of completed requests with in-flight coalescing"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (expires_at, fingerprint, response)
+        self._entries: "OrderedDict[str, Tuple[float, str, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def fingerprint(body: bytes) -> str:
+        """Stable hash of the raw request body"""
+        return hashlib.sha256(body).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Return (fingerprint, response) if cached and not expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, fingerprint, response = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return fingerprint, response
+
+    def put(self, key: str, fingerprint: str, response: Dict[str, Any]):
+        """Cache a completed response, evicting the least recently used"""
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, fingerprint, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        handler: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """
+        Return the stored response for `key`, or run `handler` exactly once.
+        Concurrent retries with the same key wait for the first attempt; if
+        it fails, exactly one of them takes over and the rest wait again.
+        """
+        while True:
+            cached = await self._lookup(key)
+            inflight = self._inflight.get(key)
+            if cached is not None or inflight is None:
+                break
+            logger.info(f"Idempotency-Key {key} in flight, waiting for original request")
+            await asyncio.shield(inflight)
+
+        if cached is not None:
+            stored_fingerprint, response = cached
+            if stored_fingerprint != fingerprint:
+                raise IdempotencyConflict(
+                    "Idempotency-Key was already used with a different request body"
+                )
+            logger.info(f"Idempotency-Key {key} replayed from index")
+            return response
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            response = await handler()
+            self.put(key, fingerprint, response)
+            try:
+                await db_service.store_idempotency_record(key, fingerprint, response)
+            except Exception as e:
+                # The write already succeeded; the memory index still dedupes locally
+                logger.warning(f"Failed to persist Idempotency-Key {key}: {e}")
+            return response
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            future.set_result(None)
+
+    async def _lookup(self, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Check memory first, then the persistent fallback"""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        record = await db_service.get_idempotency_record(key)
+        if not record:
+            return None
+
+        cached = (record["request_hash"], record["response"])
+        self.put(key, *cached)
+        return cached
+
+
+# Global instance
+idempotency_index = IdempotencyIndex(
+    max_entries=settings.IDEMPOTENCY_CACHE_SIZE,
+    ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+)
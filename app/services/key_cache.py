@@ -0,0 +1,114 @@
+"""
+Bounded in-memory cache of unwrapped data keys.
+
+Unwrapping a `wrapped_key` (KEM decapsulation in the real scheme) is a
+per-request cost. Records that share a key, or a key epoch, are read over
+and over, so unwrapped keys are cached by key ID with a TTL and wiped in
+place when they leave the cache.
+
+Callers borrow a key with `borrow()`: they get their own `bytearray` copy,
+which is wiped when the `with` block exits. What cannot be wiped is any
+immutable `bytes` object: the value `unwrap` returns on a miss (and the
+base64 decoding behind it) stays on the heap until the garbage collector
+reuses the memory. Python gives no control over that.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def key_id_for(wrapped_key: str) -> str:
+    """Stable, non-secret identifier for a piece of wrapped key material"""
+    return hashlib.sha256(str(wrapped_key).encode("utf-8")).hexdigest()[:32]
+
+
+def zeroize(buffer: bytearray):
+    """Overwrite key material in place before it is released"""
+    for i in range(len(buffer)):
+        buffer[i] = 0
+
+
+class DataKeyCache:
+    """LRU + TTL cache of unwrapped data keys, zeroized on eviction"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key_id -> (expires_at, key bytes)
+        self._entries: "OrderedDict[str, Tuple[float, bytearray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @contextmanager
+    def borrow(self, wrapped_key: str, unwrap: Callable[[str], bytes]) -> Iterator[bytearray]:
+        """
+        Lend the data key for `wrapped_key`, calling `unwrap` only on a miss.
+        The caller gets a private copy (evictions cannot wipe it mid-use),
+        and the copy is zeroized when the block exits.
+        """
+        data_key = self._copy_or_unwrap(wrapped_key, unwrap)
+        try:
+            yield data_key
+        finally:
+            zeroize(data_key)
+
+    def _copy_or_unwrap(self, wrapped_key: str, unwrap: Callable[[str], bytes]) -> bytearray:
+        key_id = key_id_for(wrapped_key)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key_id)
+            if entry is not None:
+                expires_at, data_key = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key_id)
+                    self.hits += 1
+                    return bytearray(data_key)
+                self._drop(key_id)
+            self.misses += 1
+
+        # Unwrap outside the lock so one slow decapsulation does not block hits
+        data_key = bytearray(unwrap(wrapped_key))
+
+        with self._lock:
+            if key_id in self._entries:
+                self._drop(key_id)
+            self._entries[key_id] = (now + self.ttl_seconds, data_key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+            return bytearray(data_key)
+
+    def invalidate(self, wrapped_key: str):
+        """Remove and wipe a single key (e.g. after it has been rotated)"""
+        with self._lock:
+            self._drop(key_id_for(wrapped_key))
+
+    def clear(self):
+        """Remove and wipe every cached key"""
+        with self._lock:
+            for key_id in list(self._entries):
+                self._drop(key_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _drop(self, key_id: str):
+        # Caller holds the lock
+        entry = self._entries.pop(key_id, None)
+        if entry is not None:
+            zeroize(entry[1])
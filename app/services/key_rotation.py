@@ -0,0 +1,113 @@
+"""
+Streaming, resumable re-wrap of data keys.
+
+Walks `encrypted_records`, `consultation_results` and `analysis_drafts` in
+primary-key order, one batch at a time, and re-wraps each row's `wrapped_key`
+under the target epoch. Payloads are never decrypted or rewritten. Progress is checkpointed
+after every batch, so an interrupted run picks up where it stopped.
+"""
+import json
+import logging
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+from app.config import settings
+from app.services.crypto_mock import crypto_service
+from app.services.db_service import db_service
+
+logger = logging.getLogger(__name__)
+
+# table -> primary key column
+ROTATION_TABLES = {
+    "encrypted_records": "record_id",
+    "consultation_results": "result_id",
+    "analysis_drafts": "appointment_id",
+}
+
+
+class KeyRotationJob:
+    """Re-wraps data keys across all encrypted tables in batches"""
+
+    def __init__(
+        self,
+        target_epoch: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        checkpoint_path: Optional[str] = None,
+    ):
+        self.target_epoch = settings.KEY_EPOCH if target_epoch is None else target_epoch
+        self.batch_size = batch_size or settings.KEY_ROTATION_BATCH_SIZE
+        self.checkpoint_path = Path(checkpoint_path or settings.KEY_ROTATION_CHECKPOINT_PATH)
+
+    def load_checkpoint(self) -> Dict[str, object]:
+        """Last processed ID per table for the current target epoch"""
+        if not self.checkpoint_path.exists():
+            return {}
+        checkpoint = json.loads(self.checkpoint_path.read_text())
+        if checkpoint.get("target_epoch") != self.target_epoch:
+            # A checkpoint for a different rotation is not a valid resume point
+            return {}
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint: Dict[str, object]):
+        checkpoint["target_epoch"] = self.target_epoch
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(checkpoint, indent=2))
+        tmp_path.replace(self.checkpoint_path)
+
+    async def run(self) -> Dict[str, Dict[str, int]]:
+        """Run (or resume) the rotation and return per-table counters"""
+        totals = {}
+        async for table, stats in self.iter_batches():
+            table_totals = totals.setdefault(table, {"scanned": 0, "rewrapped": 0, "skipped": 0, "conflicts": 0})
+            for name, value in stats.items():
+                table_totals[name] += value
+        logger.info(f"Key rotation to epoch {self.target_epoch} complete: {totals}")
+        return totals
+
+    async def iter_batches(self) -> AsyncIterator:
+        """Process one batch at a time, yielding (table, batch stats)"""
+        checkpoint = self.load_checkpoint()
+        tables = checkpoint.setdefault("tables", {})
+
+        for table, id_column in ROTATION_TABLES.items():
+            state = tables.setdefault(table, {"last_id": None, "done": False})
+            if state["done"]:
+                logger.info(f"Skipping {table}: already rotated to epoch {self.target_epoch}")
+                continue
+
+            while True:
+                rows = await db_service.list_wrapped_keys(
+                    table, id_column, state["last_id"], self.batch_size
+                )
+                if not rows:
+                    state["done"] = True
+                    self.save_checkpoint(checkpoint)
+                    break
+
+                stats = {"scanned": len(rows), "rewrapped": 0, "skipped": 0, "conflicts": 0}
+                for row in rows:
+                    old_key = row["wrapped_key"]
+                    if crypto_service.key_epoch(old_key) == self.target_epoch:
+                        stats["skipped"] += 1
+                        continue
+
+                    new_key = crypto_service.rewrap_key(old_key, self.target_epoch)
+                    updated = await db_service.update_wrapped_key(
+                        table, id_column, row[id_column], old_key, new_key
+                    )
+                    if updated:
+                        stats["rewrapped"] += 1
+                        crypto_service.key_cache.invalidate(old_key)
+                    else:
+                        stats["conflicts"] += 1
+
+                state["last_id"] = rows[-1][id_column]
+                self.save_checkpoint(checkpoint)
+                logger.info(f"Rotated batch of {table} up to {state['last_id']}: {stats}")
+                yield table, stats
+
+                if len(rows) < self.batch_size:
+                    state["done"] = True
+                    self.save_checkpoint(checkpoint)
+                    break
@@ -0,0 +1,493 @@
+"""
+Population lab analytics over a memory-resident columnar snapshot.
+
+Lab values are decrypted once into NumPy arrays (one float64 column per
+`LabResults` field, NaN for missing) alongside doctor/clinic codes and
+appointment timestamps. Aggregate queries are then vectorized masks and
+reductions over those arrays instead of per-record decrypt loops.
+
+The snapshot is immutable: a refresh builds new arrays and swaps the
+reference, so readers never see a half-applied update. Refreshes are
+incremental: they re-scan from `LAB_ANALYTICS_OVERLAP_SECONDS` before the
+`created_at` watermark, so rows committed late (or inserted in one batch
+with a shared timestamp) are still picked up, and skip the record IDs the
+snapshot already holds from that window before decrypting anything. A full
+rebuild runs every `LAB_ANALYTICS_FULL_REBUILD_EVERY` refreshes to pick up
+deletions and archival.
+
+Consultations whose hot rows were purged after archival are not in the
+snapshot. A full rebuild counts them, and `info()` and every refresh
+report that count as `archived_excluded`, so shrinking populations are
+visible rather than silent.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.models.schemas import LabResults
+from app.services.db_service import db_service
+from app.services.records import decrypt_patient_data
+
+logger = logging.getLogger(__name__)
+
+LAB_FIELDS = [name for name in LabResults.model_fields if name != "test_notes"]
+
+TIME_BUCKETS = {
+    "day": "datetime64[D]",
+    "week": "datetime64[W]",
+    "month": "datetime64[M]",
+    "year": "datetime64[Y]",
+}
+
+COMPARATORS = {
+    "gt": np.greater,
+    "gte": np.greater_equal,
+    "lt": np.less,
+    "lte": np.less_equal,
+    "eq": np.equal,
+}
+
+
+def _stage2_hypertension(columns):
+    return (columns["blood_pressure_systolic"] >= 140) | (columns["blood_pressure_diastolic"] >= 90)
+
+
+def _stage1_hypertension(columns):
+    systolic = columns["blood_pressure_systolic"]
+    diastolic = columns["blood_pressure_diastolic"]
+    return ~_stage2_hypertension(columns) & (
+        ((systolic >= 130) & (systolic < 140)) | ((diastolic >= 80) & (diastolic < 90))
+    )
+
+
+# Named clinical categories: predicate over columns, plus the fields that
+# must be present for a record to count in the denominator
+CLINICAL_CATEGORIES = {
+    "diabetes_hba1c": (lambda c: c["hba1c"] >= 6.5, ["hba1c"]),
+    "prediabetes_hba1c": (lambda c: (c["hba1c"] >= 5.7) & (c["hba1c"] < 6.5), ["hba1c"]),
+    "uncontrolled_diabetes_hba1c": (lambda c: c["hba1c"] > 9.0, ["hba1c"]),
+    "diabetes_fasting_glucose": (lambda c: c["fasting_glucose"] >= 126, ["fasting_glucose"]),
+    "stage1_hypertension": (_stage1_hypertension, ["blood_pressure_systolic", "blood_pressure_diastolic"]),
+    "stage2_hypertension": (_stage2_hypertension, ["blood_pressure_systolic", "blood_pressure_diastolic"]),
+    "obesity": (lambda c: c["bmi"] >= 30, ["bmi"]),
+    "high_ldl": (lambda c: c["cholesterol_ldl"] >= 160, ["cholesterol_ldl"]),
+    "high_triglycerides": (lambda c: c["triglycerides"] >= 200, ["triglycerides"]),
+}
+
+
+@dataclass
+class LabSnapshot:
+    """Immutable columnar view of decrypted lab values"""
+    columns: Dict[str, np.ndarray]
+    doctor_codes: np.ndarray
+    clinic_codes: np.ndarray
+    timestamps: np.ndarray
+    doctors: List[str] = field(default_factory=list)
+    clinics: List[str] = field(default_factory=list)
+    watermark: Optional[str] = None
+    # record_id -> created_at of rows inside the overlap window, to dedupe re-scans
+    recent_ids: Dict[str, str] = field(default_factory=dict)
+    # Archived consultations (hot rows purged) missing from the snapshot
+    archived_excluded: int = 0
+    built_at: float = 0.0
+
+    @classmethod
+    def empty(cls) -> "LabSnapshot":
+        return cls(
+            columns={name: np.empty(0, dtype=np.float64) for name in LAB_FIELDS},
+            doctor_codes=np.empty(0, dtype=np.int32),
+            clinic_codes=np.empty(0, dtype=np.int32),
+            timestamps=np.empty(0, dtype="datetime64[s]"),
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def nbytes(self) -> int:
+        arrays = [*self.columns.values(), self.doctor_codes, self.clinic_codes, self.timestamps]
+        return int(sum(array.nbytes for array in arrays))
+
+    def extend(
+        self,
+        rows: List[Dict[str, Any]],
+        watermark: Optional[str],
+        recent_ids: Optional[Dict[str, str]] = None,
+    ) -> "LabSnapshot":
+        """Return a new snapshot with `rows` appended"""
+        doctors = list(self.doctors)
+        clinics = list(self.clinics)
+        doctor_index = {doctor: i for i, doctor in enumerate(doctors)}
+        clinic_index = {clinic: i for i, clinic in enumerate(clinics)}
+
+        def code(value, values, index):
+            if value is None:
+                return -1
+            if value not in index:
+                index[value] = len(values)
+                values.append(value)
+            return index[value]
+
+        new_columns = {
+            name: np.array([row["labs"].get(name) for row in rows], dtype=np.float64)
+            for name in LAB_FIELDS
+        }
+        new_doctors = np.array(
+            [code(row["doctor_id"], doctors, doctor_index) for row in rows], dtype=np.int32
+        )
+        new_clinics = np.array(
+            [code(row["clinic_id"], clinics, clinic_index) for row in rows], dtype=np.int32
+        )
+        new_timestamps = np.array([row["timestamp"] for row in rows], dtype="datetime64[s]")
+
+        return LabSnapshot(
+            columns={
+                name: np.concatenate([self.columns[name], new_columns[name]])
+                for name in LAB_FIELDS
+            },
+            doctor_codes=np.concatenate([self.doctor_codes, new_doctors]),
+            clinic_codes=np.concatenate([self.clinic_codes, new_clinics]),
+            timestamps=np.concatenate([self.timestamps, new_timestamps]),
+            doctors=doctors,
+            clinics=clinics,
+            watermark=watermark or self.watermark,
+            recent_ids=self.recent_ids if recent_ids is None else recent_ids,
+            archived_excluded=self.archived_excluded,
+            built_at=time.time(),
+        )
+
+
+def _numeric(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_datetime(value: Any) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_timestamp(value: Any) -> np.datetime64:
+    parsed = _parse_datetime(value)
+    if parsed is None:
+        return np.datetime64("NaT")
+    return np.datetime64(parsed.replace(tzinfo=None), "s")
+
+
+class LabAnalyticsEngine:
+    """Builds, refreshes and queries the lab snapshot"""
+
+    def __init__(self):
+        self.snapshot = LabSnapshot.empty()
+        self._refresh_lock = asyncio.Lock()
+        self._refreshes = 0
+        self._task: Optional[asyncio.Task] = None
+        self._new_intakes = asyncio.Event()
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    async def _load_rows(self, base: LabSnapshot):
+        """
+        Decrypt every record the snapshot does not hold yet, page by page.
+        Returns (rows, watermark, recent_ids) for `LabSnapshot.extend`.
+        """
+        batch_size = settings.EXPORT_BATCH_SIZE
+        overlap = timedelta(seconds=settings.LAB_ANALYTICS_OVERLAP_SECONDS)
+        watermark = base.watermark
+        parsed_watermark = _parse_datetime(watermark)
+        created_from = (parsed_watermark - overlap).isoformat() if parsed_watermark else None
+        recent_ids = dict(base.recent_ids)
+        cursor = None
+        rows = []
+
+        while True:
+            page = await db_service.list_encrypted_records_since(created_from, cursor, batch_size)
+            if not page:
+                break
+            cursor = (page[-1]["created_at"], page[-1]["record_id"])
+            watermark = page[-1]["created_at"]
+
+            # Rows re-read from the overlap window are already in the snapshot
+            new_records = [record for record in page if record["record_id"] not in recent_ids]
+            for record in new_records:
+                recent_ids[record["record_id"]] = record["created_at"]
+
+            decrypted = await asyncio.gather(
+                *(decrypt_patient_data(record) for record in new_records),
+                return_exceptions=True,
+            )
+            for record, result in zip(new_records, decrypted):
+                if isinstance(result, Exception):
+                    logger.warning(f"Skipping record {record.get('record_id')} in lab snapshot: {result}")
+                    continue
+                _, labs = result
+                appointment = record.get("appointments") or {}
+                doctor_id = appointment.get("doctor_id")
+                rows.append({
+                    "labs": {name: _numeric(labs.get(name)) for name in LAB_FIELDS},
+                    "doctor_id": doctor_id,
+                    "clinic_id": settings.DOCTOR_CLINICS.get(str(doctor_id)) if doctor_id else None,
+                    "timestamp": _parse_timestamp(appointment.get("appointment_time") or record.get("created_at")),
+                })
+
+            if len(page) < batch_size:
+                break
+
+        # Only the overlap window before the new watermark can be re-read
+        horizon = _parse_datetime(watermark)
+        if horizon is not None:
+            horizon -= overlap
+            recent_ids = {
+                record_id: created_at
+                for record_id, created_at in recent_ids.items()
+                if (_parse_datetime(created_at) or horizon) >= horizon
+            }
+        return rows, watermark, recent_ids
+
+    async def refresh(self, full: bool = False) -> Dict[str, Any]:
+        """Incrementally extend (or fully rebuild) the snapshot"""
+        async with self._refresh_lock:
+            started = time.monotonic()
+            full = full or (self._refreshes % settings.LAB_ANALYTICS_FULL_REBUILD_EVERY == 0)
+            if full:
+                excluded = await db_service.count_purged_archived_consultations()
+                base = replace(LabSnapshot.empty(), archived_excluded=excluded)
+            else:
+                base = self.snapshot
+
+            rows, watermark, recent_ids = await self._load_rows(base)
+            if rows or full:
+                self.snapshot = base.extend(rows, watermark, recent_ids)
+            else:
+                # Nothing new; keep the arrays, carry the dedupe window forward
+                self.snapshot = replace(base, watermark=watermark, recent_ids=recent_ids)
+            self._refreshes += 1
+
+            elapsed = time.monotonic() - started
+            logger.info(
+                f"Lab snapshot {'rebuilt' if full else 'refreshed'}: +{len(rows)} rows, "
+                f"{len(self.snapshot)} total in {elapsed:.2f}s"
+            )
+            return {
+                "full": full,
+                "added": len(rows),
+                "rows": len(self.snapshot),
+                "archived_excluded": self.snapshot.archived_excluded,
+                "seconds": round(elapsed, 3),
+            }
+
+    def notify_new_intake(self):
+        """Hint that new records exist; the next refresh runs early (debounced)"""
+        self._new_intakes.set()
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Lab snapshot refresh failed: {e}")
+
+            # Debounce bursts of intakes, then wait for a hint or the interval
+            await asyncio.sleep(settings.LAB_ANALYTICS_MIN_REFRESH_GAP_SECONDS)
+            try:
+                await asyncio.wait_for(
+                    self._new_intakes.wait(),
+                    timeout=settings.LAB_ANALYTICS_REFRESH_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._new_intakes.clear()
+
+    def start(self):
+        """Start periodic background refreshes"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _mask(
+        self,
+        snapshot: LabSnapshot,
+        doctor_id: Optional[str] = None,
+        clinic_id: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> np.ndarray:
+        mask = np.ones(len(snapshot), dtype=bool)
+        if doctor_id is not None:
+            code = snapshot.doctors.index(doctor_id) if doctor_id in snapshot.doctors else -2
+            mask &= snapshot.doctor_codes == code
+        if clinic_id is not None:
+            code = snapshot.clinics.index(clinic_id) if clinic_id in snapshot.clinics else -2
+            mask &= snapshot.clinic_codes == code
+        if start is not None:
+            mask &= snapshot.timestamps >= np.datetime64(start.replace(tzinfo=None), "s")
+        if end is not None:
+            mask &= snapshot.timestamps < np.datetime64(end.replace(tzinfo=None), "s")
+        return mask
+
+    def _values(self, snapshot: LabSnapshot, lab_field: str, mask: np.ndarray) -> np.ndarray:
+        if lab_field not in snapshot.columns:
+            raise ValueError(f"Unknown lab field: {lab_field}")
+        values = snapshot.columns[lab_field][mask]
+        return values[~np.isnan(values)]
+
+    def summary(self, lab_field: str, percentiles: List[float], **filters) -> Dict[str, Any]:
+        """Count, moments and percentiles for one lab field"""
+        snapshot = self.snapshot
+        mask = self._mask(snapshot, **filters)
+        values = self._values(snapshot, lab_field, mask)
+        result = {
+            "field": lab_field,
+            "records": int(mask.sum()),
+            "count": int(values.size),
+            "missing": int(mask.sum() - values.size),
+        }
+        if values.size:
+            result.update(
+                mean=float(values.mean()),
+                std=float(values.std()),
+                min=float(values.min()),
+                max=float(values.max()),
+                percentiles={
+                    f"p{q:g}": float(v) for q, v in zip(percentiles, np.percentile(values, percentiles))
+                },
+            )
+        return result
+
+    def histogram(
+        self,
+        lab_field: str,
+        bins: int,
+        value_range: Optional[tuple] = None,
+        **filters,
+    ) -> Dict[str, Any]:
+        """Fixed-width histogram of one lab field"""
+        snapshot = self.snapshot
+        values = self._values(snapshot, lab_field, self._mask(snapshot, **filters))
+        if values.size == 0:
+            return {"field": lab_field, "count": 0, "counts": [], "edges": []}
+        counts, edges = np.histogram(values, bins=bins, range=value_range)
+        return {
+            "field": lab_field,
+            "count": int(values.size),
+            "counts": counts.tolist(),
+            "edges": edges.tolist(),
+        }
+
+    def threshold(
+        self,
+        lab_field: Optional[str] = None,
+        op: Optional[str] = None,
+        value: Optional[float] = None,
+        category: Optional[str] = None,
+        **filters,
+    ) -> Dict[str, Any]:
+        """Count and share of records meeting a threshold or clinical category"""
+        snapshot = self.snapshot
+        mask = self._mask(snapshot, **filters)
+
+        if category is not None:
+            if category not in CLINICAL_CATEGORIES:
+                raise ValueError(f"Unknown category: {category}")
+            predicate, required = CLINICAL_CATEGORIES[category]
+            with np.errstate(invalid="ignore"):
+                hits = predicate(snapshot.columns)
+            known = np.zeros(len(snapshot), dtype=bool)
+            for name in required:
+                known |= ~np.isnan(snapshot.columns[name])
+        else:
+            if lab_field not in snapshot.columns:
+                raise ValueError(f"Unknown lab field: {lab_field}")
+            if op not in COMPARATORS or value is None:
+                raise ValueError(f"Threshold needs op in {sorted(COMPARATORS)} and a value")
+            column = snapshot.columns[lab_field]
+            with np.errstate(invalid="ignore"):
+                hits = COMPARATORS[op](column, value)
+            known = ~np.isnan(column)
+
+        denominator = int((mask & known).sum())
+        count = int((mask & known & hits).sum())
+        return {
+            "category": category,
+            "field": lab_field,
+            "op": op,
+            "value": value,
+            "count": count,
+            "denominator": denominator,
+            "share": count / denominator if denominator else None,
+        }
+
+    def timeseries(
+        self,
+        lab_field: str,
+        bucket: str = "month",
+        **filters,
+    ) -> Dict[str, Any]:
+        """Per-bucket count and mean of one lab field"""
+        if bucket not in TIME_BUCKETS:
+            raise ValueError(f"Unknown bucket: {bucket}")
+        snapshot = self.snapshot
+        if lab_field not in snapshot.columns:
+            raise ValueError(f"Unknown lab field: {lab_field}")
+
+        mask = self._mask(snapshot, **filters)
+        column = snapshot.columns[lab_field]
+        mask &= ~np.isnan(column) & ~np.isnat(snapshot.timestamps)
+
+        buckets = snapshot.timestamps[mask].astype(TIME_BUCKETS[bucket])
+        values = column[mask]
+        if values.size == 0:
+            return {"field": lab_field, "bucket": bucket, "series": []}
+
+        keys, inverse = np.unique(buckets, return_inverse=True)
+        counts = np.bincount(inverse)
+        sums = np.bincount(inverse, weights=values)
+        return {
+            "field": lab_field,
+            "bucket": bucket,
+            "series": [
+                {"bucket": str(key), "count": int(n), "mean": float(total / n)}
+                for key, n, total in zip(keys, counts, sums)
+            ],
+        }
+
+    def info(self) -> Dict[str, Any]:
+        snapshot = self.snapshot
+        return {
+            "rows": len(snapshot),
+            "doctors": len(snapshot.doctors),
+            "clinics": len(snapshot.clinics),
+            "watermark": snapshot.watermark,
+            "archived_excluded": snapshot.archived_excluded,
+            "built_at": datetime.fromtimestamp(snapshot.built_at).isoformat() if snapshot.built_at else None,
+            "memory_bytes": snapshot.nbytes(),
+            "fields": LAB_FIELDS,
+            "categories": sorted(CLINICAL_CATEGORIES),
+        }
+
+
+# Global instance
+lab_analytics = LabAnalyticsEngine()
@@ -0,0 +1,250 @@
+"""
+Speculative AI pre-analysis.
+
+With AI_PREANALYSIS_ENABLED, every stored intake queues a draft analysis,
+so the doctor's `/doctor/analyze` call can return without waiting for
+Gemini. Drafts are background work and never compete with doctors:
+- a draft only starts while nothing waits for admission and more than
+  AI_PREANALYSIS_RESERVED_SLOTS AI slots are idle
+- speculative calls draw on their own token bucket
+  (AI_PREANALYSIS_PER_MINUTE / _BURST), not on doctor or clinic budgets
+
+A draft is encrypted like any other payload and stored in `analysis_drafts`
+together with the version of the record it was computed from (record_id
+plus a hash of the ciphertext). It is only used while that version is still
+current; otherwise it is dropped and the analysis runs as usual. Storing a
+record queues a new draft, which replaces an outdated one. Rule-based
+fallback results are never kept as drafts.
+
+The queue lives in memory, per process. Jobs lost on restart only mean the
+doctor's call runs the analysis itself, as it did before.
+"""
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from app.config import settings
+from app.services.ai_service import analyze_patient_data
+from app.services.audit_log import audit_log
+from app.services.crypto_mock import crypto_service
+from app.services.db_service import db_service
+from app.services.executor import run_cpu_bound
+from app.services.profiler import profiler
+from app.services.rate_limiter import RateLimitExceeded, TokenBucket, admission_controller
+from app.services.records import decrypt_patient_models
+
+logger = logging.getLogger(__name__)
+
+
+def record_version(encrypted_record: Dict[str, Any]) -> str:
+    """Identifies the record contents a draft was computed from (key re-wraps keep it)"""
+    digest = hashlib.sha256(encrypted_record["encrypted_blob"].encode("utf-8")).hexdigest()[:32]
+    return f"{encrypted_record['record_id']}:{digest}"
+
+
+class PreAnalysisQueue:
+    """Low-priority background queue of speculative AI analyses"""
+
+    def __init__(
+        self,
+        enabled: bool,
+        per_minute: float,
+        burst: float,
+        reserved_slots: int,
+        max_queue: int,
+        idle_poll_seconds: float,
+    ):
+        self.enabled = enabled
+        self.budget = TokenBucket(rate=per_minute / 60.0, capacity=max(burst, 1.0))
+        self.reserved_slots = reserved_slots
+        self.max_queue = max_queue
+        self.idle_poll_seconds = idle_poll_seconds
+        self._pending: "OrderedDict[str, None]" = OrderedDict()
+        self._running: Dict[str, asyncio.Future] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {
+            "queued": 0,
+            "dropped": 0,
+            "drafted": 0,
+            "skipped": 0,
+            "fallback_discarded": 0,
+            "failed": 0,
+            "draft_hits": 0,
+            "draft_stale": 0,
+            "draft_misses": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Producing drafts
+    # ------------------------------------------------------------------
+
+    def notify_record_stored(self, appointment_id: UUID):
+        """Queue a draft for a new or changed record (no-op when disabled)"""
+        if not self.enabled:
+            return
+        key = str(appointment_id)
+        if key in self._pending:
+            return
+        if len(self._pending) >= self.max_queue:
+            self.metrics["dropped"] += 1
+            return
+        self._pending[key] = None
+        self.metrics["queued"] += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _wait_for_capacity(self):
+        """Block until the speculative budget has a token and the AI slots are idle enough"""
+        # Keep at least one slot for doctors, however small this worker's share is
+        reserved = min(self.reserved_slots, admission_controller.max_concurrent - 1)
+        while True:
+            wait = self.budget.wait_time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            elif admission_controller.has_spare_capacity(reserved):
+                self.budget.consume()
+                return
+            else:
+                await asyncio.sleep(self.idle_poll_seconds)
+
+    async def draft(self, appointment_id: str):
+        """Compute and store the draft for one appointment, unless it is done or current"""
+        version = await db_service.get_record_version(appointment_id)
+        if version is None or version["status"] == "completed":
+            self.metrics["skipped"] += 1
+            return
+
+        encrypted_record = await db_service.get_encrypted_record(appointment_id)
+        current = record_version(encrypted_record)
+        existing = await db_service.get_analysis_draft(appointment_id)
+        if existing is not None and existing["record_version"] == current:
+            self.metrics["skipped"] += 1
+            return
+
+        intake_model, lab_model = await decrypt_patient_models(encrypted_record)
+        await audit_log.record("ai.preanalysis.run", [appointment_id])
+
+        async with admission_controller.slot():
+            ai_result = await analyze_patient_data(intake_model, lab_model)
+        if ai_result.is_fallback:
+            # The doctor's own call may still reach Gemini
+            self.metrics["fallback_discarded"] += 1
+            return
+
+        with profiler.stage("crypto"):
+            encrypted_draft, wrapped_key = await run_cpu_bound(crypto_service.encrypt, ai_result.dict())
+        await db_service.store_analysis_draft(appointment_id, current, encrypted_draft, wrapped_key)
+        self.metrics["drafted"] += 1
+        logger.info(f"Stored speculative analysis draft for appointment {appointment_id}")
+
+    async def _run_loop(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            await self._wait_for_capacity()
+            if not self._pending:
+                # Every queued appointment was analyzed by its doctor meanwhile
+                continue
+            appointment_id, _ = self._pending.popitem(last=False)
+
+            done = asyncio.get_running_loop().create_future()
+            self._running[appointment_id] = done
+            try:
+                await self.draft(appointment_id)
+            except RateLimitExceeded:
+                # Doctors arrived between the capacity check and the slot; try later
+                self._pending.setdefault(appointment_id, None)
+            except Exception as e:
+                self.metrics["failed"] += 1
+                logger.error(f"Speculative analysis of appointment {appointment_id} failed: {e}")
+            finally:
+                del self._running[appointment_id]
+                done.set_result(None)
+
+    def start(self):
+        """Start the background worker"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            if self._pending:
+                self._wakeup.set()
+            self._task = asyncio.create_task(self._run_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ------------------------------------------------------------------
+    # Consuming drafts
+    # ------------------------------------------------------------------
+
+    async def take(self, appointment_id: UUID, encrypted_record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        The decrypted draft analysis for the record as it is now, or None.
+        A queued draft is cancelled (the caller analyzes now); one in flight
+        is awaited, since it is further along than a fresh call would be.
+        """
+        if not self.enabled:
+            return None
+        key = str(appointment_id)
+        self._pending.pop(key, None)
+        running = self._running.get(key)
+        if running is not None:
+            await asyncio.shield(running)
+
+        draft = await db_service.get_analysis_draft(appointment_id)
+        if draft is None:
+            self.metrics["draft_misses"] += 1
+            return None
+        if draft["record_version"] != record_version(encrypted_record):
+            self.metrics["draft_stale"] += 1
+            await db_service.delete_analysis_draft(appointment_id)
+            return None
+
+        with profiler.stage("crypto"):
+            ai_analysis = await run_cpu_bound(crypto_service.decrypt, draft["encrypted_draft"], draft["wrapped_key"])
+        self.metrics["draft_hits"] += 1
+        return ai_analysis
+
+    async def discard(self, appointment_id: UUID):
+        """Drop the draft once the consultation is approved (best effort)"""
+        if not self.enabled:
+            return
+        self._pending.pop(str(appointment_id), None)
+        try:
+            await db_service.delete_analysis_draft(appointment_id)
+        except Exception as e:
+            logger.warning(f"Could not delete analysis draft of appointment {appointment_id}: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "pending": len(self._pending),
+            "running": len(self._running),
+            "max_queue": self.max_queue,
+            "budget": self.budget.snapshot(),
+            **self.metrics,
+        }
+
+
+# Global instance; like the admission budgets, each worker gets its share
+_workers = max(settings.WORKER_PROCESSES, 1)
+preanalysis = PreAnalysisQueue(
+    enabled=settings.AI_PREANALYSIS_ENABLED,
+    per_minute=settings.AI_PREANALYSIS_PER_MINUTE / _workers,
+    burst=settings.AI_PREANALYSIS_BURST / _workers,
+    reserved_slots=settings.AI_PREANALYSIS_RESERVED_SLOTS,
+    max_queue=settings.AI_PREANALYSIS_MAX_QUEUE,
+    idle_poll_seconds=settings.AI_PREANALYSIS_IDLE_POLL_SECONDS,
+)
@@ -0,0 +1,402 @@
+"""
+On-demand request profiling (admin-only).
+
+Switched on at runtime with POST /ops/profiling (or PROFILING_ENABLED at
+boot) for a fraction of requests, optionally only on some routes. For each
+profiled request:
+- a sampler thread records its stack every `interval_ms`, on the event loop
+  while its task is running and on the pool threads running its DB and
+  crypto calls
+- with `memory` on, tracemalloc traces are snapshotted and cleared at every
+  stage boundary, so the allocations made in between (and still live) are
+  charged to that stage, along with the segment's peak
+
+Samples and allocations are grouped by stage ("db", "crypto", "validation",
+"ai", and "app" for routing, handlers and serialisation) and written as
+collapsed stacks (`<route>;<stage>;frame;...;frame <count>`), the input
+format of flamegraph.pl, inferno and speedscope. `.folded` files count
+samples, `.alloc.folded` files count bytes allocated.
+
+tracemalloc is process-wide, so memory profiling takes it over, and
+concurrent requests show up in each other's allocations; profile one route
+at a low rate for clean numbers.
+
+While profiling is off the middleware does one attribute check, `stage()`
+one ContextVar lookup, and neither the sampler nor tracemalloc runs. State
+is per worker process.
+"""
+import asyncio
+import functools
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+STAGE_APP = "app"
+MAX_STACK_DEPTH = 128
+
+_session: ContextVar[Optional["ProfileSession"]] = ContextVar("profile_session", default=None)
+_stage: ContextVar[str] = ContextVar("profile_stage", default=STAGE_APP)
+_NOOP = nullcontext()
+_SKIP_FILES = (__file__, tracemalloc.__file__)
+_tracemalloc_lock = threading.Lock()  # Traces are process-wide; boundaries clear them
+
+
+def _short_path(filename: str) -> str:
+    if "site-packages" in filename:
+        return filename.split("site-packages" + os.sep, 1)[-1]
+    cwd = os.getcwd() + os.sep
+    return filename[len(cwd):] if filename.startswith(cwd) else os.path.basename(filename)
+
+
+class ProfileSession:
+    """Stack samples and allocations for one profiled request"""
+
+    def __init__(self, path: str, memory: bool):
+        self.label = path
+        self.name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.memory = memory
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.samples: Counter = Counter()  # (stage, folded stack) -> samples
+        self.allocations: Counter = Counter()  # (stage, folded stack) -> bytes
+        self.peaks: Counter = Counter()  # stage -> highest traced memory within one segment
+        if memory:
+            with _tracemalloc_lock:
+                if tracemalloc.is_tracing():
+                    tracemalloc.clear_traces()
+
+    def boundary(self, stage: str):
+        """
+        Charge allocations made since the previous boundary, and still live,
+        to `stage`. Traces are cleared at every boundary, so each snapshot
+        only holds the last segment and stays cheap to take.
+        """
+        if not self.memory:
+            return
+        with _tracemalloc_lock:
+            if not tracemalloc.is_tracing():
+                return
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.clear_traces()
+        self.peaks[stage] = max(self.peaks[stage], peak)
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, filename) for filename in _SKIP_FILES])
+        for stat in snapshot.statistics("traceback"):
+            stack = ";".join(f"{_short_path(frame.filename)}:{frame.lineno}" for frame in reversed(stat.traceback))
+            self.allocations[(stage, stack)] += stat.size
+
+    def summary(self) -> Dict[str, Any]:
+        stage_samples, stage_bytes = Counter(), Counter()
+        for (stage, _), count in self.samples.items():
+            stage_samples[stage] += count
+        for (stage, _), size in self.allocations.items():
+            stage_bytes[stage] += size
+        return {
+            "name": self.name,
+            "route": self.label,
+            "duration_seconds": self.duration,
+            "samples": dict(stage_samples),
+            "allocated_bytes": dict(stage_bytes) if self.memory else None,
+            "peak_bytes": dict(self.peaks) if self.memory else None,
+        }
+
+
+class _StageScope:
+    """Marks the current task (or pool thread) as working on one stage"""
+
+    def __init__(self, profiler: "Profiler", session: ProfileSession, name: str):
+        self.profiler = profiler
+        self.session = session
+        self.name = name
+
+    def __enter__(self):
+        self.session.boundary(_stage.get())
+        self._token = _stage.set(self.name)
+        self._key = self.profiler._current_key()
+        self._previous = self.profiler._active.get(self._key)
+        self.profiler._active[self._key] = (self.session, self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.session.boundary(self.name)
+        _stage.reset(self._token)
+        if self._previous is None:
+            self.profiler._active.pop(self._key, None)
+        else:
+            self.profiler._active[self._key] = self._previous
+        return False
+
+
+class Profiler:
+    """Samples selected requests' stacks and allocations, grouped by stage"""
+
+    def __init__(self, output_dir: str):
+        self.output_dir = Path(output_dir)
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.routes: List[str] = []
+        self.interval = 0.005
+        self.memory = False
+        self.max_profiles = 0
+        self.expires_at: Optional[float] = None
+        self.profiles_started = 0
+        self.recent: deque = deque(maxlen=50)
+        # Task (event loop) or thread ident (pool) -> (session, stage)
+        self._active: Dict[Any, Tuple[ProfileSession, str]] = {}
+        self._loop_threads: Dict[asyncio.AbstractEventLoop, int] = {}
+        self._finished: deque = deque()
+        self._in_flight = 0
+        self._sampler: Optional[threading.Thread] = None
+        self._sampler_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._started_tracemalloc = False
+        self._code_labels: Dict[Any, str] = {}  # code object -> "func (file:line)" frame
+
+    def enable(
+        self,
+        sample_rate: float,
+        routes: Optional[List[str]] = None,
+        interval_ms: float = 5.0,
+        memory: bool = False,
+        max_profiles: int = 200,
+        duration_seconds: Optional[float] = None,
+    ):
+        """Start profiling `sample_rate` of requests whose path contains one of `routes`"""
+        self.sample_rate = sample_rate
+        self.routes = list(routes or [])
+        self.interval = interval_ms / 1000.0
+        self.memory = memory
+        self.max_profiles = max_profiles
+        self.profiles_started = 0
+        self.expires_at = time.monotonic() + duration_seconds if duration_seconds else None
+        with self._sampler_lock:
+            if memory and not tracemalloc.is_tracing():
+                tracemalloc.start(settings.PROFILING_TRACEBACK_DEPTH)
+                self._started_tracemalloc = True
+            self._stop.clear()
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._sampler.start()
+        self.enabled = True
+        logger.info(
+            f"Profiling on: rate={sample_rate}, routes={self.routes or 'all'}, "
+            f"interval={interval_ms}ms, memory={memory}"
+        )
+
+    def disable(self, wait: bool = False):
+        """
+        Stop selecting requests. The sampler keeps going until in-flight
+        profiles finish, writes them, then exits (`wait` blocks until then).
+        """
+        self.enabled = False
+        self._stop.set()
+        sampler = self._sampler
+        if wait and sampler is not None:
+            sampler.join(timeout=5.0)
+        logger.info(f"Profiling off after {self.profiles_started} profile(s)")
+
+    def _selected(self, path: str) -> bool:
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            self.disable()
+            return False
+        if self.max_profiles and self.profiles_started >= self.max_profiles:
+            self.disable()
+            return False
+        if self.routes and not any(route in path for route in self.routes):
+            return False
+        return random.random() < self.sample_rate
+
+    def begin(self, path: str) -> Optional[Tuple[ProfileSession, Any]]:
+        """Start profiling the current request if it is selected"""
+        if not self._selected(path):
+            return None
+        self.profiles_started += 1
+        self._in_flight += 1
+        task = asyncio.current_task()
+        self._loop_threads[asyncio.get_running_loop()] = threading.get_ident()
+        session = ProfileSession(path, self.memory and tracemalloc.is_tracing())
+        token = _session.set(session)
+        self._active[task] = (session, STAGE_APP)
+        return session, token
+
+    def end(self, started: Tuple[ProfileSession, Any], label: str):
+        session, token = started
+        session.boundary(STAGE_APP)
+        session.label = label
+        session.duration = time.perf_counter() - session.started
+        self._active.pop(asyncio.current_task(), None)
+        _session.reset(token)
+        self._in_flight -= 1
+        # Written by the sampler thread, off the request path
+        self._finished.append(session)
+
+    def stage(self, name: str):
+        """Context manager tagging the enclosed work (sync or awaited) with a stage"""
+        session = _session.get()
+        if session is None:
+            return _NOOP
+        return _StageScope(self, session, name)
+
+    def staged(self, name: str):
+        """Decorator form of `stage()` for coroutine functions"""
+        def decorate(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def bind(self, func: Callable, default_stage: str) -> Callable:
+        """Wrap a pool job so its thread is sampled for the calling request"""
+        session = _session.get()
+        if session is None:
+            return func
+        stage = _stage.get()
+        stage = default_stage if stage == STAGE_APP else stage
+
+        def run():
+            ident = threading.get_ident()
+            self._active[ident] = (session, stage)
+            token, stage_token = _session.set(session), _stage.set(stage)
+            try:
+                return func()
+            finally:
+                _stage.reset(stage_token)
+                _session.reset(token)
+                self._active.pop(ident, None)
+
+        return run
+
+    def _current_key(self):
+        try:
+            return asyncio.current_task() or threading.get_ident()
+        except RuntimeError:
+            return threading.get_ident()
+
+    def _fold(self, frame) -> str:
+        """Root-first collapsed stack of a thread's current frame"""
+        frames = []
+        while frame is not None and len(frames) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            if code.co_filename != __file__:
+                label = self._code_labels.get(code)
+                if label is None:
+                    label = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+                    self._code_labels[code] = label
+                frames.append(label)
+            frame = frame.f_back
+        frames.reverse()
+        return ";".join(frames)
+
+    def _sample(self):
+        frames = sys._current_frames()
+        targets = []
+        for loop, ident in list(self._loop_threads.items()):
+            task = asyncio.tasks._current_tasks.get(loop)
+            entry = self._active.get(task) if task is not None else None
+            if entry is not None:
+                targets.append((ident, entry))
+        for key, entry in list(self._active.items()):
+            if isinstance(key, int):
+                targets.append((key, entry))
+        for ident, (session, stage) in targets:
+            frame = frames.get(ident)
+            if frame is not None:
+                session.samples[(stage, self._fold(frame))] += 1
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self._sample()
+                self._write_finished()
+            except Exception as e:
+                logger.error(f"Profiler sample failed: {e}")
+            if self._stop.is_set() and not self._in_flight:
+                with self._sampler_lock:
+                    if self._stop.is_set():
+                        self._sampler = None
+                        if self._started_tracemalloc:
+                            tracemalloc.stop()
+                            self._started_tracemalloc = False
+                        break
+        self._write_finished()
+
+    def _write_finished(self):
+        while self._finished:
+            session = self._finished.popleft()
+            try:
+                self._write(session)
+            except Exception as e:
+                logger.error(f"Failed to write profile {session.name}: {e}")
+
+    def _write(self, session: ProfileSession):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        root = re.sub(r"[;\s]+", "_", session.label)
+        outputs = [(".folded", session.samples)]
+        if session.memory:
+            outputs.append((".alloc.folded", session.allocations))
+        files = []
+        for suffix, counts in outputs:
+            path = self.output_dir / f"{session.name}{suffix}"
+            with open(path, "w", encoding="utf-8") as output:
+                for (stage, stack), count in counts.items():
+                    output.write(f"{root};{stage};{stack} {count}\n" if stack else f"{root};{stage} {count}\n")
+            files.append(path.name)
+        self.recent.append({**session.summary(), "files": files})
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "pid": os.getpid(),
+            "sample_rate": self.sample_rate,
+            "routes": self.routes,
+            "interval_ms": self.interval * 1000.0,
+            "memory": self.memory,
+            "profiles_started": self.profiles_started,
+            "max_profiles": self.max_profiles,
+            "expires_in_seconds": (
+                max(0.0, self.expires_at - time.monotonic()) if self.expires_at is not None else None
+            ),
+            "in_flight": self._in_flight,
+            "output_dir": str(self.output_dir),
+            "recent": list(self.recent),
+        }
+
+
+class ProfilingMiddleware:
+    """ASGI middleware selecting requests for profiling (plain ASGI, so handlers run in the same task)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not profiler.enabled or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = profiler.begin(scope["path"])
+        if started is None:
+            return await self.app(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = scope.get("route")
+            profiler.end(started, f"{scope['method']} {getattr(route, 'path', scope['path'])}")
+
+
+profiler = Profiler(settings.PROFILING_OUTPUT_DIR)
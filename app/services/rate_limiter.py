@@ -0,0 +1,218 @@
+"""
+Admission control for Gemini-backed endpoints.
+
+Two layers sit in front of `analyze_patient_data`:
+- token buckets per doctor and per clinic, so one tenant cannot burn the
+  shared Gemini quota
+- a global concurrency budget with a bounded, deadline-limited queue, so a
+  spike is queued briefly or shed with Retry-After instead of failing
+  every request at once
+
+State is per process. Under the multi-worker launcher each worker gets
+1/WORKER_PROCESSES of every budget, so the totals stay as configured.
+"""
+import asyncio
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """Request rejected by admission control"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        """Retry-After value in whole seconds"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens/second"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.rejected = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Seconds until `tokens` are available (0 if available now)"""
+        self._refill()
+        if self.tokens >= tokens:
+            return 0.0
+        if self.rate <= 0:
+            return math.inf
+        return (tokens - self.tokens) / self.rate
+
+    def consume(self, tokens: float = 1.0):
+        """Take tokens; callers check `wait_time()` first"""
+        self._refill()
+        self.tokens -= tokens
+
+    def snapshot(self) -> Dict[str, float]:
+        self._refill()
+        return {
+            "tokens": round(self.tokens, 3),
+            "capacity": self.capacity,
+            "rate_per_minute": self.rate * 60,
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionController:
+    """Per-tenant rate limits plus a global concurrency budget"""
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout: float,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._in_flight = 0
+        self._queued = 0
+        self._admitted = 0
+        self._shed = 0
+        self._recent_call_seconds: List[float] = []
+
+    # ------------------------------------------------------------------
+    # Tenant rate limits
+    # ------------------------------------------------------------------
+
+    def _bucket_for(self, scope: str, tenant_id: str) -> TokenBucket:
+        key = f"{scope}:{tenant_id}"
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if scope == "doctor":
+                per_minute = settings.RATE_LIMIT_DOCTOR_PER_MINUTE
+                burst = settings.RATE_LIMIT_DOCTOR_BURST
+            else:
+                per_minute = settings.RATE_LIMIT_CLINIC_PER_MINUTE
+                burst = settings.RATE_LIMIT_CLINIC_BURST
+
+            override = settings.RATE_LIMIT_OVERRIDES.get(key, {})
+            per_minute = override.get("per_minute", per_minute)
+            burst = override.get("burst", burst)
+
+            # Each worker process enforces its share of the tenant's budget
+            workers = max(settings.WORKER_PROCESSES, 1)
+            bucket = TokenBucket(rate=per_minute / 60.0 / workers, capacity=max(burst / workers, 1.0))
+            self._buckets[key] = bucket
+        return bucket
+
+    def _buckets_for_doctor(self, doctor_id: str) -> List[Tuple[str, TokenBucket]]:
+        buckets = [("doctor", self._bucket_for("doctor", doctor_id))]
+        clinic_id = settings.DOCTOR_CLINICS.get(doctor_id)
+        if clinic_id:
+            buckets.append(("clinic", self._bucket_for("clinic", clinic_id)))
+        return buckets
+
+    def check_rate(self, doctor_id) -> None:
+        """
+        Consume one token from the doctor's bucket and their clinic's bucket.
+        Tokens are only taken if every bucket has one, so a rejection never
+        leaves a tenant partially charged.
+        """
+        doctor_id = str(doctor_id)
+        buckets = self._buckets_for_doctor(doctor_id)
+
+        waits = [(scope, bucket, bucket.wait_time()) for scope, bucket in buckets]
+        blocked = [(scope, bucket, wait) for scope, bucket, wait in waits if wait > 0]
+        if blocked:
+            scope, bucket, wait = max(blocked, key=lambda item: item[2])
+            bucket.rejected += 1
+            self._shed += 1
+            logger.warning(f"Rate limit hit for doctor {doctor_id} ({scope} bucket), retry in {wait:.1f}s")
+            raise RateLimitExceeded(f"Rate limit exceeded for {scope}", retry_after=wait)
+
+        for _, bucket in buckets:
+            bucket.consume()
+
+    # ------------------------------------------------------------------
+    # Global concurrency budget
+    # ------------------------------------------------------------------
+
+    def _estimated_wait(self) -> float:
+        """Rough time until a slot frees up, from recent call durations"""
+        if not self._recent_call_seconds:
+            return self.queue_timeout
+        average = sum(self._recent_call_seconds) / len(self._recent_call_seconds)
+        return average * (self._queued + 1) / self.max_concurrent
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the global AI concurrency slots for the duration of a call"""
+        if self._semaphore.locked() and self._queued >= self.max_queue:
+            self._shed += 1
+            raise RateLimitExceeded("AI analysis is at capacity", retry_after=self._estimated_wait())
+
+        self._queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._shed += 1
+            raise RateLimitExceeded("Timed out waiting for AI capacity", retry_after=self._estimated_wait())
+        finally:
+            self._queued -= 1
+
+        self._in_flight += 1
+        self._admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+            self._recent_call_seconds.append(time.monotonic() - started)
+            del self._recent_call_seconds[:-50]
+
+    def has_spare_capacity(self, reserved: int = 0) -> bool:
+        """True if nothing is queued and more than `reserved` slots are idle (for background work)"""
+        return self._queued == 0 and self.max_concurrent - self._in_flight > reserved
+
+    def snapshot(self, tenant_id: Optional[str] = None) -> Dict[str, object]:
+        """Live limiter state for capacity planning"""
+        buckets = {
+            key: bucket.snapshot()
+            for key, bucket in self._buckets.items()
+            if tenant_id is None or key.endswith(f":{tenant_id}")
+        }
+        return {
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "admitted_total": self._admitted,
+            "shed_total": self._shed,
+            "buckets": buckets,
+        }
+
+
+# Global instance
+_workers = max(settings.WORKER_PROCESSES, 1)
+admission_controller = AdmissionController(
+    max_concurrent=math.ceil(settings.ADMISSION_MAX_CONCURRENT_AI_CALLS / _workers),
+    max_queue=math.ceil(settings.ADMISSION_MAX_QUEUE / _workers),
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+)
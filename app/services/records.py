@@ -0,0 +1,76 @@
+"""Shared helpers for reading encrypted patient records"""
+import asyncio
+import logging
+from typing import Any, Dict, Tuple, Type, TypeVar
+
+from pydantic import BaseModel
+
+from app.models.schemas import LabResults, PatientIntakeData
+from app.services.crypto_mock import crypto_service
+from app.services.executor import run_cpu_bound
+from app.services.profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+async def decrypt_patient_data(encrypted_record: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Decrypt an encrypted_records row into (intake_data, lab_results).
+    The outer layer is decrypted first; the two inner layers are
+    independent and run in parallel on the CPU pool.
+    """
+    wrapped_key = encrypted_record["wrapped_key"]
+    
+    with profiler.stage("crypto"):
+        # Decrypt the outer layer
+        decrypted_outer = await run_cpu_bound(
+            crypto_service.decrypt,
+            encrypted_record["encrypted_blob"],
+            wrapped_key,
+        )
+        
+        # Decrypt the inner layers
+        intake_data, lab_results = await asyncio.gather(
+            run_cpu_bound(crypto_service.decrypt, decrypted_outer["encrypted_intake"], wrapped_key),
+            run_cpu_bound(crypto_service.decrypt, decrypted_outer["encrypted_lab_results"], wrapped_key),
+        )
+    return intake_data, lab_results
+
+
+def _decrypt_model(model: Type[ModelT], encrypted_data: Any, wrapped_key: str) -> ModelT:
+    """
+    Decrypt one layer straight into a model. The fast path validates the
+    JSON plaintext in a single pydantic-core pass (no intermediate dict);
+    legacy encodings fall back to `decrypt()` + `model_validate()`.
+    """
+    try:
+        with profiler.stage("crypto"):
+            plaintext = crypto_service.decrypt_bytes(encrypted_data, wrapped_key)
+    except Exception:
+        with profiler.stage("crypto"):
+            data = crypto_service.decrypt(encrypted_data, wrapped_key)
+        with profiler.stage("validation"):
+            return model.model_validate(data)
+    with profiler.stage("validation"):
+        return model.model_validate_json(plaintext)
+
+
+async def decrypt_patient_models(encrypted_record: Dict[str, Any]) -> Tuple[PatientIntakeData, LabResults]:
+    """Like `decrypt_patient_data`, but returns validated models for analysis"""
+    wrapped_key = encrypted_record["wrapped_key"]
+    
+    with profiler.stage("crypto"):
+        decrypted_outer = await run_cpu_bound(
+            crypto_service.decrypt,
+            encrypted_record["encrypted_blob"],
+            wrapped_key,
+        )
+    
+    # Each job tags its own crypto and validation parts
+    intake_model, lab_model = await asyncio.gather(
+        run_cpu_bound(_decrypt_model, PatientIntakeData, decrypted_outer["encrypted_intake"], wrapped_key),
+        run_cpu_bound(_decrypt_model, LabResults, decrypted_outer["encrypted_lab_results"], wrapped_key),
+    )
+    return intake_model, lab_model
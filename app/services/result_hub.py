@@ -0,0 +1,96 @@
+"""
+In-process notification hub for consultation results.
+
+Patients waiting on a result subscribe here instead of polling the
+database. `store_consultation_result` calls `notify()` after the insert,
+which wakes every waiter for that appointment at once.
+
+With several worker processes, the storing worker also publishes the
+appointment ID on the shared cache's message ring, and `watch_shared()` in
+every worker reads the new messages and turns them into local `notify()`
+calls. Idle waiters cost nothing per tick. Only if a worker falls a whole
+ring behind does it check every waiting appointment's `result_ready`
+marker instead.
+"""
+import asyncio
+import logging
+from typing import Dict, Set
+
+logger = logging.getLogger(__name__)
+
+
+class ResultNotificationHub:
+    """Fan-out of "result ready" signals keyed by appointment ID"""
+
+    def __init__(self):
+        # One bare future per waiter keeps idle waiters cheap (no tasks,
+        # no per-waiter Event objects, no DB connections)
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+
+    @property
+    def waiter_count(self) -> int:
+        """Number of clients currently waiting across all appointments"""
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def subscribe(self, appointment_id) -> asyncio.Future:
+        """Register interest in an appointment and return the future to await"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(str(appointment_id), set()).add(future)
+        return future
+
+    def unsubscribe(self, appointment_id, future: asyncio.Future):
+        """Drop a waiter (timeout, disconnect or already woken)"""
+        key = str(appointment_id)
+        waiters = self._waiters.get(key)
+        if not waiters:
+            return
+        waiters.discard(future)
+        if not waiters:
+            del self._waiters[key]
+
+    def notify(self, appointment_id) -> int:
+        """Wake all waiters for an appointment. Returns how many were woken."""
+        waiters = self._waiters.pop(str(appointment_id), None)
+        if not waiters:
+            return 0
+
+        woken = 0
+        for future in waiters:
+            if not future.done():
+                future.set_result(True)
+                woken += 1
+
+        logger.info(f"Woke {woken} waiter(s) for appointment {appointment_id}")
+        return woken
+
+    async def wait(self, future: asyncio.Future, timeout: float) -> bool:
+        """
+        Wait on a future obtained from `subscribe()`.
+        Returns True if notified, False on timeout. The future stays
+        registered on timeout so callers can keep waiting (e.g. between
+        SSE heartbeats); call `unsubscribe()` when done.
+        """
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def watch_shared(self, cache, interval: float):
+        """Wake local waiters for results stored by other worker processes"""
+        position = cache.publish_position()
+        while True:
+            await asyncio.sleep(interval)
+            position, appointment_ids, lost = cache.published_since(position)
+            for appointment_id in appointment_ids:
+                if appointment_id in self._waiters:
+                    self.notify(appointment_id)
+            if lost:
+                logger.warning("Missed result notifications; checking every waiting appointment")
+                for appointment_id in list(self._waiters):
+                    if cache.get("result_ready", appointment_id):
+                        self.notify(appointment_id)
+
+
+# Global instance
+result_hub = ResultNotificationHub()
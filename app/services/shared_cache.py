@@ -0,0 +1,314 @@
+"""
+Cross-worker cache for read-mostly data.
+
+In multi-process mode (`python -m app.server`) the launcher creates one
+shared-memory segment and every worker attaches to it, so the doctor
+directory and consultation results are held once and a miss in one
+worker warms the others.
+
+The segment is a direct-mapped table of fixed-size slots. Readers never
+lock: each slot carries a sequence number that is odd while a write is in
+progress, and a read that sees it change is treated as a miss. Writers
+take a byte-range lock on the slot. A colliding key simply replaces the
+slot's previous entry; this is a cache, not a store.
+
+After the slots the segment holds a small ring of published messages
+(e.g. "result ready for appointment X"). Each entry carries the message
+number it was written for, so a reader that keeps its last position can
+read just what is new and can tell if it fell a full ring behind.
+
+Without a segment (single-process/dev mode) the same API is served from a
+small in-process LRU, so callers do not need to care which mode they run in.
+"""
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+try:
+    import fcntl
+    from multiprocessing import shared_memory
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+    shared_memory = None
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"QSPACHE2"
+_SEGMENT_HEADER = struct.Struct("<8sIII")  # magic, slots, slot size, ring entries
+# sequence, key hash, expires at (epoch seconds), payload length
+_SLOT_HEADER = struct.Struct("<QQdI4x")
+_SEQUENCE = struct.Struct("<Q")
+# message number, payload length; followed by the payload
+_RING_ENTRY = struct.Struct("<QB7x")
+_RING_ENTRY_SIZE = 64
+_RING_PAYLOAD_MAX = _RING_ENTRY_SIZE - _RING_ENTRY.size
+
+
+def _key_hash(namespace: str, key: str) -> int:
+    digest = hashlib.blake2b(f"{namespace}\0{key}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class SharedCache:
+    """Namespaced JSON cache shared by all workers of one server"""
+
+    def __init__(self, local_max_entries: int = 4096, local_ring_entries: int = 4096):
+        self._shm = None
+        self._buf = None
+        self._lock_fd = None
+        self.slots = 0
+        self.slot_size = 0
+        self.ring_entries = local_ring_entries
+        self._local: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._local_max_entries = local_max_entries
+        self._local_ring: deque = deque(maxlen=local_ring_entries)
+        self._local_head = 0
+        self.stats = {"hits": 0, "misses": 0, "sets": 0, "oversize": 0, "published": 0}
+
+    @property
+    def shared(self) -> bool:
+        return self._buf is not None
+
+    # ------------------------------------------------------------------
+    # Segment lifecycle
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _lock_path(name: str) -> str:
+        return os.path.join(tempfile.gettempdir(), f"{name}.lock")
+
+    @classmethod
+    def create_segment(cls, name: str, slots: int, slot_size: int, ring_entries: int = 4096):
+        """Create and initialise a segment (launcher only). Returns the SharedMemory handle."""
+        if shared_memory is None:
+            raise RuntimeError("Shared-memory cache is not supported on this platform")
+        if slot_size <= _SLOT_HEADER.size:
+            raise ValueError("SHARED_CACHE_SLOT_BYTES is too small")
+        if ring_entries < 1:
+            raise ValueError("SHARED_CACHE_RING_ENTRIES must be at least 1")
+
+        ring_size = _SEQUENCE.size + ring_entries * _RING_ENTRY_SIZE
+        segment = shared_memory.SharedMemory(
+            name=name, create=True, size=_SEGMENT_HEADER.size + slots * slot_size + ring_size
+        )
+        segment.buf[:] = bytes(segment.size)
+        _SEGMENT_HEADER.pack_into(segment.buf, 0, _MAGIC, slots, slot_size, ring_entries)
+        open(cls._lock_path(name), "a").close()
+        return segment
+
+    @classmethod
+    def remove_segment(cls, segment):
+        name = segment.name
+        segment.close()
+        segment.unlink()
+        try:
+            os.unlink(cls._lock_path(name))
+        except FileNotFoundError:
+            pass
+
+    def attach(self, name: str):
+        """Attach this process to a segment created by the launcher"""
+        # Workers are spawned by the launcher and share its resource
+        # tracker, so attaching does not make a worker's exit unlink the
+        # segment; the launcher unlinks it once all workers have stopped
+        segment = shared_memory.SharedMemory(name=name)
+
+        magic, slots, slot_size, ring_entries = _SEGMENT_HEADER.unpack_from(segment.buf, 0)
+        if magic != _MAGIC:
+            segment.close()
+            raise RuntimeError(f"Shared memory segment {name} is not a cache segment")
+
+        self._shm = segment
+        self._buf = segment.buf
+        self.slots = slots
+        self.slot_size = slot_size
+        self.ring_entries = ring_entries
+        self._lock_fd = os.open(self._lock_path(name), os.O_RDWR | os.O_CREAT, 0o600)
+        logger.info(f"Attached to shared cache {name} ({slots} slots x {slot_size} bytes)")
+
+    def detach(self):
+        if self._shm is None:
+            return
+        self._buf = None
+        self._shm.close()
+        self._shm = None
+        os.close(self._lock_fd)
+        self._lock_fd = None
+
+    # ------------------------------------------------------------------
+    # Get / set
+    # ------------------------------------------------------------------
+
+    def _slot_offset(self, key_hash: int) -> int:
+        return _SEGMENT_HEADER.size + (key_hash % self.slots) * self.slot_size
+
+    def get(self, namespace: str, key: Any) -> Optional[Any]:
+        """Cached value, or None on miss/expiry"""
+        key = str(key)
+        value = self._get_shared(namespace, key) if self.shared else self._get_local(namespace, key)
+        self.stats["hits" if value is not None else "misses"] += 1
+        return value
+
+    def set(self, namespace: str, key: Any, value: Any, ttl: float) -> bool:
+        """Cache a JSON-serialisable value for `ttl` seconds"""
+        key = str(key)
+        expires_at = time.time() + ttl
+        if self.shared:
+            stored = self._set_shared(namespace, key, value, expires_at)
+        else:
+            stored = self._set_local(namespace, key, value, expires_at)
+        if stored:
+            self.stats["sets"] += 1
+        return stored
+
+    def _get_shared(self, namespace: str, key: str) -> Optional[Any]:
+        key_hash = _key_hash(namespace, key)
+        offset = self._slot_offset(key_hash)
+
+        sequence, slot_hash, expires_at, length = _SLOT_HEADER.unpack_from(self._buf, offset)
+        if sequence & 1 or slot_hash != key_hash or expires_at < time.time():
+            return None
+        payload = bytes(self._buf[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + length])
+        if _SEQUENCE.unpack_from(self._buf, offset)[0] != sequence:
+            return None  # Torn read: a writer got in between
+
+        stored_namespace, stored_key, value = json.loads(payload)
+        if stored_namespace != namespace or stored_key != key:
+            return None  # 64-bit hash collision
+        return value
+
+    def _set_shared(self, namespace: str, key: str, value: Any, expires_at: float) -> bool:
+        payload = json.dumps([namespace, key, value], default=str, separators=(",", ":")).encode("utf-8")
+        if len(payload) > self.slot_size - _SLOT_HEADER.size:
+            self.stats["oversize"] += 1
+            return False
+
+        key_hash = _key_hash(namespace, key)
+        offset = self._slot_offset(key_hash)
+        slot_index = key_hash % self.slots
+
+        fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, slot_index)
+        try:
+            sequence = _SEQUENCE.unpack_from(self._buf, offset)[0]
+            _SEQUENCE.pack_into(self._buf, offset, sequence + 1)
+            start = offset + _SLOT_HEADER.size
+            self._buf[start:start + len(payload)] = payload
+            _SLOT_HEADER.pack_into(self._buf, offset, sequence + 1, key_hash, expires_at, len(payload))
+            _SEQUENCE.pack_into(self._buf, offset, sequence + 2)
+        finally:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, slot_index)
+        return True
+
+    def _get_local(self, namespace: str, key: str) -> Optional[Any]:
+        entry = self._local.get((namespace, key))
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._local[(namespace, key)]
+            return None
+        self._local.move_to_end((namespace, key))
+        return value
+
+    def _set_local(self, namespace: str, key: str, value: Any, expires_at: float) -> bool:
+        self._local[(namespace, key)] = (expires_at, value)
+        self._local.move_to_end((namespace, key))
+        while len(self._local) > self._local_max_entries:
+            self._local.popitem(last=False)
+        return True
+
+    # ------------------------------------------------------------------
+    # Published messages
+    # ------------------------------------------------------------------
+
+    @property
+    def _ring_offset(self) -> int:
+        return _SEGMENT_HEADER.size + self.slots * self.slot_size
+
+    def _ring_entry_offset(self, number: int) -> int:
+        return self._ring_offset + _SEQUENCE.size + (number % self.ring_entries) * _RING_ENTRY_SIZE
+
+    def publish(self, message: Any) -> bool:
+        """Append a short message (up to 48 bytes, e.g. an ID) to the ring for every worker"""
+        payload = str(message).encode("utf-8")
+        if len(payload) > _RING_PAYLOAD_MAX:
+            self.stats["oversize"] += 1
+            return False
+
+        self.stats["published"] += 1
+        if not self.shared:
+            self._local_head += 1
+            self._local_ring.append((self._local_head, payload.decode("utf-8")))
+            return True
+
+        # The byte after the slot locks guards the ring
+        fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, self.slots)
+        try:
+            number = _SEQUENCE.unpack_from(self._buf, self._ring_offset)[0] + 1
+            offset = self._ring_entry_offset(number)
+            # Invalidate the entry first so a reader never pairs the old number with the new payload
+            _RING_ENTRY.pack_into(self._buf, offset, 0, 0)
+            start = offset + _RING_ENTRY.size
+            self._buf[start:start + len(payload)] = payload
+            _RING_ENTRY.pack_into(self._buf, offset, number, len(payload))
+            _SEQUENCE.pack_into(self._buf, self._ring_offset, number)
+        finally:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, self.slots)
+        return True
+
+    def publish_position(self) -> int:
+        """Number of the newest published message (start reading from here)"""
+        if not self.shared:
+            return self._local_head
+        return _SEQUENCE.unpack_from(self._buf, self._ring_offset)[0]
+
+    def published_since(self, position: int) -> Tuple[int, List[str], bool]:
+        """
+        Messages published after `position`: (new position, messages, lost).
+        `lost` is True if older messages were overwritten before they were read.
+        """
+        if not self.shared:
+            head = self._local_head
+            messages = [message for number, message in self._local_ring if number > position]
+            return head, messages, head - position > len(messages)
+
+        head = _SEQUENCE.unpack_from(self._buf, self._ring_offset)[0]
+        first = max(position, head - self.ring_entries) + 1
+        lost = first > position + 1
+        messages = []
+        for number in range(first, head + 1):
+            offset = self._ring_entry_offset(number)
+            stored_number, length = _RING_ENTRY.unpack_from(self._buf, offset)
+            payload = bytes(self._buf[offset + _RING_ENTRY.size:offset + _RING_ENTRY.size + length])
+            if stored_number != number or _SEQUENCE.unpack_from(self._buf, offset)[0] != number:
+                lost = True  # Overwritten by a newer message while we read
+                continue
+            messages.append(payload.decode("utf-8"))
+        return head, messages, lost
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "mode": "shared" if self.shared else "local",
+            "segment": self._shm.name if self._shm else None,
+            "slots": self.slots if self.shared else self._local_max_entries,
+            "slot_bytes": self.slot_size or None,
+            "ring_entries": self.ring_entries,
+            **self.stats,
+        }
+
+
+# Global instance (attached to the launcher's segment when one is configured)
+shared_cache = SharedCache()
+if settings.SHARED_CACHE_NAME:
+    try:
+        shared_cache.attach(settings.SHARED_CACHE_NAME)
+    except Exception as e:
+        logger.warning(f"Shared cache {settings.SHARED_CACHE_NAME} unavailable, using in-process cache: {e}")
@@ -0,0 +1,133 @@
+"""
+Schema-constrained Gemini output.
+
+`response_schema_for` turns a Pydantic model into the OpenAPI subset
+Gemini accepts as `response_schema`, so the model is forced to emit JSON
+of exactly that shape (no fences, no prose, no hand-repair).
+
+`OutputTracker` sizes `max_output_tokens` from what responses actually
+use (a high percentile of recent output token counts plus headroom)
+instead of a fixed ceiling, raises it after a truncated response (until
+enough responses in a row fit again), and keeps parse-failure /
+truncation rates for /ops.
+"""
+import logging
+from collections import deque
+from typing import Any, Dict, Iterable, Optional, Type
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Keys of a Pydantic JSON schema that Gemini's Schema proto understands
+_SCHEMA_KEYS = ("type", "format", "description", "nullable", "enum", "items", "properties", "required")
+
+
+def _convert(node: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in node:
+        resolved = dict(defs[node["$ref"].rsplit("/", 1)[-1]])
+        if "description" in node:
+            resolved["description"] = node["description"]
+        return _convert(resolved, defs)
+
+    if "anyOf" in node:
+        # Optional[X] -> X, nullable
+        variants = [variant for variant in node["anyOf"] if variant.get("type") != "null"]
+        converted = _convert({**variants[0], **{k: v for k, v in node.items() if k != "anyOf"}}, defs)
+        if len(variants) < len(node["anyOf"]):
+            converted["nullable"] = True
+        return converted
+
+    schema = {key: node[key] for key in _SCHEMA_KEYS if key in node}
+    if "items" in schema:
+        schema["items"] = _convert(schema["items"], defs)
+    if "properties" in schema:
+        schema["properties"] = {
+            name: _convert(prop, defs) for name, prop in schema["properties"].items()
+        }
+    return schema
+
+
+def response_schema_for(model: Type[BaseModel], exclude: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Gemini `response_schema` for `model`, minus the `exclude` fields.
+    Every remaining field is required, so the model always fills it.
+    """
+    json_schema = model.model_json_schema()
+    schema = _convert(json_schema, json_schema.get("$defs", {}))
+    for name in exclude:
+        schema["properties"].pop(name, None)
+    schema["required"] = list(schema["properties"])
+    return schema
+
+
+class OutputTracker:
+    """Adaptive max_output_tokens plus parse/truncation metrics for one call site"""
+
+    def __init__(
+        self,
+        min_tokens: int,
+        max_tokens: int,
+        percentile: float,
+        headroom: float,
+        window_size: int,
+        floor_decay_responses: int,
+    ):
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.percentile = percentile
+        self.headroom = headroom
+        self.floor_decay_responses = floor_decay_responses
+        self._samples: deque = deque(maxlen=window_size)
+        # Raised after truncations, dropped again after floor_decay_responses
+        # untruncated responses; never below what recent outputs need
+        self._floor = min_tokens
+        self._since_truncation = 0
+        self.metrics = {"responses": 0, "parse_failures": 0, "truncations": 0, "repaired": 0}
+
+    def token_limit(self) -> int:
+        """max_output_tokens for the next request"""
+        limit = self._floor
+        if self._samples:
+            ordered = sorted(self._samples)
+            index = min(int(round(self.percentile / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+            limit = max(limit, int(ordered[index] * self.headroom))
+        return min(max(limit, self.min_tokens), self.max_tokens)
+
+    def observe(self, output_tokens: Optional[int], truncated: bool):
+        """
+        Record one response. A truncated one doubles the limit (up to the
+        cap); after `floor_decay_responses` responses without truncation the
+        limit falls back to the percentile estimate, which by then includes
+        the long outputs the raised limit let through.
+        """
+        self.metrics["responses"] += 1
+        if truncated:
+            self.metrics["truncations"] += 1
+            self._since_truncation = 0
+            previous = self.token_limit()
+            self._floor = min(previous * 2, self.max_tokens)
+            logger.warning(f"AI output truncated at {previous} tokens; max_output_tokens now {self.token_limit()}")
+            return
+
+        if output_tokens:
+            self._samples.append(output_tokens)
+        if self._floor > self.min_tokens:
+            self._since_truncation += 1
+            if self._since_truncation >= self.floor_decay_responses:
+                self._floor = self.min_tokens
+                self._since_truncation = 0
+                logger.info(f"No truncations in {self.floor_decay_responses} responses; max_output_tokens now {self.token_limit()}")
+
+    def parse_failed(self, repaired: bool = False):
+        self.metrics["parse_failures" if not repaired else "repaired"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        responses = self.metrics["responses"] or 1
+        return {
+            **self.metrics,
+            "parse_failure_rate": self.metrics["parse_failures"] / responses,
+            "truncation_rate": self.metrics["truncations"] / responses,
+            "max_output_tokens": self.token_limit(),
+            "output_token_samples": len(self._samples),
+        }
@@ -0,0 +1,69 @@
+"""
+Per-worker warm-up.
+
+Runs once at startup so the first requests a worker serves do not pay for
+thread creation, zstd contexts, key unwrapping or doctor-directory misses.
+Failures are logged and never block startup.
+"""
+import asyncio
+import logging
+import time
+
+from app.config import settings
+from app.models.schemas import LabResults, PatientIntakeData, RawIntakeSubmission
+from app.services.crypto_mock import crypto_service
+from app.services.db_service import db_service
+from app.services.executor import run_blocking_io, run_cpu_bound
+from app.services.shared_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTAKE = {
+    "age": 45,
+    "gender": "Male",
+    "chief_complaint": "Increased thirst and fatigue",
+    "symptoms": "Increased thirst, frequent urination, fatigue for 3 months",
+    "medical_history": "Hypertension, Family history of Type 2 Diabetes",
+    "current_medications": ["Lisinopril 10mg daily"],
+    "fasting_glucose": 165.0,
+    "hba1c": 7.8,
+}
+
+
+def _warm_codecs():
+    """Round-trip a sample payload through validation, crypto and compression"""
+    submission = RawIntakeSubmission.model_validate(SAMPLE_INTAKE)
+    encrypted_intake, wrapped_key = crypto_service.encrypt(submission.intake_payload())
+    encrypted_labs, _ = crypto_service.encrypt(submission.lab_payload())
+    PatientIntakeData.model_validate_json(crypto_service.decrypt_bytes(encrypted_intake, wrapped_key))
+    LabResults.model_validate(crypto_service.decrypt(encrypted_labs, wrapped_key))
+
+
+async def _warm_doctor_directory():
+    """Load the doctor directory into the cache once per server, not per worker"""
+    if shared_cache.get("warmup", "doctor_directory"):
+        return 0
+    doctors = await db_service.list_doctors()
+    for doctor in doctors:
+        shared_cache.set("doctor", doctor["doctor_id"], doctor["name"], ttl=settings.DOCTOR_DIRECTORY_TTL_SECONDS)
+    shared_cache.set("warmup", "doctor_directory", True, ttl=settings.DOCTOR_DIRECTORY_TTL_SECONDS)
+    return len(doctors)
+
+
+async def warm_up_worker():
+    """Warm this worker's pools, codecs and caches"""
+    started = time.perf_counter()
+
+    steps = {
+        # Start every pool thread now rather than on the first burst
+        "io_pool": asyncio.gather(*(run_blocking_io(int) for _ in range(settings.DB_WORKER_THREADS))),
+        "cpu_pool": asyncio.gather(*(run_cpu_bound(_warm_codecs) for _ in range(settings.CPU_WORKER_THREADS))),
+        "doctor_directory": _warm_doctor_directory(),
+    }
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    for name, result in zip(steps, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Warm-up step {name} failed: {result}")
+
+    elapsed = (time.perf_counter() - started) * 1000
+    logger.info(f"Worker warm-up finished in {elapsed:.0f} ms (shared cache: {shared_cache.info()['mode']})")
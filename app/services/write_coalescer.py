@@ -0,0 +1,138 @@
+"""
+Write-behind coalescing of concurrent inserts.
+
+Under a burst of submissions every request used to send its own INSERT.
+With DB_WRITE_COALESCING_ENABLED, `insert()` instead queues the row.
+Rows for the same table (and the same column set, so the bulk insert never
+has to invent values for missing columns) are sent as one multi-row INSERT
+once DB_WRITE_COALESCE_WINDOW_MS has passed since the first row, or as soon
+as DB_WRITE_COALESCE_MAX_ROWS are waiting. A bulk INSERT is one statement,
+so it commits or fails as a whole.
+
+A caller's `await insert(...)` returns only after the batch containing its
+row has committed. If a batch fails, its rows are retried one by one, so
+only the caller whose row is bad sees the error.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from app.config import settings
+from app.database import get_db
+from app.services.executor import run_blocking_io
+from app.services.hedging import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+BatchKey = Tuple[str, FrozenSet[str]]
+
+
+class _Batch:
+    def __init__(self):
+        self.rows: List[Dict[str, Any]] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class WriteCoalescer:
+    """Gathers inserts that arrive within a short window into bulk inserts"""
+
+    def __init__(self, window_ms: float, max_rows: int, metrics_window: int = 1000):
+        self.window_ms = window_ms
+        self.max_rows = max_rows
+        self._batches: Dict[BatchKey, _Batch] = {}
+        self._flushes: set = set()
+        self.flush_latencies = LatencyTracker(window_size=metrics_window)
+        self.batch_sizes = LatencyTracker(window_size=metrics_window)
+        self.metrics = {"batches": 0, "batched_rows": 0, "failed_batches": 0, "row_retries": 0, "row_failures": 0}
+
+    async def insert(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue one row; returns the inserted row once its batch has committed"""
+        loop = asyncio.get_running_loop()
+        key = (table, frozenset(row))
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch()
+            batch.timer = loop.call_later(self.window_ms / 1000.0, self._start_flush, key, batch)
+
+        future = loop.create_future()
+        batch.rows.append(row)
+        batch.futures.append(future)
+        if len(batch.rows) >= self.max_rows:
+            batch.timer.cancel()
+            self._start_flush(key, batch)
+        return await future
+
+    def _start_flush(self, key: BatchKey, batch: _Batch):
+        # Close the batch; rows arriving from now on open a new one
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+        task = asyncio.ensure_future(self._flush(key[0], batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, table: str, batch: _Batch):
+        started = time.monotonic()
+        try:
+            db = get_db()
+            result = await run_blocking_io(db.table(table).insert(batch.rows).execute)
+        except Exception as e:
+            self.metrics["failed_batches"] += 1
+            logger.warning(f"Bulk insert of {len(batch.rows)} row(s) into {table} failed ({e}); retrying rows individually")
+            await self._flush_individually(table, batch)
+            return
+        finally:
+            self.flush_latencies.observe(time.monotonic() - started)
+
+        self.metrics["batches"] += 1
+        self.metrics["batched_rows"] += len(batch.rows)
+        self.batch_sizes.observe(len(batch.rows))
+        inserted = result.data or []
+        for index, future in enumerate(batch.futures):
+            if not future.done():
+                future.set_result(inserted[index] if index < len(inserted) else batch.rows[index])
+
+    async def _flush_individually(self, table: str, batch: _Batch):
+        db = get_db()
+        for row, future in zip(batch.rows, batch.futures):
+            self.metrics["row_retries"] += 1
+            try:
+                result = await run_blocking_io(db.table(table).insert(row).execute)
+            except Exception as e:
+                self.metrics["row_failures"] += 1
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if not future.done():
+                future.set_result(result.data[0] if result.data else row)
+
+    async def drain(self):
+        """Flush everything queued now and wait for in-flight batches (shutdown)"""
+        for key, batch in list(self._batches.items()):
+            batch.timer.cancel()
+            self._start_flush(key, batch)
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        batches = self.metrics["batches"] or 1
+        return {
+            "window_ms": self.window_ms,
+            "max_rows": self.max_rows,
+            **self.metrics,
+            "pending_rows": sum(len(batch.rows) for batch in self._batches.values()),
+            "flushes_in_flight": len(self._flushes),
+            "mean_batch_size": self.metrics["batched_rows"] / batches if self.metrics["batches"] else None,
+            "batch_size_p50": self.batch_sizes.percentile(50),
+            "batch_size_max": self.batch_sizes.percentile(100),
+            "flush_latency_p50_seconds": self.flush_latencies.percentile(50),
+            "flush_latency_p95_seconds": self.flush_latencies.percentile(95),
+            "flush_latency_p99_seconds": self.flush_latencies.percentile(99),
+        }
+
+
+write_coalescer = WriteCoalescer(
+    window_ms=settings.DB_WRITE_COALESCE_WINDOW_MS,
+    max_rows=settings.DB_WRITE_COALESCE_MAX_ROWS,
+)
@@ -6,6 +6,7 @@ import { doctorAPI } from '../services/api';
 const DoctorDashboard = () => {
   const navigate = useNavigate();
   const [appointments, setAppointments] = useState([]);
+  const [statusCounts, setStatusCounts] = useState({});
   const [selectedAppointment, setSelectedAppointment] = useState(null);
   const [patientRecord, setPatientRecord] = useState(null);
   const [aiAnalysis, setAiAnalysis] = useState(null);
@@ -23,8 +24,9 @@ const DoctorDashboard = () => {
   const fetchAppointments = async () => {
     try {
       setLoading(true);
-      const data = await doctorAPI.getAppointments(DOCTOR_ID);
-      setAppointments(data);
+      const data = await doctorAPI.getDashboard(DOCTOR_ID);
+      setAppointments(data.appointments);
+      setStatusCounts(data.status_counts);
     } catch (error) {
       console.error('Error fetching appointments:', error);
       alert('Failed to load appointments');
@@ -124,6 +126,16 @@ const DoctorDashboard = () => {
                 Appointments
               </h2>
 
+              {Object.keys(statusCounts).length > 0 && (
+                <div className="flex flex-wrap gap-2 mb-4">
+                  {Object.entries(statusCounts).map(([status, count]) => (
+                    <span key={status} className="text-xs px-2 py-1 rounded bg-gray-100 text-gray-700">
+                      {status}: {count}
+                    </span>
+                  ))}
+                </div>
+              )}
+
               {loading && appointments.length === 0 && (
                 <div className="text-center py-8">
                   <div className="animate-spin h-8 w-8 border-4 border-primary-600 border-t-transparent rounded-full mx-auto"></div>
@@ -161,6 +173,16 @@ const DoctorDashboard = () => {
                     <p className="text-xs text-gray-500">
                       {new Date(apt.appointment_time).toLocaleDateString()}
                     </p>
+                    {apt.triage && (
+                      <p className="text-sm text-gray-700 mt-1">
+                        {apt.triage.age}y {apt.triage.gender} · {apt.triage.chief_complaint}
+                      </p>
+                    )}
+                    {apt.triage?.lab_flags?.length > 0 && (
+                      <p className="text-xs text-red-600 mt-1">
+                        {apt.triage.lab_flags.length} lab flag{apt.triage.lab_flags.length > 1 ? 's' : ''}
+                      </p>
+                    )}
                     <div className="mt-2 flex items-center space-x-2">
                       <span className={`text-xs px-2 py-1 rounded ${
                         apt.status === 'completed' ? 'bg-green-100 text-green-700' : 'bg-yellow-100 text-yellow-700'
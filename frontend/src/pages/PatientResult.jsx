@@ -141,6 +141,12 @@ export default function PatientResult() {
                   AI-Assisted Analysis
                 </h2>
 
+                {result.ai_analysis.is_fallback && (
+                  <div className="mb-4 p-3 bg-yellow-50 border border-yellow-200 rounded text-sm text-yellow-800">
+                    The AI service was unavailable, so this assessment was generated from standard lab thresholds. Your doctor has reviewed your results.
+                  </div>
+                )}
+
                 <div className="space-y-4">
                   {/* Risk Score */}
                   {result.ai_analysis.risk_score && (
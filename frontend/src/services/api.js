@@ -20,6 +20,19 @@ export const patientAPI = {
     const response = await api.get(`/api/v1/patient/result/${appointmentId}`);
     return response.data;
   },
+  
+  // Long-poll: resolves as soon as the result is approved (404 on timeout)
+  waitForResult: async (appointmentId, timeoutSeconds = 25) => {
+    const response = await api.get(`/api/v1/patient/result/${appointmentId}/wait`, {
+      params: { timeout: timeoutSeconds },
+      timeout: (timeoutSeconds + 5) * 1000,
+    });
+    return response.data;
+  },
+  
+  // Server-Sent Events stream; listen for the `result` event
+  resultEvents: (appointmentId) =>
+    new EventSource(`${API_BASE_URL}/api/v1/patient/result/${appointmentId}/events`),
 };
 
 // Doctor API
@@ -31,6 +44,14 @@ export const doctorAPI = {
     return response.data;
   },
   
+  // One round trip: page of appointments, status counts and triage summaries
+  getDashboard: async (doctorId, { limit = 25, offset = 0, status } = {}) => {
+    const response = await api.get('/api/v1/doctor/dashboard', {
+      params: { doctor_id: doctorId, limit, offset, status }
+    });
+    return response.data;
+  },
+  
   getPatientRecord: async (appointmentId) => {
     const response = await api.get(`/api/v1/doctor/record/${appointmentId}`);
     return response.data;
@@ -0,0 +1,41 @@
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.config import settings
+from app.services.archival import ArchivalJob
+from app.services.archive import consultation_archive
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old completed consultations to the cold archive")
+    parser.add_argument("--after-days", type=float, default=settings.ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--purge-grace-seconds", type=float, default=settings.ARCHIVE_PURGE_GRACE_SECONDS,
+                        help="Only delete hot rows archived at least this long ago")
+    parser.add_argument("--lookup", default=None, help="Print the archived entry for one appointment_id and exit")
+    args = parser.parse_args()
+
+    if args.lookup:
+        entry = asyncio.run(consultation_archive.get(args.lookup))
+        print(json.dumps(entry, indent=2) if entry else "not archived")
+        return
+
+    job = ArchivalJob(
+        archive=consultation_archive,
+        after_days=args.after_days,
+        batch_size=args.batch_size,
+        purge_grace_seconds=args.purge_grace_seconds,
+    )
+    totals = asyncio.run(job.run())
+    print(json.dumps({**totals, "archive": consultation_archive.snapshot()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.services.blind_index import blind_indexer
+from app.services.db_service import db_service
+from app.services.records import decrypt_patient_data
+
+
+async def backfill(batch_size: int, after: str = None):
+    """Recompute blind_tokens for every encrypted record, page by page"""
+    updated = 0
+    while True:
+        page = await db_service.list_encrypted_records_page(after, batch_size)
+        if not page:
+            break
+
+        for record in page:
+            try:
+                intake_data, lab_results = await decrypt_patient_data(record)
+            except Exception as e:
+                print(f"Skipping {record['record_id']}: {e}")
+                continue
+            tokens = blind_indexer.tokens_for_record(intake_data, lab_results)
+            await db_service.update_blind_tokens(record["record_id"], tokens)
+            updated += 1
+
+        after = page[-1]["record_id"]
+        print(f"Indexed {updated} records (resume with --after {after})")
+        if len(page) < batch_size:
+            break
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill or rebuild blind-index search tokens")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--after", default=None, help="Resume after this record_id")
+    args = parser.parse_args()
+
+    total = asyncio.run(backfill(args.batch_size, args.after))
+    print(f"Done: {total} records indexed")
+
+
+if __name__ == "__main__":
+    main()
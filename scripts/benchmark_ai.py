@@ -0,0 +1,102 @@
+"""
+Offline throughput/latency benchmark for analyze_patient_data.
+
+Runs against the replay stand-in (no Gemini key or network needed), so the
+breaker, hedging, retries, timeouts and fallback all behave as in
+production but reproducibly. Fixtures recorded with AI_BACKEND=record are
+used when present; otherwise a built-in analysis is served.
+
+    python scripts/benchmark_ai.py --requests 200 --concurrency 20 --profile heavy_tail --error-rate 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--profile", default="typical", help="instant, fast, typical, slow, heavy_tail or recorded")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every replayed delay")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-kind", default="unavailable")
+    parser.add_argument("--capacity", type=int, default=0, help="Simulated model concurrency limit (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def configure(args):
+    # Settings are read at import time, so set them before importing the app
+    os.environ.update({
+        "AI_BACKEND": "replay",
+        "AI_REPLAY_LATENCY_PROFILE": args.profile,
+        "AI_REPLAY_LATENCY_SCALE": str(args.scale),
+        "AI_REPLAY_ERROR_RATE": str(args.error_rate),
+        "AI_REPLAY_ERROR_KIND": args.error_kind,
+        "AI_REPLAY_MAX_CONCURRENCY": str(args.capacity),
+        "AI_REPLAY_SEED": str(args.seed),
+    })
+
+
+async def run(args):
+    from app.models.schemas import LabResults, PatientIntakeData
+    from app.services.ai_service import analyze_patient_data, gemini_breaker, gemini_requester
+    from app.services.gemini_standin import gemini_standin
+
+    intake = PatientIntakeData(
+        age=45,
+        gender="Male",
+        chief_complaint="Increased thirst and fatigue",
+        symptoms="Increased thirst, frequent urination, fatigue for 3 months",
+        symptom_duration="3 months",
+        medical_history=["Hypertension (5 years)"],
+    )
+    labs = LabResults(fasting_glucose=165.0, hba1c=7.8, blood_pressure_systolic=142, blood_pressure_diastolic=91, bmi=31.2)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, fallbacks, errors = [], 0, 0
+
+    async def one():
+        nonlocal fallbacks, errors
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                result = await analyze_patient_data(intake, labs)
+                fallbacks += result.is_fallback
+            except Exception:
+                errors += 1
+            latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(int(round(p / 100 * (len(latencies) - 1))), len(latencies) - 1)]
+
+    print(f"\n{args.requests} requests, concurrency {args.concurrency}, profile {args.profile} x{args.scale}, "
+          f"error rate {args.error_rate:.0%} ({args.error_kind})")
+    print(f"  throughput   {args.requests / elapsed:8.1f} req/s  ({elapsed:.2f}s)")
+    print(f"  latency      p50 {pct(50):.3f}s  p95 {pct(95):.3f}s  p99 {pct(99):.3f}s  max {latencies[-1]:.3f}s")
+    print(f"  fallbacks    {fallbacks}   errors {errors}")
+    requester = gemini_requester.snapshot()
+    print(f"  attempts     {requester['attempts']}  hedges {requester['hedges_sent']} (won {requester['hedge_wins']})  "
+          f"retries {requester['retries']}")
+    print(f"  breaker      {gemini_breaker.snapshot()['state']}  opened {gemini_breaker.snapshot()['opened']}x")
+    print(f"  stand-in     {gemini_standin.snapshot()}")
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    configure(arguments)
+    asyncio.run(run(arguments))
@@ -0,0 +1,103 @@
+"""
+Micro-benchmark for intake validation, comparing the old and new paths.
+
+Ingest
+  old: hand-built dicts from request.json(), no validation
+  new: RawIntakeSubmission.model_validate (typed, normalised once)
+Analysis (per /doctor/analyze call, inner layers only)
+  old: decrypt() -> dict -> PatientIntakeData(**) / LabResults(**)
+  new: decrypt_bytes() -> Model.model_validate_json (single pydantic-core pass)
+"""
+import logging
+import sys
+import timeit
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.models.schemas import LabResults, PatientIntakeData, RawIntakeSubmission
+from app.services.crypto_mock import crypto_service
+
+RAW = {
+    "age": 45,
+    "gender": "Male",
+    "chief_complaint": "Increased thirst and fatigue",
+    "symptoms": "Increased thirst, frequent urination, fatigue for 3 months",
+    "symptom_duration": "3 months",
+    "medical_history": ["Hypertension (5 years)", "Family history of Type 2 Diabetes"],
+    "current_medications": ["Lisinopril 10mg daily"],
+    "allergies": [],
+    "fasting_glucose": 165.0,
+    "hba1c": 7.8,
+    "blood_pressure_systolic": 142,
+    "blood_pressure_diastolic": 91,
+    "bmi": 31.2,
+    "cholesterol_total": 235.0,
+    "cholesterol_ldl": 155.0,
+    "cholesterol_hdl": 38.0,
+    "triglycerides": 210.0,
+}
+
+INTAKE_KEYS = [
+    "age", "gender", "chief_complaint", "symptoms", "symptom_duration",
+    "medical_history", "current_medications", "allergies",
+]
+LAB_KEYS = [
+    "fasting_glucose", "hba1c", "blood_pressure_systolic", "blood_pressure_diastolic",
+    "bmi", "cholesterol_total", "cholesterol_ldl", "cholesterol_hdl", "triglycerides",
+]
+
+
+def old_ingest():
+    return {k: RAW.get(k) for k in INTAKE_KEYS}, {k: RAW.get(k) for k in LAB_KEYS}
+
+
+def new_ingest():
+    submission = RawIntakeSubmission.model_validate(RAW)
+    return submission.intake_payload(), submission.lab_payload()
+
+
+INTAKE, LABS = new_ingest()
+ENCRYPTED_INTAKE, KEY = crypto_service.encrypt(INTAKE)
+ENCRYPTED_LABS, _ = crypto_service.encrypt(LABS)
+
+
+def old_analysis():
+    intake = crypto_service.decrypt(ENCRYPTED_INTAKE, KEY)
+    labs = crypto_service.decrypt(ENCRYPTED_LABS, KEY)
+    return PatientIntakeData(**intake), LabResults(**labs)
+
+
+def new_analysis():
+    return (
+        PatientIntakeData.model_validate_json(crypto_service.decrypt_bytes(ENCRYPTED_INTAKE, KEY)),
+        LabResults.model_validate_json(crypto_service.decrypt_bytes(ENCRYPTED_LABS, KEY)),
+    )
+
+
+def bench(func, number=20000):
+    best = min(timeit.repeat(func, number=number, repeat=7))
+    return best / number * 1e6
+
+
+def main():
+    # Per-call log lines would dominate the measurement
+    logging.disable(logging.INFO)
+
+    results = {
+        "ingest (old, unvalidated)": bench(old_ingest),
+        "ingest (new, typed + normalised)": bench(new_ingest),
+        "analysis decode (old)": bench(old_analysis),
+        "analysis decode (new)": bench(new_analysis),
+    }
+    for name, micros in results.items():
+        print(f"{name:<34} {micros:8.2f} us/op")
+
+    speedup = results["analysis decode (old)"] / results["analysis decode (new)"]
+    print(f"\nPer-analysis decode + validation speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
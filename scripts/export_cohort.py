@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.services.cohort_export import DEFAULT_FIELDS, EXPORT_FIELDS, CohortExportJob
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export a de-identified cohort (re-run with the same arguments to resume)"
+    )
+    parser.add_argument("output_dir")
+    parser.add_argument("--format", choices=["ndjson", "parquet"], default="ndjson")
+    parser.add_argument(
+        "--fields",
+        default=",".join(DEFAULT_FIELDS),
+        help=f"Comma-separated subset of: {', '.join(EXPORT_FIELDS)}",
+    )
+    parser.add_argument("--doctor-id", default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        job = CohortExportJob(
+            output_dir=args.output_dir,
+            fmt=args.format,
+            fields=args.fields.split(","),
+            doctor_id=args.doctor_id,
+            batch_size=args.batch_size,
+        )
+    except (RuntimeError, ValueError) as e:
+        sys.exit(str(e))
+    checkpoint = asyncio.run(job.run())
+    print(json.dumps(checkpoint, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.services.key_rotation import KeyRotationJob
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-wrap data keys under a new key epoch")
+    parser.add_argument("--epoch", type=int, default=None, help="Target epoch (default: KEY_EPOCH)")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: KEY_ROTATION_CHECKPOINT_PATH)")
+    parser.add_argument("--restart", action="store_true", help="Ignore any existing checkpoint")
+    args = parser.parse_args()
+
+    job = KeyRotationJob(
+        target_epoch=args.epoch,
+        batch_size=args.batch_size,
+        checkpoint_path=args.checkpoint,
+    )
+    if args.restart and job.checkpoint_path.exists():
+        job.checkpoint_path.unlink()
+
+    totals = asyncio.run(job.run())
+    print(json.dumps(totals, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Train the zstd dictionary used to compress stored payloads.
+
+Samples the decrypted intake, lab and consultation-result JSON already in
+the database and writes `clinical-<timestamp>.zdict` to
+COMPRESSION_DICTIONARY_DIR. Restart the API to start writing with it; keep
+older dictionaries in place, they are still needed to read existing rows.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import zstandard
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.config import settings
+from app.services.compression import DICTIONARY_SUFFIX, train_dictionary
+from app.services.crypto_mock import crypto_service
+from app.services.db_service import db_service
+from app.services.records import decrypt_patient_data
+
+
+def _sample(data) -> bytes:
+    # Same serialisation as CryptoService.encrypt
+    return json.dumps(data, default=str).encode("utf-8")
+
+
+async def collect_samples(max_samples: int, batch_size: int):
+    samples = []
+
+    after = None
+    while len(samples) < max_samples:
+        page = await db_service.list_encrypted_records_page(after, batch_size)
+        for record in page:
+            try:
+                intake_data, lab_results = await decrypt_patient_data(record)
+            except Exception as e:
+                print(f"Skipping record {record['record_id']}: {e}")
+                continue
+            samples += [_sample(intake_data), _sample(lab_results)]
+        if len(page) < batch_size:
+            break
+        after = page[-1]["record_id"]
+
+    after = None
+    while len(samples) < max_samples:
+        page = await db_service.list_consultation_results_page(after, batch_size)
+        for result in page:
+            try:
+                samples.append(_sample(crypto_service.decrypt(result["encrypted_result"], result["wrapped_key"])))
+            except Exception as e:
+                print(f"Skipping result {result['result_id']}: {e}")
+        if len(page) < batch_size:
+            break
+        after = page[-1]["result_id"]
+
+    return samples[:max_samples]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a zstd dictionary for clinical JSON payloads")
+    parser.add_argument("--max-samples", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dict-size", type=int, default=16 * 1024, help="Dictionary size in bytes")
+    parser.add_argument("--output-dir", default=settings.COMPRESSION_DICTIONARY_DIR)
+    args = parser.parse_args()
+
+    samples = asyncio.run(collect_samples(args.max_samples, args.batch_size))
+    if len(samples) < 100:
+        sys.exit(f"Only {len(samples)} samples found; need at least 100 to train a useful dictionary")
+
+    dictionary = train_dictionary(samples, args.dict_size)
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    path = output_dir / f"clinical-{time.strftime('%Y%m%d%H%M%S')}{DICTIONARY_SUFFIX}"
+    path.write_bytes(dictionary)
+
+    # Report the ratio on the training set, with and without the dictionary
+    level = settings.COMPRESSION_LEVEL
+    without_dict = zstandard.ZstdCompressor(level=level)
+    with_dict = zstandard.ZstdCompressor(level=level, dict_data=zstandard.ZstdCompressionDict(dictionary))
+    raw = sum(len(sample) for sample in samples)
+    plain = sum(len(without_dict.compress(sample)) for sample in samples)
+    trained = sum(len(with_dict.compress(sample)) for sample in samples)
+
+    print(f"Wrote {path} ({len(dictionary)} bytes) from {len(samples)} samples")
+    print(f"Raw {raw} bytes -> zstd {plain} ({plain / raw:.1%}) -> zstd+dict {trained} ({trained / raw:.1%})")
+
+
+if __name__ == "__main__":
+    main()
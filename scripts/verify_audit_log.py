@@ -0,0 +1,89 @@
+"""
+Verify the hash chains of the PHI access audit log.
+
+Reads every record (segment files in AUDIT_DIR, or the audit_log table with
+--db), groups them by chain, and re-checks sequence numbers, prev_hash links
+and record hashes. Exits non-zero if any chain is broken.
+
+Each chain's head (last seq and hash) is printed. Keep those somewhere
+else, or pass earlier ones back with --expect CHAIN_ID:SEQ:HASH: that is
+the only way to detect records cut off the end of a chain.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from app.config import settings
+from app.services.audit_log import SEGMENT_PREFIX, SEGMENT_SUFFIX, verify_chain
+
+
+def load_files(directory: str):
+    records = []
+    for path in sorted(Path(directory).glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}")):
+        with open(path, encoding="utf-8") as segment:
+            for line_number, line in enumerate(segment, 1):
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"{path.name}:{line_number}: unreadable line (torn write or tampering)")
+    return records
+
+
+async def load_db(batch_size: int):
+    from app.services.db_service import db_service
+
+    records, offset = [], 0
+    while True:
+        page = await db_service.list_audit_records_page(offset, batch_size)
+        records += page
+        if len(page) < batch_size:
+            return records
+        offset += batch_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify the audit log hash chains")
+    parser.add_argument("--dir", default=settings.AUDIT_DIR, help="Segment file directory")
+    parser.add_argument("--db", action="store_true", help="Verify the audit_log table instead of files")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--expect", action="append", default=[], metavar="CHAIN_ID:SEQ:HASH",
+                        help="A previously recorded chain head that must still be present")
+    args = parser.parse_args()
+
+    records = asyncio.run(load_db(args.batch_size)) if args.db else load_files(args.dir)
+
+    chains = defaultdict(list)
+    for record in records:
+        chains[record.get("chain_id")].append(record)
+
+    broken = 0
+    for chain_id, chain in sorted(chains.items(), key=lambda item: str(item[0])):
+        chain.sort(key=lambda record: record.get("seq", -1))
+        problems = verify_chain(chain)
+        head = chain[-1]
+        status = "OK" if not problems else f"BROKEN ({len(problems)} problem(s))"
+        print(f"{chain_id}: {len(chain)} record(s), head seq {head.get('seq')} {head.get('hash')} - {status}")
+        for problem in problems[:20]:
+            print(f"    {problem}")
+        broken += bool(problems)
+
+    by_seq = {(record.get("chain_id"), record.get("seq")): record.get("hash") for record in records}
+    for anchor in args.expect:
+        chain_id, seq, expected = anchor.rsplit(":", 2)
+        if by_seq.get((chain_id, int(seq))) != expected:
+            print(f"{chain_id}: expected head seq {seq} {expected} is missing or changed (truncated chain?)")
+            broken += 1
+
+    print(f"\n{len(records)} record(s) in {len(chains)} chain(s); {broken} problem chain(s)")
+    sys.exit(1 if broken else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import os
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+# Settings are loaded at import time; provide placeholders so modules that
+# read them can be imported without a real .env
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+os.environ.setdefault("EXPORT_PSEUDONYM_KEY", "test-export-pseudonym-key")
+os.environ.setdefault("BLIND_INDEX_KEY", "test-blind-index-key")
@@ -0,0 +1,91 @@
+from uuid import uuid4
+
+import pytest
+
+from app.services import archival
+from app.services.archival import ArchivalJob
+from app.services.archive import ConsultationArchive, FileArchiveStore
+
+
+def _archive(directory, block_size=8):
+    return ConsultationArchive(FileArchiveStore(str(directory)), block_size=block_size,
+                               compression_level=3, refresh_seconds=0)
+
+
+def _entry(appointment_id, note="n"):
+    return {
+        "appointment_id": appointment_id,
+        "encrypted_record": {"appointment_id": appointment_id, "encrypted_blob": "blob", "wrapped_key": "k"},
+        "consultation_result": {"appointment_id": appointment_id, "encrypted_result": note, "wrapped_key": "k"},
+    }
+
+
+@pytest.mark.asyncio
+async def test_segments_are_found_through_the_sparse_index(tmp_path):
+    ids = [str(uuid4()) for _ in range(100)]
+    writer = _archive(tmp_path)
+    await writer.write([_entry(i) for i in ids[:60]])
+    await writer.write([_entry(i) for i in ids[60:]])
+
+    # A fresh process only knows what is on disk
+    reader = _archive(tmp_path)
+    for appointment_id in ids[::7]:
+        record = await reader.get_encrypted_record(appointment_id)
+        assert record["appointment_id"] == appointment_id
+    assert await reader.get_consultation_result(str(uuid4())) is None
+
+    snapshot = reader.snapshot()
+    assert snapshot["segments"] == 2 and snapshot["entries"] == 100
+    # One block per hit; the Bloom filters rule out the other segment
+    assert snapshot["blocks_read"] - snapshot["bloom_false_positives"] == len(ids[::7])
+
+
+@pytest.mark.asyncio
+async def test_newest_copy_wins_and_new_segments_are_picked_up(tmp_path):
+    appointment_id = str(uuid4())
+    reader = _archive(tmp_path)
+    assert await reader.get(appointment_id) is None
+
+    writer = _archive(tmp_path)
+    await writer.write([_entry(appointment_id, "old")])
+    await writer.write([_entry(appointment_id, "new")])
+
+    result = await reader.get_consultation_result(appointment_id)
+    assert result["encrypted_result"] == "new"
+
+
+@pytest.mark.asyncio
+async def test_job_archives_before_marking_and_purges_after_the_grace_period(tmp_path, monkeypatch):
+    rows = [
+        {"appointment_id": str(uuid4()), "encrypted_records": [{"record_id": "r"}],
+         "consultation_results": {"result_id": "c"}}
+        for _ in range(3)
+    ]
+    calls = []
+    archivable_batches = [rows]
+    purgeable_batches = [[row["appointment_id"] for row in rows]]
+
+    async def archivable(completed_before, limit):
+        return archivable_batches.pop() if archivable_batches else []
+
+    async def mark(appointment_ids, archived_at):
+        calls.append(("mark", appointment_ids))
+
+    async def purgeable(archived_before, limit):
+        return purgeable_batches.pop() if purgeable_batches else []
+
+    async def delete(appointment_ids):
+        calls.append(("delete", appointment_ids))
+
+    monkeypatch.setattr(archival.db_service, "list_archivable_consultations", archivable)
+    monkeypatch.setattr(archival.db_service, "mark_appointments_archived", mark)
+    monkeypatch.setattr(archival.db_service, "list_purgeable_appointment_ids", purgeable)
+    monkeypatch.setattr(archival.db_service, "delete_hot_consultation_rows", delete)
+
+    archive = _archive(tmp_path)
+    totals = await ArchivalJob(archive, after_days=30, batch_size=10, purge_grace_seconds=0).run()
+
+    assert totals["archived"] == 3 and totals["purged"] == 3
+    assert [call[0] for call in calls] == ["mark", "delete"]
+    entry = await archive.get(rows[0]["appointment_id"])
+    assert entry["encrypted_record"] == {"record_id": "r"} and entry["consultation_result"] == {"result_id": "c"}
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from app.services.audit_log import AuditLog, verify_chain
+
+
+class MemorySink:
+    def __init__(self, fail_times=0):
+        self.records = []
+        self.fail_times = fail_times
+
+    def write(self, records):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise OSError("disk full")
+        self.records.extend(dict(record) for record in records)
+
+
+def _audit_log(sink, capacity=100, batch_size=10, on_full="block"):
+    return AuditLog(sink=sink, chain_id="test", capacity=capacity, batch_size=batch_size,
+                    flush_interval=0.01, on_full=on_full)
+
+
+@pytest.mark.asyncio
+async def test_flushed_records_form_a_verifiable_chain():
+    sink = MemorySink()
+    log = _audit_log(sink)
+    for i in range(25):
+        await log.record("doctor.record.read", [f"apt-{i}"], actor="doc")
+    assert await log.flush() == 25
+
+    assert [record["seq"] for record in sink.records] == list(range(25))
+    assert verify_chain(sink.records) == []
+    assert log.snapshot()["batches"] == 3
+
+    edited = [dict(record) for record in sink.records]
+    edited[5]["resource_ids"] = ["apt-999"]
+    assert any("hash mismatch" in problem for problem in verify_chain(edited))
+
+    removed = sink.records[:10] + sink.records[11:]
+    assert any("seq 11" in problem for problem in verify_chain(removed))
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_events_and_chain_position():
+    sink = MemorySink(fail_times=1)
+    log = _audit_log(sink)
+    await log.record("doctor.analysis.run", ["apt-1"])
+
+    assert await log.flush() == 0
+    assert log.snapshot()["queued"] == 1 and log.snapshot()["flush_errors"] == 1
+
+    assert await log.flush() == 1
+    assert sink.records[0]["seq"] == 0 and verify_chain(sink.records) == []
+
+
+@pytest.mark.asyncio
+async def test_full_ring_blocks_until_the_flusher_makes_room():
+    sink = MemorySink()
+    log = _audit_log(sink, capacity=4, batch_size=4)
+    log.start()
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*(log.record("doctor.dashboard.read", [i]) for i in range(20))),
+            timeout=2.0,
+        )
+    finally:
+        await log.stop()
+
+    snapshot = log.snapshot()
+    assert snapshot["blocked"] > 0 and snapshot["dropped"] == 0
+    assert len(sink.records) == 20 and verify_chain(sink.records) == []
+
+
+@pytest.mark.asyncio
+async def test_full_ring_drops_when_configured():
+    log = _audit_log(MemorySink(), capacity=2, on_full="drop")
+    for i in range(5):
+        await log.record("doctor.search", [i])
+    assert log.snapshot()["dropped"] == 3 and log.snapshot()["queued"] == 2
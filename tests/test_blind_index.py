@@ -0,0 +1,41 @@
+import pytest
+
+from app.services.blind_index import BlindIndexer, RangePredicate
+
+
+@pytest.fixture
+def indexer():
+    return BlindIndexer(key="test-key", text_fields=["chief_complaint", "symptoms"])
+
+
+def test_phrase_tokens_respect_word_order(indexer):
+    tokens = set(indexer.tokens_for_record({"chief_complaint": "Chest pain on exertion"}, {}))
+    assert set(indexer.text_query_tokens("chest pain")) <= tokens
+    assert set(indexer.text_query_tokens("chest pain", field="chief_complaint")) <= tokens
+    assert not set(indexer.text_query_tokens("pain chest")) <= tokens
+    assert not set(indexer.text_query_tokens("chest pain", field="symptoms")) <= tokens
+
+
+def test_range_tokens_cover_matching_buckets(indexer):
+    high = set(indexer.tokens_for_record({}, {"hba1c": 9.4}))
+    extreme = set(indexer.tokens_for_record({}, {"hba1c": 25}))
+    low = set(indexer.tokens_for_record({}, {"hba1c": 6.1}))
+    query = set(indexer.range_query_tokens(RangePredicate.parse("hba1c>9")))
+
+    assert high & query
+    assert extreme & query
+    assert not low & query
+
+
+def test_tokens_depend_on_key():
+    other = BlindIndexer(key="other-key", text_fields=["chief_complaint"])
+    record = {"chief_complaint": "headache"}
+    assert other.tokens_for_record(record, {}) != BlindIndexer("test-key", ["chief_complaint"]).tokens_for_record(record, {})
+
+
+def test_range_predicate_parsing():
+    predicate = RangePredicate.parse("HbA1c >= 9")
+    assert (predicate.field, predicate.op, predicate.value) == ("hba1c", ">=", 9.0)
+    assert predicate.matches(9) and not predicate.matches(None)
+    with pytest.raises(ValueError):
+        RangePredicate.parse("age>40")
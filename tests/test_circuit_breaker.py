@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from app.models.schemas import LabResults, PatientIntakeData
+from app.services import ai_service
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from app.services.fallback_analyzer import analyze_with_rules
+
+
+def _breaker(**overrides):
+    options = dict(
+        name="test", window_size=10, min_calls=3, failure_rate_threshold=0.5,
+        slow_call_seconds=0.05, slow_call_rate_threshold=0.5, open_seconds=0.05, half_open_probes=1,
+    )
+    options.update(overrides)
+    return CircuitBreaker(**options)
+
+
+async def _fail():
+    raise RuntimeError("upstream error")
+
+
+async def _ok():
+    return "ok"
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_on_errors_and_recovers_through_half_open_probe():
+    breaker = _breaker()
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            await breaker.call(_fail)
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(_ok)
+
+    await asyncio.sleep(0.06)
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    breaker.record(True, 0.01)
+    assert breaker.state == CLOSED
+    assert await breaker.call(_ok) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_on_slow_calls_and_timeouts():
+    breaker = _breaker()
+
+    async def slow():
+        await asyncio.sleep(0.2)
+
+    for _ in range(3):
+        with pytest.raises(asyncio.TimeoutError):
+            await breaker.call(slow, timeout=0.06)
+    assert breaker.state == OPEN
+    assert breaker.snapshot()["failures"] == 3
+
+
+def _patient():
+    intake = PatientIntakeData(age=67, gender="Male", chief_complaint="Thirst", symptoms="Thirst, fatigue", medical_history=[])
+    labs = LabResults(hba1c=9.4, fasting_glucose=180, blood_pressure_systolic=145, blood_pressure_diastolic=85, bmi=24)
+    return intake, labs
+
+
+def test_fallback_analysis_is_deterministic_and_marked():
+    intake, labs = _patient()
+    result = analyze_with_rules(intake, labs)
+
+    assert result.is_fallback and result.analysis_source == "rule_based_fallback"
+    assert "Type 2 diabetes mellitus" in result.differential_diagnoses
+    assert "Stage 2 hypertension" in result.differential_diagnoses
+    assert "Obesity" not in result.differential_diagnoses
+    assert result.risk_score == 9.0
+    assert result.follow_up_timeline == "Follow up within 1 week"
+    assert analyze_with_rules(intake, labs) == result
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_serves_fallback_without_calling_gemini(monkeypatch):
+    breaker = _breaker(open_seconds=60)
+    breaker._open("test")
+    monkeypatch.setattr(ai_service, "gemini_breaker", breaker)
+
+    async def gemini_must_not_run(*args):
+        raise AssertionError("Gemini called while circuit open")
+
+    monkeypatch.setattr(ai_service, "_gemini_analysis", gemini_must_not_run)
+
+    result = await ai_service.analyze_patient_data(*_patient())
+    assert result.is_fallback
+    assert breaker.snapshot()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_single_failure_raises_instead_of_serving_fallback(monkeypatch):
+    monkeypatch.setattr(ai_service, "gemini_breaker", _breaker())
+
+    async def broken_gemini(*args):
+        raise ValueError("unexpected response shape")
+
+    monkeypatch.setattr(ai_service, "_gemini_analysis", broken_gemini)
+
+    with pytest.raises(ai_service.AIServiceError, match="unexpected response shape"):
+        await ai_service.analyze_patient_data(*_patient())
+
+    monkeypatch.setattr(ai_service.settings, "AI_FALLBACK_ON_ERROR", True)
+    assert (await ai_service.analyze_patient_data(*_patient())).is_fallback
@@ -0,0 +1,124 @@
+import io
+import json
+
+import pytest
+
+from app.services import cohort_export
+from app.services.cohort_export import (
+    CohortExportJob,
+    build_export_row,
+    resolve_fields,
+    stream_ndjson,
+    stream_parquet,
+)
+
+RECORDS = [
+    {
+        "record_id": f"r{i}",
+        "appointment_id": f"apt-{i}",
+        "created_at": "2026-03-02T10:00:00",
+        "appointments": {"appointment_time": "2026-03-02T10:00:00", "status": "pending", "patient_id": f"p{i}"},
+    }
+    for i in range(5)
+]
+
+
+@pytest.fixture
+def records(monkeypatch):
+    async def page(after, limit, doctor_id=None):
+        remaining = [r for r in RECORDS if after is None or r["record_id"] > after]
+        return remaining[:limit]
+
+    async def decrypt(record):
+        i = int(record["record_id"][1:])
+        intake = {"age": 95 if i == 0 else 40 + i, "gender": "F", "symptoms": "cough", "patient_id": f"p{i}"}
+        return intake, {"hba1c": 6.5 + i, "blood_pressure_systolic": "120/80" if i == 1 else 120}
+
+    async def purged_archived(doctor_id=None):
+        return 2
+
+    monkeypatch.setattr(cohort_export.db_service, "list_encrypted_records_page", page)
+    monkeypatch.setattr(cohort_export.db_service, "count_purged_archived_consultations", purged_archived)
+    monkeypatch.setattr(cohort_export, "decrypt_patient_data", decrypt)
+
+
+def test_resolve_fields_rejects_unknown_and_puts_subject_first():
+    assert resolve_fields(["gender", "subject_id"]) == ["subject_id", "gender"]
+    with pytest.raises(ValueError, match="appointment_id"):
+        resolve_fields(["gender", "appointment_id"])
+
+
+def test_rows_are_de_identified():
+    record = {"appointment_id": "apt-1", "appointments": {"appointment_time": "2026-03-02", "status": "completed"}}
+    intake = {"age": 93, "symptoms": "cough", "patient_id": "p1"}
+    labs = {"hba1c": "7.1", "blood_pressure_systolic": "120/80", "fasting_glucose": "high"}
+
+    row = build_export_row(record, intake, labs, resolve_fields(None))
+    assert row["age_band"] == "90+" and "age" not in row
+    assert "symptoms" not in row
+    assert row["hba1c"] == 7.1
+    # Non-numeric values from client-encrypted submissions are dropped, not fatal
+    assert row["blood_pressure_systolic"] is None and row["fasting_glucose"] is None
+    assert "apt-1" not in json.dumps(row) and "p1" not in json.dumps(row)
+
+    named = build_export_row(record, intake, labs, resolve_fields(["age", "symptoms"]))
+    assert named["age"] == 90 and named["symptoms"] == "cough"
+    assert build_export_row(record, {"age": 47}, {}, ["age_band"])["age_band"] == "40-49"
+
+
+@pytest.mark.asyncio
+async def test_ndjson_stream_checkpoints_and_resumes(records):
+    fields = resolve_fields(None)
+    chunks = [chunk async for chunk in stream_ndjson(fields, batch_size=2)]
+    lines = [json.loads(line) for chunk in chunks for line in chunk.decode().splitlines()]
+    rows = [line for line in lines if "_checkpoint" not in line]
+    checkpoints = [line["_checkpoint"] for line in lines if "_checkpoint" in line]
+    assert len(rows) == 5 and checkpoints == ["r1", "r3", "r4"]
+    assert len({row["subject_id"] for row in rows}) == 5
+    identifiers = {r["appointment_id"] for r in RECORDS} | {f"p{i}" for i in range(5)}
+    assert not any(value in identifiers for row in rows for value in row.values())
+
+    resumed = [chunk async for chunk in stream_ndjson(fields, after="r1", batch_size=2)]
+    resumed_rows = [line for chunk in resumed for line in chunk.decode().splitlines() if "_checkpoint" not in line]
+    assert [json.loads(line) for line in resumed_rows] == rows[2:]
+
+
+@pytest.mark.asyncio
+async def test_parquet_stream_and_resumable_job(records, tmp_path):
+    import pyarrow.parquet as pq
+
+    fields = resolve_fields(["age_band", "hba1c", "blood_pressure_systolic"])
+    data = b"".join([chunk async for chunk in stream_parquet(fields, archived_excluded=2, batch_size=2)])
+    table = pq.read_table(io.BytesIO(data))
+    assert table.column_names == fields and table.num_rows == 5
+    assert table.schema.metadata[b"archived_excluded"] == b"2"
+    assert table.column("blood_pressure_systolic").to_pylist()[1] is None
+
+    job = CohortExportJob(str(tmp_path), fmt="ndjson", batch_size=2)
+    job.save_checkpoint({"after": "r1", "rows": 2, "parts": 0, "bytes": 0})
+    checkpoint = await job.run()
+    assert checkpoint["done"] and checkpoint["rows"] == 5 and checkpoint["after"] == "r4"
+    assert checkpoint["archived_excluded"] == 2
+    assert len((tmp_path / "cohort.ndjson").read_text().splitlines()) == 3
+
+
+
+@pytest.mark.asyncio
+async def test_export_endpoint_is_admin_only_and_needs_a_pseudonym_key(records, monkeypatch):
+    from fastapi import HTTPException
+
+    from app.routers import doctor
+    from app.routers.ops import require_admin
+
+    route = next(route for route in doctor.router.routes if route.path.endswith("/export/cohort"))
+    assert require_admin in [dependency.call for dependency in route.dependant.dependencies]
+
+    response = await doctor.export_cohort(format="ndjson", fields=None, doctor_id=None, after=None)
+    assert response.headers["x-archived-records-excluded"] == "2"
+
+    monkeypatch.setattr(cohort_export.settings, "EXPORT_PSEUDONYM_KEY", None)
+    with pytest.raises(HTTPException) as error:
+        await doctor.export_cohort(format="ndjson", fields=None, doctor_id=None, after=None)
+    assert error.value.status_code == 503
+    with pytest.raises(RuntimeError, match="EXPORT_PSEUDONYM_KEY"):
+        CohortExportJob("unused")
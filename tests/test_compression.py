@@ -0,0 +1,52 @@
+import base64
+import json
+
+from app.services.compression import PayloadCodec, split_header, train_dictionary
+from app.services.crypto_mock import CryptoService
+
+
+def _intake(i):
+    return {
+        "age": 30 + i % 50,
+        "gender": "Female" if i % 2 else "Male",
+        "chief_complaint": f"Fatigue and increased thirst for {i % 7 + 1} weeks",
+        "symptoms": "Increased thirst, frequent urination, blurred vision, fatigue after meals",
+        "medical_history": ["Hypertension", "Family history of Type 2 Diabetes"],
+        "current_medications": ["Lisinopril 10mg daily"],
+        "allergies": [],
+    }
+
+
+def test_large_payloads_are_compressed_and_small_ones_skipped(monkeypatch, tmp_path):
+    from app.services import crypto_mock
+    codec = PayloadCodec(enabled=True, min_bytes=128, level=3, dictionary_dir=str(tmp_path))
+    monkeypatch.setattr(crypto_mock, "payload_codec", codec)
+    crypto = CryptoService()
+
+    encrypted, key = crypto.encrypt(_intake(1))
+    assert split_header(encrypted)[:2] == ("zstd", 0)
+    assert crypto.decrypt(encrypted, key) == _intake(1)
+    assert json.loads(crypto.decrypt_bytes(encrypted, key)) == _intake(1)
+
+    small, key = crypto.encrypt({"hba1c": 7.8})
+    assert split_header(small)[0] is None
+    assert crypto.decrypt(small, key) == {"hba1c": 7.8}
+
+    # Rows written before compression existed still read unchanged
+    legacy = base64.b64encode(json.dumps(_intake(2)).encode()).decode()
+    assert crypto.decrypt(legacy, key) == _intake(2)
+
+
+def test_trained_dictionary_is_recorded_and_used_for_reads(monkeypatch, tmp_path):
+    from app.services import crypto_mock
+    samples = [json.dumps(_intake(i)).encode() for i in range(500)]
+    (tmp_path / "clinical-1.zdict").write_bytes(train_dictionary(samples, 4096))
+
+    codec = PayloadCodec(enabled=True, min_bytes=128, level=3, dictionary_dir=str(tmp_path))
+    monkeypatch.setattr(crypto_mock, "payload_codec", codec)
+    crypto = CryptoService()
+
+    encrypted, key = crypto.encrypt(_intake(3))
+    codec_name, dict_id, _ = split_header(encrypted)
+    assert codec_name == "zstd" and dict_id != 0
+    assert crypto.decrypt(encrypted, key) == _intake(3)
@@ -0,0 +1,57 @@
+from uuid import uuid4
+
+import pytest
+
+from app.models.schemas import RawIntakeSubmission
+from app.routers import doctor
+from app.services.crypto_mock import crypto_service
+from app.services.db_service import _embedded_one
+
+
+def _encrypted_record(**raw):
+    submission = RawIntakeSubmission.model_validate(raw)
+    encrypted_intake, key = crypto_service.encrypt(submission.intake_payload())
+    encrypted_labs, _ = crypto_service.encrypt(submission.lab_payload())
+    blob, _ = crypto_service.encrypt({
+        "encrypted_intake": encrypted_intake,
+        "encrypted_lab_results": encrypted_labs,
+    })
+    return {"encrypted_blob": blob, "wrapped_key": key}
+
+
+def test_embedded_relation_is_normalised():
+    assert _embedded_one([]) is None
+    assert _embedded_one([{"result_id": 1}]) == {"result_id": 1}
+    assert _embedded_one({"result_id": 1}) == {"result_id": 1}
+    assert _embedded_one(None) is None
+
+
+@pytest.mark.asyncio
+async def test_dashboard_decrypts_every_row_and_tolerates_bad_records(monkeypatch):
+    good = _encrypted_record(age=61, gender="F", chief_complaint="Thirst", symptoms="Thirst", hba1c=9.4)
+    rows = [
+        {"appointment_id": uuid4(), "patient_id": None, "appointment_time": "2026-01-02T10:00:00",
+         "status": "pending", "has_result": False, "encrypted_record": good},
+        {"appointment_id": uuid4(), "patient_id": None, "appointment_time": "2026-01-01T10:00:00",
+         "status": "completed", "has_result": True, "encrypted_record": {"encrypted_blob": "bad", "wrapped_key": "k"}},
+        {"appointment_id": uuid4(), "patient_id": None, "appointment_time": "2026-01-01T09:00:00",
+         "status": "pending", "has_result": False, "encrypted_record": None},
+    ]
+
+    async def page(doctor_id, limit, offset, status):
+        return rows, 7
+
+    async def counts(doctor_id):
+        return {"pending": 5, "completed": 2}
+
+    monkeypatch.setattr(doctor.db_service, "list_doctor_dashboard_page", page)
+    monkeypatch.setattr(doctor.db_service, "count_doctor_appointments_by_status", counts)
+
+    dashboard = await doctor.get_dashboard(uuid4(), limit=3, offset=0, status=None)
+
+    assert dashboard.total == 7 and dashboard.status_counts == {"pending": 5, "completed": 2}
+    first, broken, missing = dashboard.appointments
+    assert first.triage.chief_complaint == "Thirst" and first.triage.age == 61
+    assert any("HbA1c above 9%" in flag for flag in first.triage.lab_flags)
+    assert broken.has_result and broken.triage is None
+    assert missing.triage is None
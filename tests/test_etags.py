@@ -0,0 +1,57 @@
+from uuid import uuid4
+
+import pytest
+
+from app.services import etags
+from app.services.etags import VersionIndex, etag_matches, make_etag
+
+
+def test_etags_are_strong_and_version_specific():
+    appointment_id = uuid4()
+    etag = make_etag("record", appointment_id, "r1", "completed")
+
+    assert etag.startswith('"') and not etag.startswith("W/")
+    assert etag == make_etag("record", appointment_id, "r1", "completed")
+    assert etag != make_etag("record", appointment_id, "r1", "pending")
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag) and not etag_matches(None, etag)
+
+
+@pytest.mark.asyncio
+async def test_not_modified_comes_from_the_index_without_a_second_lookup(monkeypatch):
+    lookups = []
+
+    async def record_version(appointment_id):
+        lookups.append(appointment_id)
+        return {"record_id": "r1", "status": "completed"}
+
+    monkeypatch.setattr(etags.db_service, "get_record_version", record_version)
+    index = VersionIndex(ttl=60)
+    appointment_id = uuid4()
+    etag = make_etag("record", appointment_id, "r1", "completed")
+
+    for _ in range(3):
+        response = await index.check_record(appointment_id, etag)
+        assert response.status_code == 304 and response.headers["etag"] == etag
+    assert await index.check_record(appointment_id, '"stale"') is None
+
+    assert len(lookups) == 1
+    assert index.metrics["index_hits"] == 3 and index.metrics["not_modified"] == 3
+
+
+@pytest.mark.asyncio
+async def test_records_that_can_still_change_are_not_indexed(monkeypatch):
+    versions = [{"record_id": "r1", "status": "pending"}, {"record_id": "r1", "status": "completed"}]
+
+    async def record_version(appointment_id):
+        return versions.pop(0)
+
+    monkeypatch.setattr(etags.db_service, "get_record_version", record_version)
+    index = VersionIndex(ttl=60)
+    appointment_id = uuid4()
+    pending = index.remember_record(appointment_id, "r1", "pending")
+
+    assert (await index.check_record(appointment_id, pending)).status_code == 304
+    # Approval changed the status, so the old ETag no longer matches
+    assert await index.check_record(appointment_id, pending) is None
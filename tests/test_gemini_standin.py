@@ -0,0 +1,77 @@
+import json
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+from google.generativeai.types import generation_types
+
+from app.services import gemini_standin as standin_module
+from app.services.gemini_standin import (
+    DEFAULT_ANALYSIS,
+    FixtureStore,
+    GeminiStandIn,
+    RecordingModel,
+    ReplayModel,
+    fixture_key,
+)
+
+
+def _standin(store, **overrides):
+    options = dict(
+        store=store,
+        latency_profile="instant",
+        latency_scale=1.0,
+        error_rate=0.0,
+        error_kind="unavailable",
+        strict=False,
+        max_concurrency=0,
+        seed=1,
+    )
+    options.update(overrides)
+    return GeminiStandIn(**options)
+
+
+@pytest.mark.asyncio
+async def test_recorded_fixture_is_replayed(tmp_path, monkeypatch):
+    class LiveModel:
+        def __init__(self, name):
+            pass
+
+        async def generate_content_async(self, contents, **kwargs):
+            proto = standin_module._response_proto('{"risk_score": 3}')
+            return generation_types.AsyncGenerateContentResponse.from_response(proto)
+
+    monkeypatch.setattr(standin_module.genai, "GenerativeModel", LiveModel)
+    store = FixtureStore(str(tmp_path))
+    await RecordingModel("gemini-test", store).generate_content_async("prompt A")
+
+    saved = json.loads(next(tmp_path.glob("*.json")).read_text())
+    assert saved["key"] == fixture_key("gemini-test", "prompt A", None)
+    assert "prompt A" not in json.dumps(saved)
+
+    replay = ReplayModel("gemini-test", _standin(FixtureStore(str(tmp_path)), strict=True))
+    response = await replay.generate_content_async("prompt A")
+    assert response.text == '{"risk_score": 3}'
+    with pytest.raises(google_exceptions.NotFound):
+        await replay.generate_content_async("prompt B")
+
+
+@pytest.mark.asyncio
+async def test_default_fixture_streams_token_by_token(tmp_path):
+    replay = ReplayModel("gemini-test", _standin(FixtureStore(str(tmp_path))))
+    response = await replay.generate_content_async("anything", stream=True)
+    chunks = [chunk async for chunk in response]
+    assert len(chunks) > 10
+    assert json.loads(response.text) == DEFAULT_ANALYSIS
+
+
+@pytest.mark.asyncio
+async def test_injected_errors_and_timeouts(tmp_path):
+    store = FixtureStore(str(tmp_path))
+    failing = ReplayModel("gemini-test", _standin(store, error_rate=1.0, error_kind="quota"))
+    with pytest.raises(google_exceptions.ResourceExhausted):
+        await failing.generate_content_async("prompt")
+
+    slow = _standin(store, latency_profile="slow")
+    with pytest.raises(google_exceptions.DeadlineExceeded):
+        await ReplayModel("gemini-test", slow).generate_content_async("prompt", request_options={"timeout": 0.05})
+    assert slow.metrics["timeouts"] == 1
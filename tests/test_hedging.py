@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from app.services.hedging import HedgedRequester, LatencyTracker, RetryBudget
+
+
+def _requester(budget_tokens=10.0, **overrides):
+    options = dict(
+        name="test",
+        budget=RetryBudget(ratio=0.1, min_per_second=0.0, max_tokens=budget_tokens),
+        latencies=LatencyTracker(window_size=50),
+        hedging_enabled=True,
+        hedge_percentile=95,
+        hedge_min_delay=0.01,
+        hedge_max_delay=0.05,
+        hedge_min_samples=5,
+        max_retries=2,
+        backoff_base=0.001,
+        backoff_max=0.002,
+    )
+    options.update(overrides)
+    return HedgedRequester(**options)
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_hedge_wins():
+    requester = _requester()
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        # First attempt stalls, the hedge answers quickly
+        await asyncio.sleep(1.0 if len(calls) == 1 else 0.0)
+        return len(calls)
+
+    assert await requester.call(attempt) == 2
+    snapshot = requester.snapshot()
+    assert snapshot["hedges_sent"] == 1 and snapshot["hedge_wins"] == 1
+    assert snapshot["hedge_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_retries_are_jittered_and_limited_by_budget():
+    requester = _requester(budget_tokens=1.0, hedging_enabled=False)
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        raise RuntimeError("503")
+
+    with pytest.raises(RuntimeError):
+        await requester.call(flaky)
+    # One retry paid for by the budget, the next one denied
+    assert len(calls) == 2
+    assert requester.metrics["retries"] == 1
+    assert requester.metrics["retries_denied"] == 1
+
+
+@pytest.mark.asyncio
+async def test_non_retryable_errors_fail_fast():
+    requester = _requester(hedging_enabled=False)
+    calls = []
+
+    async def blocked():
+        calls.append(1)
+        raise ValueError("blocked")
+
+    with pytest.raises(ValueError):
+        await requester.call(blocked, is_retryable=lambda e: not isinstance(e, ValueError))
+    assert len(calls) == 1
+
+
+def test_hedge_delay_tracks_latency_percentile():
+    requester = _requester(hedge_max_delay=10.0)
+    assert requester.hedge_delay() == 10.0  # Not enough samples yet
+    for seconds in [0.1] * 15 + [5.0] * 5:
+        requester.latencies.observe(seconds)
+    assert requester.hedge_delay() == pytest.approx(5.0)
+    assert requester.latencies.percentile(50) == pytest.approx(0.1)
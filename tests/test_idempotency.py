@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.services import idempotency
+from app.services.idempotency import IdempotencyConflict, IdempotencyIndex
+
+
+@pytest.fixture
+def store(monkeypatch):
+    records = {}
+
+    async def get_record(key):
+        return records.get(key)
+
+    async def store_record(key, request_hash, response):
+        records[key] = {"request_hash": request_hash, "response": response}
+
+    monkeypatch.setattr(idempotency.db_service, "get_idempotency_record", get_record)
+    monkeypatch.setattr(idempotency.db_service, "store_idempotency_record", store_record)
+    return records
+
+
+@pytest.mark.asyncio
+async def test_retry_returns_original_response(store):
+    index = IdempotencyIndex(max_entries=10, ttl_seconds=60)
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        return {"appointment_id": f"apt-{len(calls)}"}
+
+    first = await index.run("key-1", "hash", handler)
+    second = await index.run("key-1", "hash", handler)
+
+    assert first == second == {"appointment_id": "apt-1"}
+    assert len(calls) == 1
+    assert "key-1" in store
+
+
+@pytest.mark.asyncio
+async def test_concurrent_retries_run_handler_once(store):
+    index = IdempotencyIndex(max_entries=10, ttl_seconds=60)
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"appointment_id": "apt-1"}
+
+    results = await asyncio.gather(*(index.run("key-1", "hash", handler) for _ in range(5)))
+
+    assert all(r == {"appointment_id": "apt-1"} for r in results)
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_original_hands_over_to_one_waiter(store, monkeypatch):
+    async def slow_get_record(key):
+        await asyncio.sleep(0.001)
+        return store.get(key)
+
+    monkeypatch.setattr(idempotency.db_service, "get_idempotency_record", slow_get_record)
+    index = IdempotencyIndex(max_entries=10, ttl_seconds=60)
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise RuntimeError("database down")
+        return {"appointment_id": f"apt-{len(calls)}"}
+
+    results = await asyncio.gather(
+        *(index.run("key-1", "hash", handler) for _ in range(4)), return_exceptions=True
+    )
+
+    assert isinstance(results[0], RuntimeError)
+    assert results[1:] == [{"appointment_id": "apt-2"}] * 3
+    assert len(calls) == 2
+    assert not index._inflight
+
+
+@pytest.mark.asyncio
+async def test_persistent_fallback_and_conflict(store):
+    store["key-1"] = {"request_hash": "hash", "response": {"appointment_id": "apt-db"}}
+    index = IdempotencyIndex(max_entries=10, ttl_seconds=60)
+
+    async def handler():
+        raise AssertionError("handler must not run for a stored key")
+
+    assert await index.run("key-1", "hash", handler) == {"appointment_id": "apt-db"}
+    with pytest.raises(IdempotencyConflict):
+        await index.run("key-1", "other-hash", handler)
+
+
+def test_index_is_bounded_and_expires():
+    index = IdempotencyIndex(max_entries=2, ttl_seconds=60)
+    for key in ("a", "b", "c"):
+        index.put(key, "hash", {})
+    assert len(index) == 2
+    assert index.get("a") is None
+
+    expired = IdempotencyIndex(max_entries=2, ttl_seconds=-1)
+    expired.put("a", "hash", {})
+    assert expired.get("a") is None
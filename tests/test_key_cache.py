@@ -0,0 +1,89 @@
+import pytest
+
+from app.services import key_rotation
+from app.services.crypto_mock import CryptoService
+from app.services.key_cache import DataKeyCache
+from app.services.key_rotation import KeyRotationJob
+
+
+def test_cache_hits_skip_unwrap_and_evictions_are_zeroized():
+    cache = DataKeyCache(max_entries=1, ttl_seconds=60)
+    calls = []
+
+    def unwrap(wrapped_key):
+        calls.append(wrapped_key)
+        return b"secret-" + wrapped_key.encode()
+
+    with cache.borrow("a", unwrap) as key:
+        assert key == b"secret-a"
+    with cache.borrow("a", unwrap) as key:
+        assert key == b"secret-a"
+    assert calls == ["a"]
+
+    buffer = next(iter(cache._entries.values()))[1]
+    with cache.borrow("b", unwrap):
+        pass
+    assert len(cache) == 1
+    assert set(buffer) == {0}
+
+
+def test_borrowed_key_is_zeroized_on_exit_and_survives_eviction():
+    cache = DataKeyCache(max_entries=1, ttl_seconds=60)
+
+    with pytest.raises(RuntimeError):
+        with cache.borrow("a", lambda wrapped_key: b"secret-a") as borrowed:
+            # Evicting the cached entry does not wipe the caller's copy
+            cache.clear()
+            assert borrowed == b"secret-a"
+            raise RuntimeError("decryption failed")
+    assert set(borrowed) == {0}
+
+
+def test_rewrap_preserves_data_key_and_payload():
+    crypto = CryptoService()
+    encrypted, wrapped = crypto.encrypt({"hba1c": 7.8})
+
+    rewrapped = crypto.rewrap_key(wrapped, epoch=2)
+    assert crypto.key_epoch(rewrapped) == 2
+    assert crypto.unwrap_key(rewrapped) == crypto.unwrap_key(wrapped)
+    assert crypto.decrypt(encrypted, rewrapped) == {"hba1c": 7.8}
+
+
+@pytest.mark.asyncio
+async def test_rotation_is_batched_and_resumable(monkeypatch, tmp_path):
+    crypto = CryptoService()
+    _, legacy_key = crypto.encrypt({})
+    rows = {
+        "encrypted_records": [{"record_id": f"r{i}", "wrapped_key": legacy_key} for i in range(5)],
+        "consultation_results": [{"result_id": "c0", "wrapped_key": legacy_key}],
+        "analysis_drafts": [{"appointment_id": "a0", "wrapped_key": legacy_key}],
+    }
+
+    async def list_wrapped_keys(table, id_column, after_id, limit):
+        remaining = [r for r in rows[table] if after_id is None or r[id_column] > after_id]
+        return [dict(r) for r in remaining[:limit]]
+
+    async def update_wrapped_key(table, id_column, row_id, old, new):
+        for row in rows[table]:
+            if row[id_column] == row_id and row["wrapped_key"] == old:
+                row["wrapped_key"] = new
+                return True
+        return False
+
+    monkeypatch.setattr(key_rotation.db_service, "list_wrapped_keys", list_wrapped_keys)
+    monkeypatch.setattr(key_rotation.db_service, "update_wrapped_key", update_wrapped_key)
+
+    checkpoint = tmp_path / "checkpoint.json"
+    job = KeyRotationJob(target_epoch=1, batch_size=2, checkpoint_path=str(checkpoint))
+
+    # Stop after the first batch, then resume with a fresh job
+    batches = job.iter_batches()
+    await batches.__anext__()
+    await batches.aclose()
+    assert job.load_checkpoint()["tables"]["encrypted_records"]["last_id"] == "r1"
+
+    totals = await KeyRotationJob(target_epoch=1, batch_size=2, checkpoint_path=str(checkpoint)).run()
+    assert totals["encrypted_records"]["rewrapped"] == 3
+    assert totals["consultation_results"]["rewrapped"] == 1
+    assert totals["analysis_drafts"]["rewrapped"] == 1
+    assert all(crypto.key_epoch(r["wrapped_key"]) == 1 for table in rows.values() for r in table)
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from app.services import lab_analytics
+from app.services.lab_analytics import LabAnalyticsEngine, LabSnapshot
+
+
+def build_engine():
+    rows = []
+    for i, (hba1c, systolic) in enumerate([(5.5, 118), (6.8, 135), (9.4, 150), (None, 142)]):
+        rows.append({
+            "labs": {"hba1c": hba1c, "blood_pressure_systolic": systolic, "blood_pressure_diastolic": 78},
+            "doctor_id": "doc-a" if i < 2 else "doc-b",
+            "clinic_id": None,
+            "timestamp": np.datetime64(f"2025-0{i + 1}-15T09:00:00", "s"),
+        })
+    engine = LabAnalyticsEngine()
+    engine.snapshot = LabSnapshot.empty().extend(rows, watermark="w1")
+    return engine
+
+
+def test_summary_ignores_missing_values():
+    summary = build_engine().summary("hba1c", [50])
+    assert summary["records"] == 4
+    assert summary["count"] == 3
+    assert summary["percentiles"]["p50"] == 6.8
+
+
+def test_threshold_and_category_shares():
+    engine = build_engine()
+    over_nine = engine.threshold(lab_field="hba1c", op="gt", value=9)
+    assert (over_nine["count"], over_nine["denominator"]) == (1, 3)
+
+    stage2 = engine.threshold(category="stage2_hypertension", doctor_id="doc-b")
+    assert (stage2["count"], stage2["denominator"]) == (2, 2)
+
+
+def test_timeseries_buckets_by_month():
+    series = build_engine().timeseries("hba1c", bucket="month")["series"]
+    assert [point["bucket"] for point in series] == ["2025-01", "2025-02", "2025-03"]
+    assert series[2]["mean"] == 9.4
+
+
+@pytest.mark.asyncio
+async def test_incremental_refresh_picks_up_shared_timestamps_and_late_commits(monkeypatch):
+    table = []
+
+    def add(record_id, created_at, hba1c):
+        table.append({"record_id": record_id, "created_at": created_at, "hba1c": hba1c,
+                      "appointments": {"doctor_id": "doc-a", "appointment_time": created_at}})
+
+    async def since(created_from, after, limit):
+        rows = sorted(table, key=lambda r: (r["created_at"], r["record_id"]))
+        if after:
+            rows = [r for r in rows if (r["created_at"], r["record_id"]) > after]
+        elif created_from:
+            rows = [r for r in rows if r["created_at"] >= created_from]
+        return rows[:limit]
+
+    async def decrypt(record):
+        decrypted.append(record["record_id"])
+        return {}, {"hba1c": record["hba1c"]}
+
+    async def purged_archived(doctor_id=None):
+        return 4
+
+    decrypted = []
+    monkeypatch.setattr(lab_analytics.db_service, "list_encrypted_records_since", since)
+    monkeypatch.setattr(lab_analytics.db_service, "count_purged_archived_consultations", purged_archived)
+    monkeypatch.setattr(lab_analytics, "decrypt_patient_data", decrypt)
+    monkeypatch.setattr(lab_analytics.settings, "EXPORT_BATCH_SIZE", 2)
+    monkeypatch.setattr(lab_analytics.settings, "LAB_ANALYTICS_FULL_REBUILD_EVERY", 100)
+    engine = LabAnalyticsEngine()
+
+    # One coalesced INSERT: three rows with the same created_at, across a page boundary
+    for record_id in ("a", "b", "c"):
+        add(record_id, "2026-10-19T10:00:00", 6.0)
+    assert (await engine.refresh())["archived_excluded"] == 4
+    assert len(engine.snapshot) == 3
+
+    # A row that committed late, with a timestamp before the watermark
+    add("d", "2026-10-19T10:01:00", 7.0)
+    add("e", "2026-10-19T09:59:30", 8.0)
+    result = await engine.refresh()
+    assert result["added"] == 2 and len(engine.snapshot) == 5
+    assert sorted(decrypted) == ["a", "b", "c", "d", "e"]
+
+    assert (await engine.refresh())["added"] == 0
+    assert engine.summary("hba1c", [50])["count"] == 5
+    # Incremental refreshes keep reporting what the last full rebuild could not see
+    assert engine.info()["archived_excluded"] == 4
@@ -0,0 +1,160 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from app.services import preanalysis as preanalysis_module
+from app.services.preanalysis import PreAnalysisQueue, record_version
+from app.services.rate_limiter import AdmissionController
+
+
+class _Analysis:
+    def __init__(self, risk_score, is_fallback=False):
+        self.risk_score = risk_score
+        self.is_fallback = is_fallback
+
+    def dict(self):
+        return {"risk_score": self.risk_score, "is_fallback": self.is_fallback}
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    state = {"records": {}, "drafts": {}, "results": [], "controller": AdmissionController(4, 4, 1.0)}
+
+    async def get_record_version(appointment_id):
+        return {"record_id": "r", "status": "pending"}
+
+    async def get_encrypted_record(appointment_id):
+        return state["records"][appointment_id]
+
+    async def get_analysis_draft(appointment_id):
+        return state["drafts"].get(str(appointment_id))
+
+    async def store_analysis_draft(appointment_id, version, encrypted_draft, wrapped_key):
+        state["drafts"][str(appointment_id)] = {
+            "record_version": version, "encrypted_draft": encrypted_draft, "wrapped_key": wrapped_key,
+        }
+
+    async def delete_analysis_draft(appointment_id):
+        state["drafts"].pop(str(appointment_id), None)
+
+    async def decrypt_patient_models(encrypted_record):
+        return encrypted_record["encrypted_blob"], None
+
+    async def analyze_patient_data(intake, labs):
+        return state["results"].pop(0)
+
+    db = preanalysis_module.db_service
+    for name, fake in [("get_record_version", get_record_version), ("get_encrypted_record", get_encrypted_record),
+                       ("get_analysis_draft", get_analysis_draft), ("store_analysis_draft", store_analysis_draft),
+                       ("delete_analysis_draft", delete_analysis_draft)]:
+        monkeypatch.setattr(db, name, fake)
+    monkeypatch.setattr(preanalysis_module, "decrypt_patient_models", decrypt_patient_models)
+    monkeypatch.setattr(preanalysis_module, "analyze_patient_data", analyze_patient_data)
+    monkeypatch.setattr(preanalysis_module, "admission_controller", state["controller"])
+    return state
+
+
+def _queue(**overrides):
+    options = dict(enabled=True, per_minute=600, burst=5, reserved_slots=2, max_queue=10, idle_poll_seconds=0.01)
+    return PreAnalysisQueue(**{**options, **overrides})
+
+
+async def _drain(queue):
+    for _ in range(200):
+        if not queue._pending and not queue._running:
+            return
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_draft_is_served_only_while_the_record_is_unchanged(fake_backend):
+    appointment_id = str(uuid4())
+    record = {"record_id": "r", "encrypted_blob": "v1"}
+    fake_backend["records"][appointment_id] = record
+    fake_backend["results"].append(_Analysis(7.5))
+
+    queue = _queue()
+    queue.start()
+    queue.notify_record_stored(appointment_id)
+    await _drain(queue)
+    await queue.stop()
+
+    assert fake_backend["drafts"][appointment_id]["record_version"] == record_version(record)
+    assert (await queue.take(appointment_id, record))["risk_score"] == 7.5
+
+    changed = {"record_id": "r", "encrypted_blob": "v2"}
+    assert await queue.take(appointment_id, changed) is None
+    assert appointment_id not in fake_backend["drafts"]
+    assert queue.metrics["draft_hits"] == 1 and queue.metrics["draft_stale"] == 1
+
+
+@pytest.mark.asyncio
+async def test_drafts_wait_for_idle_slots_and_skip_fallbacks(fake_backend):
+    appointment_id = str(uuid4())
+    fake_backend["records"][appointment_id] = {"record_id": "r", "encrypted_blob": "v1"}
+    fake_backend["results"].append(_Analysis(2.0, is_fallback=True))
+    controller = fake_backend["controller"]
+    release = asyncio.Event()
+
+    async def doctor_call():
+        async with controller.slot():
+            await release.wait()
+
+    # Two of four slots busy: the two reserved for doctors are all that is left
+    doctors = [asyncio.create_task(doctor_call()) for _ in range(2)]
+    await asyncio.sleep(0)
+    queue = _queue()
+    queue.start()
+    queue.notify_record_stored(appointment_id)
+    await asyncio.sleep(0.05)
+    assert queue.snapshot()["pending"] == 1 and fake_backend["results"]
+
+    release.set()
+    await asyncio.gather(*doctors)
+    await _drain(queue)
+    await queue.stop()
+
+    assert not fake_backend["results"]
+    assert queue.metrics["fallback_discarded"] == 1 and not fake_backend["drafts"]
+
+
+@pytest.mark.asyncio
+async def test_analyze_served_from_a_draft_spends_no_tenant_budget(monkeypatch):
+    from app.models.schemas import DoctorAnalysisRequest
+    from app.routers import doctor
+    from app.services.rate_limiter import RateLimitExceeded
+
+    charged = []
+
+    def check_rate(doctor_id):
+        charged.append(doctor_id)
+        raise RateLimitExceeded("Rate limit exceeded for doctor", retry_after=30)
+
+    async def get_encrypted_record(appointment_id):
+        return {"record_id": "r", "encrypted_blob": "v1"}
+
+    async def take(appointment_id, encrypted_record):
+        return {"risk_score": 4.0} if take_hits else None
+
+    async def noop(*args, **kwargs):
+        return None
+
+    take_hits = True
+    monkeypatch.setattr(doctor.admission_controller, "check_rate", check_rate)
+    monkeypatch.setattr(doctor.db_service, "get_encrypted_record", get_encrypted_record)
+    monkeypatch.setattr(doctor.db_service, "store_consultation_result", noop)
+    monkeypatch.setattr(doctor.preanalysis, "take", take)
+    monkeypatch.setattr(doctor.preanalysis, "discard", noop)
+    request = DoctorAnalysisRequest(
+        appointment_id=uuid4(), doctor_id=uuid4(), doctor_notes="n", approved=True, request_ai_analysis=True
+    )
+
+    response = await doctor.analyze_and_approve(request)
+    assert response["ai_analysis"] == {"risk_score": 4.0} and not charged
+
+    # Without a draft the live call is still rate limited
+    take_hits = False
+    with pytest.raises(doctor.HTTPException) as exc:
+        await doctor.analyze_and_approve(request)
+    assert exc.value.status_code == 429 and len(charged) == 1
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.executor import run_cpu_bound
+from app.services.profiler import ProfilingMiddleware, profiler
+
+
+def _spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+    return [bytearray(64) for _ in range(2000)]
+
+
+async def _app(scope, receive, send):
+    with profiler.stage("crypto"):
+        await run_cpu_bound(_spin, 0.1)
+    with profiler.stage("validation"):
+        _spin(0.05)
+
+
+@pytest.fixture
+def profiling(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "output_dir", tmp_path)
+    yield profiler
+    profiler.disable(wait=True)
+    profiler.recent.clear()
+
+
+def test_stage_and_bind_are_pass_through_when_off():
+    def job():
+        return 1
+
+    assert profiler.stage("db") is profiler.stage("crypto")
+    assert profiler.bind(job, "db") is job
+
+
+@pytest.mark.asyncio
+async def test_profiled_request_writes_collapsed_stacks_per_stage(profiling, tmp_path):
+    profiling.enable(1.0, routes=["/doctor/"], interval_ms=2, memory=True)
+    middleware = ProfilingMiddleware(_app)
+
+    await middleware({"type": "http", "method": "POST", "path": "/api/v1/doctor/analyze"}, None, None)
+    await middleware({"type": "http", "method": "GET", "path": "/api/v1/patient/results"}, None, None)
+    profiling.disable(wait=True)
+
+    assert profiling.profiles_started == 1
+    summary = profiling.recent[-1]
+    assert summary["route"] == "POST /api/v1/doctor/analyze"
+    assert summary["samples"]["crypto"] > 10 and summary["samples"]["validation"] > 5
+    assert summary["allocated_bytes"]["crypto"] > 2000 * 64
+
+    lines = (tmp_path / summary["files"][0]).read_text().splitlines()
+    assert all(line.startswith("POST_/api/v1/doctor/analyze;") for line in lines)
+    _, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert any(";crypto;" in line and "_spin (tests/test_profiler.py" in line for line in lines)
+    assert (tmp_path / summary["files"][1]).exists()
+
+
+@pytest.mark.asyncio
+async def test_profiling_switches_off_after_max_profiles(profiling):
+    profiling.enable(1.0, max_profiles=1)
+    middleware = ProfilingMiddleware(_app)
+    for _ in range(2):
+        await middleware({"type": "http", "method": "GET", "path": "/api/v1/doctor/record/1"}, None, None)
+
+    assert profiling.profiles_started == 1 and not profiling.enabled
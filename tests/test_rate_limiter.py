@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from app.services import rate_limiter
+from app.services.rate_limiter import AdmissionController, RateLimitExceeded, TokenBucket
+
+
+def test_token_bucket_reports_wait_time():
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    bucket.consume()
+    bucket.consume()
+    assert 0 < bucket.wait_time() <= 1.0
+
+
+def test_clinic_limit_does_not_charge_doctor(monkeypatch):
+    monkeypatch.setattr(rate_limiter.settings, "DOCTOR_CLINICS", {"doc-1": "clinic-1", "doc-2": "clinic-1"})
+    monkeypatch.setattr(rate_limiter.settings, "RATE_LIMIT_OVERRIDES", {"clinic:clinic-1": {"per_minute": 1, "burst": 1}})
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.1)
+
+    controller.check_rate("doc-1")
+    with pytest.raises(RateLimitExceeded) as exc:
+        controller.check_rate("doc-2")
+
+    assert exc.value.retry_after > 0
+    assert int(exc.value.retry_after_header) >= 1
+    state = controller.snapshot("doc-2")
+    assert state["buckets"]["doctor:doc-2"]["tokens"] == rate_limiter.settings.RATE_LIMIT_DOCTOR_BURST
+
+
+@pytest.mark.asyncio
+async def test_slot_queues_then_sheds():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.05)
+    release = asyncio.Event()
+
+    async def hold():
+        async with controller.slot():
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0.01)
+    assert controller.snapshot()["in_flight"] == 1
+
+    # One request may queue; it times out at the deadline
+    with pytest.raises(RateLimitExceeded):
+        async with controller.slot():
+            pass
+
+    release.set()
+    await holder
+    async with controller.slot():
+        pass
+    assert controller.snapshot()["admitted_total"] == 2
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import threading
+from uuid import uuid4
+
+import pytest
+from fastapi import Response
+
+from app.models.schemas import LabResults, PatientIntakeData, RawIntakeSubmission
+from app.routers import doctor
+from app.services import records
+from app.services.crypto_mock import crypto_service
+from app.services.records import decrypt_patient_data, decrypt_patient_models
+
+SUBMISSION = RawIntakeSubmission.model_validate({
+    "age": 58, "gender": "M", "chief_complaint": "Fatigue", "symptoms": "Fatigue, thirst",
+    "medical_history": "hypertension, asthma", "hba1c": 8.2, "blood_pressure_systolic": 142,
+})
+
+
+def _encrypted_record(legacy_inner: bool = False):
+    if legacy_inner:
+        # Older rows stored the inner layers as plain JSON strings
+        encrypted_intake = json.dumps(SUBMISSION.intake_payload())
+        encrypted_labs = json.dumps(SUBMISSION.lab_payload())
+        _, key = crypto_service.encrypt({})
+    else:
+        encrypted_intake, key = crypto_service.encrypt(SUBMISSION.intake_payload())
+        encrypted_labs, _ = crypto_service.encrypt(SUBMISSION.lab_payload())
+    blob, _ = crypto_service.encrypt({
+        "encrypted_intake": encrypted_intake,
+        "encrypted_lab_results": encrypted_labs,
+    })
+    return {"record_id": "r1", "encrypted_blob": blob, "wrapped_key": key}
+
+
+def _decrypt_serially(record):
+    """The record path before decryption moved to the CPU pool"""
+    outer = crypto_service.decrypt(record["encrypted_blob"], record["wrapped_key"])
+    intake = crypto_service.decrypt(outer["encrypted_intake"], record["wrapped_key"])
+    labs = crypto_service.decrypt(outer["encrypted_lab_results"], record["wrapped_key"])
+    return intake, labs
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("legacy_inner", [False, True])
+async def test_parallel_decrypt_matches_the_serial_path(legacy_inner):
+    record = _encrypted_record(legacy_inner)
+    intake, labs = _decrypt_serially(record)
+
+    assert await decrypt_patient_data(record) == (intake, labs)
+    intake_model, lab_model = await decrypt_patient_models(record)
+    assert intake_model == PatientIntakeData.model_validate(intake)
+    assert lab_model == LabResults.model_validate(labs)
+
+
+@pytest.mark.asyncio
+async def test_decryption_runs_on_the_cpu_pool(monkeypatch):
+    record = _encrypted_record()
+    threads = []
+
+    def tracked(func):
+        def wrapper(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return func(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(records.crypto_service, "decrypt", tracked(crypto_service.decrypt))
+    monkeypatch.setattr(records.crypto_service, "decrypt_bytes", tracked(crypto_service.decrypt_bytes))
+
+    await decrypt_patient_data(record)
+    await decrypt_patient_models(record)
+
+    assert len(threads) >= 6
+    assert all(name.startswith("cpu") for name in threads)
+
+
+@pytest.mark.asyncio
+async def test_record_and_appointment_are_fetched_concurrently(monkeypatch):
+    record = _encrypted_record()
+    started = []
+    both_started = asyncio.Event()
+
+    async def fetch(name, result):
+        started.append(name)
+        if len(started) == 2:
+            both_started.set()
+        # A serial caller never starts the second fetch while this one waits
+        await asyncio.wait_for(both_started.wait(), timeout=1)
+        return result
+
+    async def get_encrypted_record(appointment_id):
+        return await fetch("record", record)
+
+    async def get_appointment(appointment_id):
+        return await fetch("appointment", {
+            "patient_id": None, "appointment_time": "2026-03-02T10:00:00", "status": "pending",
+        })
+
+    monkeypatch.setattr(doctor.db_service, "get_encrypted_record", get_encrypted_record)
+    monkeypatch.setattr(doctor.db_service, "get_appointment", get_appointment)
+
+    response = await doctor.get_patient_record(str(uuid4()), Response(), doctor_id=None, if_none_match=None)
+
+    assert sorted(started) == ["appointment", "record"]
+    assert (response["intake_data"], response["lab_results"]) == _decrypt_serially(record)
+    assert response["status"] == "pending"
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from app.services.result_hub import ResultNotificationHub
+from app.services.shared_cache import SharedCache
+
+
+@pytest.mark.asyncio
+async def test_notify_wakes_all_waiters():
+    hub = ResultNotificationHub()
+    first = hub.subscribe("apt-1")
+    second = hub.subscribe("apt-1")
+    other = hub.subscribe("apt-2")
+
+    assert hub.waiter_count == 3
+    assert hub.notify("apt-1") == 2
+    assert await hub.wait(first, timeout=0.1)
+    assert await hub.wait(second, timeout=0.1)
+    assert not other.done()
+    assert hub.waiter_count == 1
+
+
+@pytest.mark.asyncio
+async def test_wait_times_out_and_unsubscribe_cleans_up():
+    hub = ResultNotificationHub()
+    future = hub.subscribe("apt-1")
+
+    assert not await hub.wait(future, timeout=0.01)
+    # Still registered after a timeout so SSE can keep waiting
+    assert hub.waiter_count == 1
+
+    hub.unsubscribe("apt-1", future)
+    assert hub.waiter_count == 0
+    assert hub.notify("apt-1") == 0
+
+
+@pytest.mark.asyncio
+async def test_waiter_woken_from_another_task():
+    hub = ResultNotificationHub()
+    future = hub.subscribe("apt-1")
+
+    asyncio.get_running_loop().call_later(0.01, hub.notify, "apt-1")
+    assert await hub.wait(future, timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_message_from_another_worker_wakes_local_waiters():
+    hub = ResultNotificationHub()
+    cache = SharedCache()
+    future = hub.subscribe("apt-2")
+    idle = hub.subscribe("apt-idle")
+    watcher = asyncio.create_task(hub.watch_shared(cache, interval=0.01))
+    try:
+        await asyncio.sleep(0.03)
+        # Idle waiters are not looked up in the cache on every tick
+        assert cache.stats["hits"] == cache.stats["misses"] == 0
+
+        cache.publish("apt-2")
+        assert await hub.wait(future, timeout=1)
+        assert not idle.done()
+    finally:
+        watcher.cancel()
+
+
+@pytest.mark.asyncio
+async def test_watcher_falls_back_to_markers_after_missing_messages():
+    hub = ResultNotificationHub()
+    cache = SharedCache(local_ring_entries=2)
+    future = hub.subscribe("apt-3")
+    watcher = asyncio.create_task(hub.watch_shared(cache, interval=0.05))
+    try:
+        await asyncio.sleep(0)
+        cache.set("result_ready", "apt-3", True, ttl=60)
+        for appointment_id in ("apt-3", "apt-4", "apt-5"):
+            cache.publish(appointment_id)
+        assert await hub.wait(future, timeout=1)
+    finally:
+        watcher.cancel()
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from app.services.shared_cache import SharedCache
+
+
+@pytest.fixture
+def segment():
+    segment = SharedCache.create_segment(f"qspa-test-{os.getpid()}", slots=64, slot_size=256)
+    yield segment
+    SharedCache.remove_segment(segment)
+
+
+def test_value_written_by_one_worker_is_read_by_another(segment):
+    writer, reader = SharedCache(), SharedCache()
+    writer.attach(segment.name)
+    reader.attach(segment.name)
+    try:
+        assert reader.get("doctor", "d1") is None
+        assert writer.set("doctor", "d1", "Dr. Rivera", ttl=60)
+        assert reader.get("doctor", "d1") == "Dr. Rivera"
+        # Same key in another namespace is a different entry
+        assert reader.get("result", "d1") is None
+
+        assert not writer.set("result", "big", "x" * 1024, ttl=60)
+        assert writer.stats["oversize"] == 1
+
+        writer.set("doctor", "d2", "Dr. Expired", ttl=-1)
+        assert reader.get("doctor", "d2") is None
+    finally:
+        writer.detach()
+        reader.detach()
+
+
+def test_published_messages_reach_other_workers_in_order():
+    segment = SharedCache.create_segment(f"qspa-ring-{os.getpid()}", slots=4, slot_size=128, ring_entries=4)
+    writer, reader = SharedCache(), SharedCache()
+    writer.attach(segment.name)
+    reader.attach(segment.name)
+    try:
+        position = reader.publish_position()
+        for message in ("a", "b", "c"):
+            assert writer.publish(message)
+        position, messages, lost = reader.published_since(position)
+        assert (messages, lost) == (["a", "b", "c"], False)
+        assert reader.published_since(position) == (position, [], False)
+
+        # Six more messages overflow a four-entry ring: the reader is told it lost some
+        for message in "defghi":
+            writer.publish(message)
+        _, messages, lost = reader.published_since(position)
+        assert messages == ["f", "g", "h", "i"] and lost
+        assert not writer.publish("x" * 100)
+    finally:
+        writer.detach()
+        reader.detach()
+        SharedCache.remove_segment(segment)
+
+
+def test_without_a_segment_the_cache_is_process_local():
+    cache = SharedCache(local_max_entries=2)
+    cache.set("doctor", "a", "A", ttl=60)
+    cache.set("doctor", "b", "B", ttl=60)
+    cache.set("doctor", "c", "C", ttl=60)
+    assert cache.get("doctor", "a") is None
+    assert cache.get("doctor", "c") == "C"
+    assert cache.info()["mode"] == "local"
@@ -0,0 +1,133 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.schemas import AIAnalysisResult, LabResults, PatientIntakeData
+from app.services import ai_service
+from app.services.structured_output import OutputTracker, response_schema_for
+
+
+ANALYSIS = {
+    "risk_score": 6.5,
+    "primary_concerns": ["Elevated HbA1c"],
+    "differential_diagnoses": ["Type 2 diabetes"],
+    "recommended_tests": ["Repeat HbA1c"],
+    "clinical_summary": "Likely type 2 diabetes.",
+    "treatment_recommendations": ["Metformin"],
+    "follow_up_timeline": "2 weeks",
+    "overall_health_status": "concerning",
+    "disease_probabilities": [
+        {"disease": "Type 2 Diabetes", "probability": "high", "confidence": "90%",
+         "key_indicators": ["HbA1c 8.2%"], "explanation": "HbA1c well above 6.5%."}
+    ],
+    "lifestyle_recommendations": ["Exercise"],
+    "urgent_actions_needed": [],
+    "patient_friendly_summary": "Your blood sugar is high.",
+}
+
+
+def _tracker():
+    return OutputTracker(
+        min_tokens=512, max_tokens=4096, percentile=99, headroom=1.5, window_size=50, floor_decay_responses=5
+    )
+
+
+def _response(text, finish_reason=1, output_tokens=400):
+    candidate = SimpleNamespace(
+        finish_reason=finish_reason,
+        content=SimpleNamespace(parts=[text] if text else []),
+        safety_ratings=[],
+    )
+    usage = SimpleNamespace(prompt_token_count=300, total_token_count=300 + output_tokens)
+    return SimpleNamespace(candidates=[candidate], text=text, usage_metadata=usage)
+
+
+def _patient():
+    intake = PatientIntakeData(
+        age=52, gender="female", chief_complaint="fatigue", symptoms="thirst", medical_history=[]
+    )
+    return intake, LabResults(hba1c=8.2)
+
+
+def test_schema_covers_extra_fields_and_excludes_bookkeeping():
+    schema = response_schema_for(AIAnalysisResult, exclude=("is_fallback", "analysis_source"))
+    properties = schema["properties"]
+    assert "disease_probabilities" in properties and "is_fallback" not in properties
+    assert properties["disease_probabilities"]["items"]["properties"]["disease"] == {"type": "string"}
+    assert properties["overall_health_status"]["nullable"] is True
+    assert set(schema["required"]) == set(properties)
+    # Nothing Gemini's Schema proto would reject
+    assert "$defs" not in json.dumps(schema) and "anyOf" not in json.dumps(schema)
+
+
+def test_token_limit_follows_observed_outputs_and_grows_on_truncation():
+    tracker = _tracker()
+    assert tracker.token_limit() == 512
+    for tokens in (900, 1000, 1100):
+        tracker.observe(tokens, truncated=False)
+    assert tracker.token_limit() == 1650
+
+    tracker.observe(None, truncated=True)
+    assert tracker.token_limit() == 3300
+    snapshot = tracker.snapshot()
+    assert snapshot["truncations"] == 1 and snapshot["truncation_rate"] == 0.25
+
+
+def test_raised_limit_comes_back_down_without_further_truncations():
+    tracker = _tracker()
+    for tokens in (900, 1000, 1100):
+        tracker.observe(tokens, truncated=False)
+    tracker.observe(None, truncated=True)
+    tracker.observe(None, truncated=True)
+    assert tracker.token_limit() == 4096
+
+    for _ in range(4):
+        tracker.observe(1000, truncated=False)
+    assert tracker.token_limit() == 4096
+    tracker.observe(1200, truncated=False)
+    assert tracker.token_limit() == 1800
+
+    # A later truncation raises it again from the current estimate
+    tracker.observe(None, truncated=True)
+    assert tracker.token_limit() == 3600
+
+
+@pytest.mark.asyncio
+async def test_structured_mode_validates_json_and_tracks_failures(monkeypatch):
+    responses = []
+    configs = []
+
+    class FakeModel:
+        def __init__(self, name):
+            pass
+
+        async def generate_content_async(self, prompt, generation_config, **kwargs):
+            configs.append(generation_config)
+            return responses.pop(0)
+
+    tracker = _tracker()
+    monkeypatch.setattr(ai_service.genai, "GenerativeModel", FakeModel)
+    monkeypatch.setattr(ai_service, "gemini_output", tracker)
+    monkeypatch.setattr(ai_service.settings, "AI_STRUCTURED_OUTPUT", True)
+    intake, labs = _patient()
+
+    responses.append(_response(json.dumps(ANALYSIS)))
+    result = await ai_service._gemini_analysis(intake, labs)
+    assert result.disease_probabilities[0].disease == "Type 2 Diabetes"
+    assert configs[0].response_mime_type == "application/json"
+    assert configs[0].max_output_tokens == 512
+
+    responses.append(_response('{"risk_score": 6.5, "primary_', finish_reason=ai_service.MAX_TOKENS))
+    with pytest.raises(ai_service.AIServiceError) as truncated:
+        await ai_service._gemini_analysis(intake, labs)
+    assert truncated.value.retryable
+
+    responses.append(_response(json.dumps({**ANALYSIS, "risk_score": 42})))
+    with pytest.raises(ai_service.AIServiceError):
+        await ai_service._gemini_analysis(intake, labs)
+
+    snapshot = tracker.snapshot()
+    assert snapshot["responses"] == 3
+    assert snapshot["truncations"] == 1 and snapshot["parse_failures"] == 1
+    assert snapshot["max_output_tokens"] > 512
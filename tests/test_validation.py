@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+from app.models.schemas import LabResults, PatientIntakeData, RawIntakeSubmission
+from app.services.crypto_mock import crypto_service
+from app.services.records import decrypt_patient_models
+
+
+def test_raw_submission_normalizes_list_fields_and_duration():
+    submission = RawIntakeSubmission.model_validate({
+        "age": "52",
+        "gender": "Female",
+        "chief_complaint": "  Fatigue ",
+        "symptoms": "Tired",
+        "duration": "2 weeks",
+        "medical_history": "Hypertension, Asthma, ",
+        "allergies": None,
+        "hba1c": "8.1",
+        "unrelated": "ignored",
+    })
+
+    intake = submission.intake_payload()
+    assert intake["age"] == 52
+    assert intake["chief_complaint"] == "Fatigue"
+    assert intake["symptom_duration"] == "2 weeks"
+    assert intake["medical_history"] == ["Hypertension", "Asthma"]
+    assert intake["allergies"] == []
+    assert submission.lab_payload()["hba1c"] == 8.1
+
+
+def test_raw_submission_rejects_bad_types():
+    with pytest.raises(ValidationError):
+        RawIntakeSubmission.model_validate({"age": "old", "gender": "F", "chief_complaint": "x", "symptoms": "y"})
+
+
+def test_stored_payloads_decode_straight_into_models():
+    submission = RawIntakeSubmission.model_validate({
+        "age": 40, "gender": "M", "chief_complaint": "Thirst", "symptoms": "Thirst", "hba1c": 7.5,
+    })
+    encrypted_intake, key = crypto_service.encrypt(submission.intake_payload())
+    encrypted_labs, _ = crypto_service.encrypt(submission.lab_payload())
+    blob, _ = crypto_service.encrypt({
+        "encrypted_intake": encrypted_intake,
+        "encrypted_lab_results": encrypted_labs,
+    })
+
+    intake, labs = asyncio.run(decrypt_patient_models({"encrypted_blob": blob, "wrapped_key": key}))
+    assert isinstance(intake, PatientIntakeData) and intake.chief_complaint == "Thirst"
+    assert isinstance(labs, LabResults) and labs.hba1c == 7.5
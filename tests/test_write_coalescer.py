@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import write_coalescer as coalescer_module
+from app.services.write_coalescer import WriteCoalescer
+
+
+class FakeTable:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def insert(self, payload):
+        rows = payload if isinstance(payload, list) else [payload]
+
+        def execute():
+            self.db.statements.append((self.name, len(rows)))
+            if any(row.get("bad") for row in rows):
+                raise RuntimeError("constraint violation")
+            self.db.rows.extend(rows)
+            return SimpleNamespace(data=[dict(row, committed=True) for row in rows])
+
+        return SimpleNamespace(execute=execute)
+
+
+class FakeDB:
+    def __init__(self):
+        self.statements = []
+        self.rows = []
+
+    def table(self, name):
+        return FakeTable(self, name)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(coalescer_module, "get_db", lambda: db)
+    return db
+
+
+@pytest.mark.asyncio
+async def test_concurrent_inserts_share_one_statement_per_table_and_columns(fake_db):
+    coalescer = WriteCoalescer(window_ms=20, max_rows=100)
+
+    results = await asyncio.gather(
+        *(coalescer.insert("appointments", {"id": i}) for i in range(10)),
+        *(coalescer.insert("appointments", {"id": i, "patient_id": "p"}) for i in range(10, 13)),
+        *(coalescer.insert("encrypted_records", {"id": i}) for i in range(5)),
+    )
+
+    assert all(result["committed"] for result in results)
+    assert [result["id"] for result in results[:10]] == list(range(10))
+    assert sorted(fake_db.statements) == [("appointments", 3), ("appointments", 10), ("encrypted_records", 5)]
+    snapshot = coalescer.snapshot()
+    assert snapshot["batches"] == 3 and snapshot["batch_size_max"] == 10
+    assert snapshot["flush_latency_p50_seconds"] is not None
+
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_without_waiting_for_the_window(fake_db):
+    coalescer = WriteCoalescer(window_ms=10_000, max_rows=4)
+    await asyncio.wait_for(
+        asyncio.gather(*(coalescer.insert("appointments", {"id": i}) for i in range(4))),
+        timeout=1.0,
+    )
+    assert fake_db.statements == [("appointments", 4)]
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_only_fails_the_bad_row(fake_db):
+    coalescer = WriteCoalescer(window_ms=5, max_rows=100)
+
+    results = await asyncio.gather(
+        *(coalescer.insert("appointments", {"id": i, "bad": i == 2}) for i in range(4)),
+        return_exceptions=True,
+    )
+
+    assert isinstance(results[2], RuntimeError)
+    assert [result["id"] for i, result in enumerate(results) if i != 2] == [0, 1, 3]
+    assert len(fake_db.rows) == 3
+    assert coalescer.snapshot()["row_failures"] == 1